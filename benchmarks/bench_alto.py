@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+"""
+CPU time and peak memory of reading the words of a large ALTO page: from a
+whole lxml tree built with etree.fromstring, from dictionaries built with
+xmltodict, and with alto.parse_alto, which frees each line once read.
+
+Each approach runs in a fresh process. tracemalloc only sees Python
+allocations, so the growth of the peak resident set size is reported too:
+it also counts the memory of the lxml tree, allocated in C.
+
+Usage: python benchmarks/bench_alto.py [--words WORDS]
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from lxml import etree
+from xmltodict import parse as parsexmltodict
+from gallipy.alto import parse_alto
+
+def alto(nwords, per_line=10, per_block=20):
+    """A synthetic ALTO page with nwords words."""
+    word = '<String ID="S{0}" CONTENT="mot{0}" HPOS="{1}" VPOS="{2}" WIDTH="80" HEIGHT="30" ' \
+           'WC="0.95"/><SP WIDTH="10" HPOS="{3}" VPOS="{2}"/>'
+    parts = []
+    for i in range(nwords):
+        line, column = divmod(i, per_line)
+        if column == 0:
+            if line % per_block == 0:
+                if line:
+                    parts.append("</TextBlock>")
+                parts.append('<TextBlock ID="TB{}">'.format(line // per_block))
+            parts.append('<TextLine ID="TL{}">'.format(line))
+        parts.append(word.format(i, column * 90, line * 40, column * 90 + 80))
+        if column == per_line - 1 or i == nwords - 1:
+            parts.append("</TextLine>")
+    parts.append("</TextBlock>")
+    doc = '<?xml version="1.0" encoding="UTF-8"?><alto xmlns="http://bibnum.bnf.fr/ns/alto_prod">' \
+          '<Layout><Page WIDTH="5000" HEIGHT="7000"><PrintSpace>{}</PrintSpace></Page></Layout>' \
+          '</alto>'.format("".join(parts))
+    return doc.encode("utf-8")
+
+def dom_columns(data):
+    """The word columns of parse_alto, read from a whole lxml tree."""
+    columns = ([], [], [], [], [], [])
+    for string in etree.fromstring(data).iter('{*}String'):
+        attrib = string.attrib
+        columns[0].append(attrib.get('CONTENT', ''))
+        for column, name in zip(columns[1:], ('HPOS', 'VPOS', 'WIDTH', 'HEIGHT', 'WC')):
+            column.append(float(attrib.get(name, 'nan')))
+    return columns
+
+APPROACHES = [
+    ("lxml DOM (etree.fromstring)", dom_columns),
+    ("xmltodict", parsexmltodict),
+    ("parse_alto (columns)", lambda d: parse_alto(d).value),
+]
+
+def max_rss():
+    """The peak resident set size of this process, in bytes.
+
+    On Linux, ru_maxrss survives exec and so starts at the peak of the parent
+    process: the high-water mark of /proc/self/status is read instead.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def measure(index, path, results):
+    """Time APPROACHES[index] on the document at path, in this process.
+
+    Puts (time, traced peak, peak RSS growth) in results. The RSS is
+    measured on the first, untraced run, so that tracemalloc does not add
+    its own memory.
+    """
+    func = APPROACHES[index][1]
+    with open(path, "rb") as document:
+        data = document.read()
+    before = max_rss()
+    started = time.perf_counter()
+    func(data)
+    elapsed = time.perf_counter() - started
+    rss = max_rss() - before
+    tracemalloc.start()
+    func(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results.put((elapsed, peak, rss))
+
+def bench(index, path):
+    """Print the time, traced peak and RSS growth of an approach, run in a fresh process."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=measure, args=(index, path, results))
+    process.start()
+    elapsed, peak, rss = results.get()
+    process.join()
+    print("{:<28} {:>8.1f} ms {:>8.1f} MiB traced {:>8.1f} MiB RSS".format(
+        APPROACHES[index][0], elapsed * 1e3, peak / 2**20, rss / 2**20))
+    return elapsed, peak, rss
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--words", type=int, default=100000)
+    data = alto(parser.parse_args().words)
+    print("document: {:.1f} MiB".format(len(data) / 2**20))
+    with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as document:
+        document.write(data)
+    try:
+        dom, xmltodict, columns = (bench(i, document.name) for i in range(len(APPROACHES)))
+    finally:
+        os.remove(document.name)
+    for label, baseline in (("the lxml DOM", dom), ("xmltodict", xmltodict)):
+        print("{:.1f}x faster, {:.1f}x less RSS than {}".format(
+            baseline[0] / columns[0], baseline[2] / max(columns[2], 2**20), label))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+"""
+Microbenchmark of Ark.parse: compares the regex fast path and the cached
+LALR parser with the former behaviour, which compiled a new Earley parser
+for every call.
+
+Usage: python benchmarks/bench_ark.py [-n NUMBER]
+"""
+
+import argparse
+import timeit
+import rfc3987
+from lark import Lark
+from gallipy.ark import Ark, ArkIdTransformer, _GRAMMAR
+
+SAMPLES = [
+    'ark:/12148/bpt6k5619759j',
+    'ark:/12148/bpt6k5619759j/f1n10.pdf',
+    'https://gallica.bnf.fr/ark:/12148/cb32798952c/date',
+    'https://gallica.bnf.fr/ark:/12148/bpt6k5619759j/f1n10.pdf?query=test',
+]
+
+def parse_uncached(ark_str):
+    """Ark.parse as it was before the parser was cached."""
+    parts = rfc3987.parse(ark_str, rule="URI")
+    parser = Lark(_GRAMMAR, start='arkid')
+    arkid_str = ark_str if parts["scheme"] == "ark" else parts["path"].lstrip("/")
+    ark_parts = ArkIdTransformer().transform(parser.parse(arkid_str))
+    ark_parts.update(parts)
+    return Ark(**ark_parts)
+
+def bench(label, func, number):
+    """Time func over SAMPLES and print the cost of one parse."""
+    elapsed = timeit.timeit(lambda: [func(s) for s in SAMPLES], number=number)
+    per_call = elapsed / (number * len(SAMPLES))
+    print("{:<28} {:>10.2f} us/ark".format(label, per_call * 1e6))
+    return per_call
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=200)
+    number = parser.parse_args().number
+
+    before = bench("uncached Earley parser", parse_uncached, max(1, number // 20))
+    slow = bench("cached LALR parser", Ark._parse_slow, number)
+    fast = bench("Ark.parse (fast path)", Ark.parse, number)
+    bench("Ark.parse_many", lambda s: list(Ark.parse_many([s])), number)
+    print("speedup: {:.0f}x (LALR), {:.0f}x (fast path)".format(before / slow, before / fast))
+
+if __name__ == "__main__":
+    main()
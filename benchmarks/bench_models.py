@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+"""
+Memory held and CPU time of many Pagination documents kept in memory, as
+the dictionaries of helpers.parse_xml and as the models.Pagination of
+models.parse_pagination, and the time to walk them once parsed.
+
+Usage: python benchmarks/bench_models.py [--documents DOCUMENTS] [--pages PAGES]
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from gallipy.helpers import parse_xml
+from gallipy.models import parse_pagination
+from bench_xml import pagination
+
+def bench(label, parse, walk, documents):
+    """Print the time to parse documents, the memory held by the results,
+    measured in a second, traced, run, and the time to walk them."""
+    started = time.perf_counter()
+    parsed = [parse(document).value for document in documents]
+    elapsed = time.perf_counter() - started
+    del parsed
+    gc.collect()
+    tracemalloc.start()
+    parsed = [parse(document).value for document in documents]
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    started = time.perf_counter()
+    total = sum(walk(result) for result in parsed)
+    walked = time.perf_counter() - started
+    print("{:<24} parse {:>8.1f} ms  walk {:>7.1f} ms  {:>8.1f} MiB held".format(
+        label, elapsed * 1e3, walked * 1e3, held / 2**20))
+    return elapsed, walked, held, total
+
+def walk_dict(result):
+    pages = result['livre']['pages']['page']
+    return sum(int(page['image_width']) for page in pages)
+
+def walk_model(result):
+    return sum(page.width for page in result.pages)
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, default=1000)
+    parser.add_argument("--pages", type=int, default=200)
+    args = parser.parse_args()
+    documents = [pagination(args.pages) for _ in range(args.documents)]
+    before = bench("parse_xml (dicts)", parse_xml, walk_dict, documents)
+    after = bench("parse_pagination (model)", parse_pagination, walk_model, documents)
+    assert before[3] == after[3]
+    print("{:.1f}x faster to parse, {:.1f}x faster to walk, {:.1f}x less memory held".format(
+        before[0] / after[0], before[1] / after[1], before[2] / after[2]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""
+Per-request latency of urllib.request.urlopen, which opens a new connection
+for every call, against a pooled keep-alive Transport. Both run against a
+local HTTP/1.1 stand-in for gallica.bnf.fr. The latency saved on the real
+service is larger, as every new HTTPS connection also costs a TLS handshake.
+
+Usage: python benchmarks/bench_transport.py [-n NUMBER] [--delay SECONDS]
+"""
+
+import argparse
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from gallipy.transport import Transport
+
+BODY = b"<?xml version='1.0'?><livre>" + b"x" * 2048 + b"</livre>"
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers every GET with BODY, after an optional connection setup delay."""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    delay = 0
+
+    def setup(self):
+        time.sleep(self.delay)  # Simulates the cost of a new connection
+        super().setup()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+def bench(label, get, url, number):
+    """Time number sequential GET and print the cost of one request."""
+    started = time.perf_counter()
+    for _ in range(number):
+        get(url)
+    per_call = (time.perf_counter() - started) / number
+    print("{:<22} {:>8.3f} ms/request".format(label, per_call * 1e3))
+    return per_call
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=500)
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="Simulated connection setup latency, in seconds.")
+    args = parser.parse_args()
+    Handler.delay = args.delay
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{}/services/Pagination".format(httpd.server_address[1])
+
+    def urlopen(url):
+        with urllib.request.urlopen(url, timeout=30) as res:
+            return res.read()
+
+    before = bench("urllib.request.urlopen", urlopen, url, args.number)
+    with Transport() as transport:
+        after = bench("pooled Transport", transport.get, url, args.number)
+    print("saved: {:.3f} ms/request ({:.1f}x)".format((before - after) * 1e3, before / after))
+    httpd.shutdown()
+
+if __name__ == "__main__":
+    main()
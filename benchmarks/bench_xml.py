@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+"""
+CPU time and peak memory of parsing a large Pagination document, with the
+former BeautifulSoup -> str -> xmltodict path and with helpers.parse_xml,
+which parses the raw bytes once.
+
+Usage: python benchmarks/bench_xml.py [--pages PAGES]
+"""
+
+import argparse
+import time
+import tracemalloc
+from bs4 import BeautifulSoup
+from xmltodict import parse as parsexmltodict
+from gallipy.helpers import parse_xml
+
+def pagination(npages):
+    """A synthetic Pagination document with npages pages."""
+    page = "<page><numero>{0}</numero><ordre>{0}</ordre><pagination_type>A</pagination_type>" \
+           "<image_width>2400</image_width><image_height>3600</image_height></page>"
+    pages = "".join(page.format(i) for i in range(1, npages + 1))
+    doc = "<?xml version='1.0' encoding='UTF-8'?><livre><structure><nbVueImages>{}" \
+          "</nbVueImages></structure><pages>{}</pages></livre>".format(npages, pages)
+    return doc.encode("utf-8")
+
+def bench(label, func, data):
+    """Print the time and the peak memory allocated by func(data)."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    func(data)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("{:<28} {:>8.1f} ms {:>8.1f} MiB peak".format(label, elapsed * 1e3, peak / 2**20))
+    return elapsed, peak
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=5000)
+    data = pagination(parser.parse_args().pages)
+    print("document: {:.1f} MiB".format(len(data) / 2**20))
+    before = bench("BeautifulSoup + xmltodict", lambda d: parsexmltodict(str(BeautifulSoup(d, "xml"))), data)
+    after = bench("parse_xml (single pass)", parse_xml, data)
+    print("{:.1f}x faster, {:.1f}x less peak memory".format(before[0] / after[0], before[1] / after[1]))
+
+if __name__ == "__main__":
+    main()
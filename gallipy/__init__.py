@@ -19,3 +19,4 @@ https://github.com/GeoHistoricalData/gallipy
 """
 from .resource import Resource
 from .ark import Ark
+from .asyncresource import AsyncResource
@@ -0,0 +1,173 @@
+"""
+Gallipy - Python wrapper for the Gallica APIs
+Copyright (C) 2019  Bertrand Dumenieu
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+https://github.com/GeoHistoricalData/gallipy
+"""
+import io
+import math
+from array import array
+from lxml import etree
+from .monadic import Either, Left
+from .payload import Payload
+
+try:
+    import numpy
+except ImportError:  # Optional, bounding box queries are then done in Python
+    numpy = None
+
+__all__ = ['AltoPage', 'parse_alto']
+
+# Elements freed once read by parse_alto
+_DISPOSABLE = frozenset(('TextLine', 'TextBlock', 'Illustration', 'GraphicalElement',
+                         'ComposedBlock', 'Description', 'Styles', 'Tags'))
+
+
+class AltoPage:
+    """The words of an ALTO page, stored column by column.
+
+    Word i is words[i], its bounding box is (hpos[i], vpos[i], widths[i],
+    heights[i]) and its confidence conf[i], NaN if the OCR gave none. It
+    belongs to the line line[i] and to the block block[i], indices in
+    line_ids and block_ids. Numeric columns are array.array objects: a few
+    bytes per word instead of a tree of Python objects.
+
+    Attributes:
+        width (float): Width of the page, in unit.
+        height (float): Height of the page, in unit.
+        unit (str): The ALTO MeasurementUnit, e.g. 'pixel' or 'mm10'.
+    """
+
+    __slots__ = ('width', 'height', 'unit', 'words', 'hpos', 'vpos', 'widths', 'heights',
+                 'conf', 'line', 'block', 'line_ids', 'block_ids')
+
+    def __init__(self):
+        self.width = self.height = math.nan
+        self.unit = 'pixel'
+        self.words = []
+        self.hpos, self.vpos = array('f'), array('f')
+        self.widths, self.heights = array('f'), array('f')
+        self.conf = array('f')
+        self.line, self.block = array('I'), array('I')
+        self.line_ids, self.block_ids = [], []
+
+    def __len__(self):
+        return len(self.words)
+
+    def box(self, i):
+        """The bounding box (hpos, vpos, width, height) of word i."""
+        return (self.hpos[i], self.vpos[i], self.widths[i], self.heights[i])
+
+    def select(self, hpos, vpos, width, height, contained=False):
+        """The words whose bounding box intersects a region.
+
+        The query is vectorised with numpy if it is installed.
+
+        Args:
+            hpos, vpos, width, height (float): The region, in self.unit.
+            contained (:obj:bool, optional): Only select the words entirely
+                inside the region. Defaults to False.
+
+        Returns:
+            list: The indices of the selected words, in reading order.
+        """
+        right, bottom = hpos + width, vpos + height
+        if numpy is not None:
+            x0, y0 = numpy.frombuffer(self.hpos, 'f'), numpy.frombuffer(self.vpos, 'f')
+            x1, y1 = x0 + numpy.frombuffer(self.widths, 'f'), y0 + numpy.frombuffer(self.heights, 'f')
+            if contained:
+                mask = (x0 >= hpos) & (y0 >= vpos) & (x1 <= right) & (y1 <= bottom)
+            else:
+                mask = (x0 < right) & (x1 > hpos) & (y0 < bottom) & (y1 > vpos)
+            return numpy.flatnonzero(mask).tolist()
+        boxes = zip(self.hpos, self.vpos, self.widths, self.heights)
+        if contained:
+            return [i for i, (x, y, w, h) in enumerate(boxes)
+                    if x >= hpos and y >= vpos and x + w <= right and y + h <= bottom]
+        return [i for i, (x, y, w, h) in enumerate(boxes)
+                if x < right and x + w > hpos and y < bottom and y + h > vpos]
+
+    def text(self, indices=None):
+        """The text of the words of indices, all by default, one line per ALTO line."""
+        indices = range(len(self.words)) if indices is None else indices
+        lines, current, last = [], [], None
+        for i in indices:
+            if self.line[i] != last and current:
+                lines.append(" ".join(current))
+                current = []
+            current.append(self.words[i])
+            last = self.line[i]
+        if current:
+            lines.append(" ".join(current))
+        return "\n".join(lines)
+
+
+def parse_alto_payload(payload):
+    """Parses an ALTO Payload into an AltoPage, then closes the payload."""
+    with payload:
+        return parse_alto(payload)
+
+def parse_alto(source):
+    """Parses an ALTO document incrementally into an AltoPage.
+
+    Elements are discarded as soon as they have been read, so that memory use
+    does not grow with the size of the document beyond the AltoPage itself.
+    Every version of the ALTO schema is accepted, with or without namespace.
+
+    Args:
+        source (bytes, Payload, str or file-like): The ALTO document, as
+            returned by Resource.ocr_data_sync, or a path, or a binary file.
+
+    Returns:
+        Either[Exception AltoPage]: The words of the page, or an Exception.
+    """
+    if isinstance(source, Payload):
+        source = source.open()
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    page = AltoPage()
+    try:
+        for event, elem in etree.iterparse(source, events=('start', 'end')):
+            tag = elem.tag.rpartition('}')[2] if isinstance(elem.tag, str) else ''
+            if event == 'start':
+                if tag == 'String':
+                    attrib = elem.attrib
+                    page.words.append(attrib.get('CONTENT', ''))
+                    page.hpos.append(float(attrib.get('HPOS', 0)))
+                    page.vpos.append(float(attrib.get('VPOS', 0)))
+                    page.widths.append(float(attrib.get('WIDTH', 0)))
+                    page.heights.append(float(attrib.get('HEIGHT', 0)))
+                    page.conf.append(float(attrib.get('WC', 'nan')))
+                    page.line.append(max(0, len(page.line_ids) - 1))
+                    page.block.append(max(0, len(page.block_ids) - 1))
+                elif tag == 'TextLine':
+                    page.line_ids.append(elem.get('ID', ''))
+                elif tag == 'TextBlock':
+                    page.block_ids.append(elem.get('ID', ''))
+                elif tag == 'Page':
+                    page.width = float(elem.get('WIDTH', 'nan'))
+                    page.height = float(elem.get('HEIGHT', 'nan'))
+            elif tag == 'MeasurementUnit':
+                page.unit = (elem.text or page.unit).strip()
+            elif tag in _DISPOSABLE:
+                # Free the subtree read so far, and the siblings before it
+                elem.clear()
+                parent = elem.getparent()
+                while parent is not None and elem.getprevious() is not None:
+                    del parent[0]
+        return Either.pure(page)
+    except Exception as ex:
+        return Left(ex)
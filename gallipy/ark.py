@@ -17,6 +17,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 https://github.com/GeoHistoricalData/gallipy
 """
+import re
 import rfc3987
 from lark import Transformer, Lark
 from lark.exceptions import ParseError, UnexpectedCharacters
@@ -38,6 +39,26 @@ _GRAMMAR = """
 
 _ARKID_SCHEME = "ark"
 
+# The grammar is compiled once per process. LALR with the contextual lexer is
+# much faster than the default Earley parser and is enough for this grammar.
+_PARSER = Lark(_GRAMMAR, start='arkid', parser='lalr')
+
+# Fast path for the most common shapes, ark:/naan/name[/qualifier] and
+# http(s)://authority/ark:/naan/name[/qualifier][?query][#fragment].
+# Character classes are a subset of what both rfc3987 and _GRAMMAR accept, so
+# any string matched here would have been accepted by the slow path with the
+# same parts. Anything else (percent-encoding, non-ASCII, uppercase schemes...)
+# falls back to rfc3987 + Lark.
+_SAFE = r"[A-Za-z0-9\-._~!$&'()*+,;=]+"
+_QUERY = r"[A-Za-z0-9\-._~!$&'()*+,;=:@/?]*"
+_FAST_ARKID = (r"ark:/(?P<naan>{0})/(?P<name>{0})(?:/(?P<qualifier>{0}))?"
+               .format(_SAFE))
+_FAST_ARKID_RE = re.compile("^" + _FAST_ARKID + "$")
+_FAST_ARKURL_RE = re.compile(
+    r"^(?P<scheme>https?)://(?P<authority>[A-Za-z0-9.\-]+(?::[0-9]*)?)/"
+    + _FAST_ARKID
+    + r"(?:\?{0})?(?:#{0})?$".format(_QUERY))
+
 
 class Ark:
     """Object representation of an Archival Resource Key.
@@ -193,14 +214,48 @@ class Ark:
             ark_str (str): The string to parse.
 
         Returns:
-            Ark: The parsed ARK.
+            Either[ArkParsingError Ark]: A Right object holding the parsed
+                ARK, or a Left object holding an ArkParsingError if parsing
+                failed.
+        """
+        try:
+            match = (_FAST_ARKID_RE.match(ark_str)
+                     or _FAST_ARKURL_RE.match(ark_str))
+        except TypeError as ex:
+            return Left(ArkParsingError(str(ex), ark_str))
+        if match:
+            return Either.pure(Ark(**match.groupdict()))
+        return Ark._parse_slow(ark_str)
+
+    @staticmethod
+    def parse_many(ark_strs):
+        """Parse many ARK URLs or ARK ID strings.
+
+        A generator version of Ark.parse, meant for bulk validation of
+        large lists of ARKs. A failure does not stop the iteration.
+
+        Args:
+            ark_strs (iterable): The strings to parse.
 
-        Raises:
-            ArkParsingError: If parsing fails.
+        Yields:
+            Either[ArkParsingError Ark]: The result of Ark.parse for each
+                string, in input order.
+        """
+        for ark_str in ark_strs:
+            yield Ark.parse(ark_str)
+
+    @staticmethod
+    def _parse_slow(ark_str):
+        """Parse an ARK with rfc3987 and the Lark grammar.
+
+        Args:
+            ark_str (str): The string to parse.
+
+        Returns:
+            Either[ArkParsingError Ark]: See Ark.parse.
         """
         try:
             parts = rfc3987.parse(ark_str, rule="URI")  # Ensure ark is a URI
-            parser = Lark(_GRAMMAR, start='arkid')
 
             # Extract an ARK ID from ark_str if ark_str is a full ARK URL.
             if parts["scheme"] != _ARKID_SCHEME:
@@ -211,7 +266,7 @@ class Ark:
             else:
                 arkid_str = ark_str
 
-            tree = parser.parse(arkid_str)
+            tree = _PARSER.parse(arkid_str)
             ark_parts = ArkIdTransformer().transform(tree)
             ark_parts.update(parts)
             ark = Ark(**ark_parts)
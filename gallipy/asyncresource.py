@@ -0,0 +1,224 @@
+"""
+Gallipy - Python wrapper for the Gallica APIs
+Copyright (C) 2019  Bertrand Dumenieu
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+https://github.com/GeoHistoricalData/gallipy
+"""
+import asyncio
+import collections
+from . import helpers as h
+from .monadic import Left, Right
+from .resource import Resource, _nviews_from_pagination, _image_size, _search_items, _search_starts
+from .transport import default_async_transport
+from . import models
+
+__all__ = ['AsyncResource']
+
+
+class AsyncResource:
+    """Asyncio entry point to the Document and IIIF APIs.
+
+    AsyncResource mirrors the synchronous methods of Resource, with the same
+    arguments and the same Either results, but its methods are coroutines
+    performing non-blocking I/O through an AsyncTransport. Many requests can
+    be in flight at once without a thread per request.
+
+    Example:
+        >>> resource = AsyncResource('ark:/12148/bpt6k5738219s')
+        >>> either = await resource.pagination()
+
+    Args:
+        ark (str or Ark): The ARK of  this resource.
+        transport (:obj:AsyncTransport, optional): The pool of connections used
+            to query Gallica. Defaults to an AsyncTransport shared by all
+            resources of the running event loop.
+        max_concurrency (:obj:int, optional): If set, at most max_concurrency
+            requests of this resource are in flight at the same time. The
+            transport has its own, global, limit.
+        cache (:obj:Cache, optional): A persistent cache of metadata responses.
+            See gallipy.cache.Cache.
+        memo (:obj:Memo, optional): The in-memory memo of derived metadata.
+            See Resource.
+
+    Attributes:
+        ark (Ark): The ark object of this resource.
+
+    Raises:
+        ValueError: If ark is neither a string or an Ark object, or if the
+          parsing failed.
+    """
+
+    def __init__(self, ark, transport=None, max_concurrency=None, cache=None, memo=None):
+        self._resource = Resource(ark, cache=cache, memo=memo)
+        self._transport = transport
+        self._max_concurrency = max_concurrency
+        self._semaphore = None  # Created in the running loop, see _fetch
+
+    @property
+    def ark(self):
+        return self._resource.ark
+
+    @property
+    def arkid(self):
+        return self._resource.arkid
+
+    @property
+    def transport(self):
+        return self._transport or default_async_transport()
+
+    @property
+    def cache(self):
+        return self._resource.cache
+
+    @property
+    def memo(self):
+        return self._resource.memo
+
+    def invalidate_memo(self):
+        """Forgets the memoized metadata of this resource's document."""
+        self._resource.invalidate_memo()
+
+    async def oairecord(self, typed=False):
+        """Retrieves the OAI record of a document. See Resource.oairecord_sync."""
+        try:
+            if typed:
+                either = await self._fetch(h.fetch_async, "OAIRecord", self._resource._oairecord_url())
+                return either.flat_map(models.parse_oairecord)
+            return await self._fetch(h.fetch_xml_async, "OAIRecord", self._resource._oairecord_url())
+        except Exception as ex:
+            return Left(ex)
+
+    async def issues(self, year='', typed=False):
+        """Fetches metadata about the issues of a periodical journal.
+
+        See Resource.issues_sync.
+        """
+        try:
+            if typed:
+                either = await self._fetch(h.fetch_async, "Issues", self._resource._issues_url(year))
+                return either.flat_map(models.parse_issues)
+            return await self._fetch(h.fetch_xml_async, "Issues", self._resource._issues_url(year))
+        except Exception as ex:
+            return Left(ex)
+
+    async def pagination(self, typed=False):
+        """Fetches paging metadata of a resource. See Resource.pagination_sync."""
+        if typed:
+            either = await self._fetch(h.fetch_async, "Pagination", self._resource._pagination_url())
+            return either.flat_map(models.parse_pagination)
+        return await self._fetch(h.fetch_xml_async, "Pagination", self._resource._pagination_url())
+
+    async def image_preview(self, resolution='thumbnail', view=1):
+        """Retrieves the preview image of a view. See Resource.image_preview_sync."""
+        url = self._resource._image_preview_url(resolution, view)
+        return await self._fetch(h.fetch_async, "preview", url)
+
+    async def fulltext_search(self, query, view=1, results_per_set=10):
+        """Performs a full-text search. See Resource.fulltext_search_sync."""
+        url = self._resource._fulltext_search_url(query, view, results_per_set)
+        return await self._fetch(h.fetch_xml_async, "ContentSearch", url)
+
+    async def fulltext_search_iter(self, query, view=None, prefetch=4):
+        """Iterates asynchronously over every hit of a full-text search.
+
+        See Resource.fulltext_search_iter. The result sets fetched ahead are
+        cancelled once the caller stops iterating.
+        """
+        results = await self.fulltext_search(query, view, 1)
+        if results.is_left:
+            raise results.value
+        starts = _search_starts(results.value)
+        pending = collections.deque()
+        items = _search_items(results.value)
+        try:
+            while items:
+                for start in starts:
+                    pending.append(asyncio.ensure_future(self.fulltext_search(query, view, start)))
+                    if len(pending) >= max(prefetch, 1):
+                        break
+                for item in items:
+                    yield item
+                if not pending:
+                    return
+                results = await pending.popleft()
+                if results.is_left:
+                    raise results.value
+                items = _search_items(results.value)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def toc(self):
+        """Retrieves the table of content. See Resource.toc_sync."""
+        return await self._fetch(h.fetch_xml_html_async, "Toc", self._resource._toc_url(), 'html.parser')
+
+    async def content(self, startview=1, nviews=None, mode='pdf'):
+        """Retrieves the content of a document. See Resource.content_sync."""
+        _nviews = 1
+        if not nviews:
+            either = await self._memoized('nviews', self.pagination, _nviews_from_pagination)
+            if not either.is_left:
+                _nviews = either.value-startview+1
+        else:
+            _nviews = nviews
+        url = self._resource._content_url(startview, _nviews, mode)
+        if mode == 'pdf':
+            return await self._fetch(h.fetch_async, "content", url)
+        return await self._fetch(h.fetch_xml_html_async, "content", url, 'html.parser')
+
+    async def ocr_data(self, view):
+        """Retrieves the OCR data of a view. See Resource.ocr_data_sync."""
+        return await self._fetch(h.fetch_async, "ALTO", self._resource._ocr_data_url(view))
+
+    async def iiif_info(self, view=1, typed=False):
+        """Retrieve IIIF metadata of a resource. See Resource.iiif_info_sync."""
+        service = "info" if view else "manifest"
+        if typed:
+            parse = models.parse_image_info if view else models.parse_manifest
+            either = await self._fetch(h.fetch_async, service, self._resource._iiif_info_url(view))
+            return either.flat_map(parse)
+        either = await self._fetch(h.fetch_json_async, service, self._resource._iiif_info_url(view))
+        return either.map(dict)
+
+    async def iiif_data(self, view=1, region=None, size='full', rotation=0, quality='native', imformat='png'):
+        """Retrieve image data using the IIIF API. See Resource.iiif_data_sync."""
+        if not region:
+            info = await self._memoized(('size', view), lambda: self.iiif_info(view), _image_size)
+            region = (0, 0) + ((1, 1) if info.is_left else info.value)
+        url = self._resource._iiif_data_url(view, region, size, rotation, quality, imformat)
+        return await self._fetch(h.fetch_async, "iiif", url)
+
+    async def _memoized(self, name, fetch, derive):
+        """Looks up name in the memo of this resource's document, or derives
+        it from the result of the coroutine function fetch."""
+        key = (str(self.ark.root), name)
+        option = self.memo.get(key)
+        if option.defined:
+            return Right(option.value)
+        either = (await fetch()).map(derive)
+        if not either.is_left:
+            self.memo.put(key, either.value)
+        return either
+
+    async def _fetch(self, fetcher, service, url, *args):
+        """Calls fetcher, within the concurrency limit of this resource."""
+        kwargs = {"transport": self._transport, "cache": self.cache, "service": service}
+        if not self._max_concurrency:
+            return await fetcher(url, *args, **kwargs)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        async with self._semaphore:
+            return await fetcher(url, *args, **kwargs)
@@ -0,0 +1,177 @@
+"""
+Gallipy - Python wrapper for the Gallica APIs
+Copyright (C) 2019  Bertrand Dumenieu
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+https://github.com/GeoHistoricalData/gallipy
+"""
+import asyncio
+import socket
+import threading
+import time
+from .harvest import document_nviews
+
+__all__ = ['AdaptiveBlockSize', 'adaptive_blocks', 'content_blocks']
+
+
+class AdaptiveBlockSize:
+    """The number of views to request per block, adapted to Gallica's current pace.
+
+    The size grows while blocks are downloaded in less than half the target
+    duration, and is cut down to what fits in the target duration when a
+    block is slower. After an error it is halved, and after a timeout it is
+    divided by four. It always stays between minimum and maximum.
+
+    An AdaptiveBlockSize is thread-safe, so concurrent downloads can share it.
+
+    Args:
+        initial (:obj:int, optional): The first block size. Default: 100
+        minimum (:obj:int, optional): The smallest block size. Default: 10
+        maximum (:obj:int, optional): The largest block size. Default: 1000
+        target (:obj:float, optional): The target duration of a block in
+            seconds. Default: 30
+        growth (:obj:float, optional): Factor applied to the size after a
+            fast block. Default: 1.5
+    """
+
+    def __init__(self, initial=100, minimum=10, maximum=1000, target=30.0, growth=1.5):
+        if not 1 <= minimum <= maximum:
+            raise ValueError("Expected 1 <= minimum <= maximum, got {} and {}".format(
+                minimum, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+        self.growth = growth
+        self._size = self._clamp(initial)
+        self._lock = threading.Lock()
+        self._stats = {"blocks": 0, "views": 0, "seconds": 0.0, "errors": 0, "timeouts": 0}
+
+    @property
+    def size(self):
+        """The number of views of the next block."""
+        return self._size
+
+    @property
+    def stats(self):
+        """Blocks, views and seconds of the successful blocks, number of
+        errors and timeouts, and throughput in views per second."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["throughput"] = stats["views"] / stats["seconds"] if stats["seconds"] else 0.0
+        return stats
+
+    def success(self, nviews, seconds):
+        """Records a block of nviews views downloaded in seconds.
+
+        Returns:
+            int: The new block size.
+        """
+        with self._lock:
+            self._stats["blocks"] += 1
+            self._stats["views"] += nviews
+            self._stats["seconds"] += seconds
+            if seconds <= self.target / 2:
+                size = max(self._size + 1, int(self._size * self.growth))
+            elif seconds > self.target:
+                size = int(nviews * self.target / seconds)
+            else:
+                size = self._size
+            self._size = self._clamp(size)
+            return self._size
+
+    def failure(self, error=None):
+        """Records a block that could not be downloaded because of error.
+
+        Returns:
+            int: The new block size.
+        """
+        timeout = _is_timeout(error)
+        with self._lock:
+            self._stats["timeouts" if timeout else "errors"] += 1
+            self._size = self._clamp(self._size // (4 if timeout else 2))
+            return self._size
+
+    def _clamp(self, size):
+        return max(self.minimum, min(size, self.maximum))
+
+
+def _is_timeout(error):
+    """True if error is, or reports, a timeout."""
+    if isinstance(error, (socket.timeout, asyncio.TimeoutError)):
+        return True
+    return error is not None and "timed out" in str(error)
+
+def adaptive_blocks(fetch, start, end, sizer=None, trials=3, clock=time.monotonic):
+    """Downloads the views start to end in blocks sized by an AdaptiveBlockSize.
+
+    Blocks are downloaded one after the other. A failed block is retried
+    from the same view with the size reduced by the failure. After trials
+    consecutive failures from the same view, the last failure is yielded
+    and the iteration stops.
+
+    Args:
+        fetch (callable): fetch(startview, nviews) returns an Either.
+        start (int): The first view.
+        end (int): The last view, included.
+        sizer (:obj:AdaptiveBlockSize, optional): Defaults to a new
+            AdaptiveBlockSize().
+        trials (:obj:int, optional): Number of attempts per block. Default: 3
+        clock (:obj:callable, optional): Monotonic clock in seconds.
+
+    Yields:
+        tuple: (startview, nviews, Either) for each block.
+    """
+    sizer = sizer or AdaptiveBlockSize()
+    attempts = 0
+    while start <= end:
+        nviews = min(sizer.size, end - start + 1)
+        began = clock()
+        either = fetch(start, nviews)
+        if either.is_left:
+            sizer.failure(either.value)
+            attempts += 1
+            if attempts >= trials:
+                yield start, nviews, either
+                return
+            continue
+        sizer.success(nviews, clock() - began)
+        attempts = 0
+        yield start, nviews, either
+        start += nviews
+
+def content_blocks(resource, start=1, end=None, sizer=None, mode='pdf', trials=3):
+    """Downloads the content of a document in adaptive blocks with content_sync.
+
+    Args:
+        resource (Resource): The document.
+        start (:obj:int, optional): The first view. Default: 1
+        end (:obj:int, optional): The last view. Defaults to the last view
+            of the document, see harvest.document_nviews.
+        sizer (:obj:AdaptiveBlockSize, optional): See adaptive_blocks.
+        mode (:obj:str, optional): One of {'pdf, 'texteBrut'}. Default: 'pdf'
+        trials (:obj:int, optional): See adaptive_blocks.
+
+    Yields:
+        tuple: (startview, nviews, Either) for each block, as content_sync
+            returns it. If end is not set and the number of views of the
+            document is unknown, a single block (start, 0, Left) instead.
+    """
+    if end is None:
+        either = document_nviews(resource)
+        if either.is_left:
+            return iter([(start, 0, either)])
+        end = either.value
+    fetch = lambda startview, nviews: resource.content_sync(startview, nviews, mode)
+    return adaptive_blocks(fetch, start, end, sizer, trials)
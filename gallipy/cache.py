@@ -0,0 +1,392 @@
+"""
+Gallipy - Python wrapper for the Gallica APIs
+Copyright (C) 2019  Bertrand Dumenieu
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+https://github.com/GeoHistoricalData/gallipy
+"""
+import asyncio
+import collections
+import sqlite3
+import threading
+import time
+from .monadic import Either, Left, Some, nil
+
+__all__ = ['Cache', 'CacheEntry', 'DEFAULT_TTLS', 'Memo', 'default_memo',
+           'SingleFlight', 'default_single_flight']
+
+_DAY = 24 * 3600
+
+# Time-to-live in seconds of the responses of each service. Services absent
+# from this dictionary are not cached.
+DEFAULT_TTLS = {
+    "Pagination": 30 * _DAY,
+    "OAIRecord": 30 * _DAY,
+    "Issues": _DAY,  # The issues of the current year do change
+    "Toc": 30 * _DAY,
+    "manifest": 30 * _DAY,
+}
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        service TEXT NOT NULL,
+        key TEXT NOT NULL,
+        body BLOB NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        stored REAL NOT NULL,
+        accessed REAL NOT NULL,
+        size INTEGER NOT NULL,
+        PRIMARY KEY (service, key)
+    )
+"""
+
+CacheEntry = collections.namedtuple(
+    "CacheEntry", ("body", "etag", "last_modified", "stored", "fresh"))
+
+
+class Cache:
+    """A persistent cache of Gallica responses, stored in a SQLite database.
+
+    Entries are keyed by service name and URL, hence by ARK and query. Each
+    service has its own time-to-live; once an entry has expired it is
+    revalidated with the ETag and Last-Modified headers sent by Gallica, if
+    any. The least recently used entries are evicted when the total size of
+    the cached responses exceeds max_size.
+
+    A Cache is thread-safe and the database can be shared by several processes.
+
+    Args:
+        path (str): Path of the SQLite database. Created if it does not exist.
+        ttls (:obj:dict, optional): Time-to-live in seconds per service name,
+            overriding DEFAULT_TTLS. Set the TTL of a service to None to
+            disable its caching.
+        max_size (:obj:int, optional): Maximum total size in bytes of the
+            cached responses. Defaults to 256 MiB.
+        offline (:obj:bool, optional): If True, responses are only read from
+            the cache, expired or not, and the network is never used.
+            Defaults to False.
+    """
+
+    def __init__(self, path, ttls=None, max_size=256 * 2**20, offline=False):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.max_size = max_size
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(_SCHEMA)
+        self._db.execute("CREATE INDEX IF NOT EXISTS lru ON entries (accessed)")
+
+    def ttl(self, service):
+        """Time-to-live of the responses of a service.
+
+        Returns:
+            float: The TTL in seconds, or None if the service is not cached.
+        """
+        return self.ttls.get(service)
+
+    def get(self, service, key):
+        """Looks up a cached response.
+
+        Args:
+            service (str): The name of the service.
+            key (str): The key of the response, usually its URL.
+
+        Returns:
+            CacheEntry: The cached response, or None if there is none.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, etag, last_modified, stored FROM entries"
+                " WHERE service = ? AND key = ?", (service, key)).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE entries SET accessed = ? WHERE service = ? AND key = ?",
+                (now, service, key))
+        ttl = self.ttl(service)
+        fresh = ttl is not None and now - row[3] < ttl
+        return CacheEntry(bytes(row[0]), row[1], row[2], row[3], fresh)
+
+    def put(self, service, key, body, etag=None, last_modified=None):
+        """Stores a response, then evicts entries if the cache is too large.
+
+        Args:
+            service (str): The name of the service.
+            key (str): The key of the response, usually its URL.
+            body (bytes): The response.
+            etag (:obj:str, optional): The ETag header of the response.
+            last_modified (:obj:str, optional): Its Last-Modified header.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (service, key, body, etag, last_modified, now, now, len(body)))
+            self._evict()
+
+    def touch(self, service, key):
+        """Marks a cached response as fresh again, e.g. after a 304 response."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE entries SET stored = ?, accessed = ? WHERE service = ? AND key = ?",
+                (now, now, service, key))
+
+    def invalidate(self, service=None, key=None):
+        """Removes entries from the cache.
+
+        Args:
+            service (:obj:str, optional): Only remove the entries of this service.
+            key (:obj:str, optional): Only remove the entries with this key.
+                Without service nor key, the whole cache is cleared.
+        """
+        clauses, params = [], []
+        for column, value in (("service", service), ("key", key)):
+            if value is not None:
+                clauses.append(column + " = ?")
+                params.append(value)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        with self._lock:
+            self._db.execute("DELETE FROM entries" + where, params)
+
+    def size(self):
+        """Total size in bytes of the cached responses."""
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def close(self):
+        """Closes the database."""
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _evict(self):
+        """Removes the least recently used entries until the cache fits in max_size."""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = self._db.execute(
+            "SELECT service, key, size FROM entries ORDER BY accessed ASC").fetchall()
+        for service, key, size in rows:
+            if total <= self.max_size:
+                break
+            self._db.execute(
+                "DELETE FROM entries WHERE service = ? AND key = ?", (service, key))
+            total -= size
+
+
+class Memo:
+    """A bounded, thread-safe, in-memory LRU memo of derived metadata.
+
+    Resource uses a Memo for the metadata it looks up on its own, e.g. the
+    number of views of a document before downloading it, or the size of an
+    image before extracting it. Keys are tuples starting with the ARK root of
+    the document, so that every Resource of the same document shares them.
+
+    Args:
+        max_entries (:obj:int, optional): Maximum number of entries. The least
+            recently used entries are evicted beyond. Defaults to 4096.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key):
+        """Looks up a memoized value.
+
+        Returns:
+            Option: Some(value) if key is memoized, nil otherwise.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return nil
+            self._entries.move_to_end(key)
+            return Some(self._entries[key])
+
+    def put(self, key, value):
+        """Memoizes a value, evicting the least recently used entry if needed."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """Gets a memoized value, or computes and memoizes it.
+
+        Concurrent calls with the same key compute the value only once.
+        Failures are not memoized.
+
+        Args:
+            key (tuple): The key, starting with an ARK root.
+            compute (function): A function taking no argument and returning
+                an Either.
+
+        Returns:
+            Either: The memoized value in a Right, or the result of compute.
+        """
+        option = self.get(key)
+        if option.defined:
+            return Either.pure(option.value)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            option = self.get(key)
+            if option.defined:
+                return Either.pure(option.value)
+            either = compute()
+            if not either.is_left:
+                self.put(key, either.value)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return either
+
+    def invalidate(self, root=None):
+        """Forgets the entries of a document, or every entry.
+
+        Args:
+            root (:obj:str, optional): The ARK root of the document. If unset,
+                the whole memo is cleared.
+        """
+        with self._lock:
+            if root is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] == root]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_DEFAULT_MEMO = Memo()
+
+def default_memo():
+    """The Memo shared by every Resource created without one."""
+    return _DEFAULT_MEMO
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls into one.
+
+    While a call for a key is in flight, further calls for the same key do
+    not run: they wait for it and receive the same Either. Once the call
+    completes, the next one for this key runs again, so nothing is cached.
+
+    Attributes:
+        coalesced (int): Number of calls that waited for another one instead
+            of running.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, compute):
+        """Runs compute, unless a call for key is already in flight.
+
+        Args:
+            key (hashable): Identifies identical calls, e.g. an URL.
+            compute (function): A function taking no argument and returning
+                an Either.
+
+        Returns:
+            Either: The result of compute, run by this call or by the one in
+                flight.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            return call.result
+        try:
+            call.result = compute()
+        except Exception as ex:
+            call.result = Left(ex)
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key, compute):
+        """Awaits compute(), unless a call for key is already in flight.
+
+        The asyncio counterpart of do. Calls are only coalesced within the
+        same event loop.
+
+        Args:
+            key (hashable): Identifies identical calls, e.g. an URL.
+            compute (function): A function taking no argument and returning
+                an awaitable of an Either.
+
+        Returns:
+            Either: The result of compute, run by this call or by the one in
+                flight.
+        """
+        loop = asyncio.get_event_loop()
+        key = (loop, key)
+        with self._lock:
+            pending = self._calls.get(key)
+            if pending is not None:
+                self.coalesced += 1
+            else:
+                self._calls[key] = loop.create_future()
+        if pending is not None:
+            return await asyncio.shield(pending)
+        result = Left(Exception("Coalesced call cancelled"))
+        try:
+            result = await compute()
+        except Exception as ex:
+            result = Left(ex)
+        finally:
+            with self._lock:
+                future = self._calls.pop(key)
+            future.set_result(result)
+        return result
+
+
+class _Call:
+    """A call in flight of a SingleFlight."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+_DEFAULT_SINGLE_FLIGHT = SingleFlight()
+
+def default_single_flight():
+    """The SingleFlight coalescing the requests of the fetch layer."""
+    return _DEFAULT_SINGLE_FLIGHT
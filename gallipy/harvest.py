@@ -0,0 +1,276 @@
+"""
+Gallipy - Python wrapper for the Gallica APIs
+Copyright (C) 2019  Bertrand Dumenieu
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+https://github.com/GeoHistoricalData/gallipy
+"""
+import collections
+import os
+import shutil
+import struct
+import threading
+import zipfile
+import zlib
+from .monadic import Either, Future, Left
+from .ocrstore import OcrStore
+
+__all__ = ['document_nviews', 'preview_name', 'harvest_previews', 'harvest_previews_async',
+           'harvest_ocr']
+
+
+def document_nviews(resource):
+    """The number of views of a document.
+
+    Read from the Pagination service, or from the IIIF manifest if
+    Pagination fails. The result is memoized with the document.
+
+    Returns:
+        Either[Exception int]: The number of views, or an Exception.
+    """
+    def compute():
+        either = resource.pagination_sync().map(
+            lambda pagination: int(pagination['livre']['structure']['nbVueImages']))
+        if not either.is_left:
+            return either
+        return resource.iiif_info_sync(view='').map(
+            lambda manifest: len(manifest['sequences'][0]['canvases']))
+    return resource._memoized('nviews', compute)
+
+def preview_name(view, resolution):
+    """The file name of the preview of a view, as in Gallica's URLs: 'f12.thumbnail.jpg'."""
+    return "f{}.{}.jpg".format(view, resolution)
+
+def harvest_previews(resource, dest, resolution='thumbnail', views=None, max_concurrency=8):
+    """Retrieves the previews of many views of a document.
+
+    Previews are fetched concurrently and written to the directory dest, or
+    to the zip archive dest if it ends with '.zip'. Each preview is named
+    after its view, see preview_name. Previews already in dest are skipped,
+    so an interrupted harvest can be run again. A zip archive is written to
+    dest + '.part' and renamed to dest once every preview has been fetched.
+
+    Args:
+        resource (Resource): The document.
+        dest (str): A directory, created if needed, or a zip archive.
+        resolution (:obj:str, optional): One of 'thumbnail', 'lowres',
+            'medres', 'highres'. Defaults to 'thumbnail'.
+        views (:obj:iterable, optional): The views to retrieve. Defaults to
+            every view of the document, see document_nviews.
+        max_concurrency (:obj:int, optional): Maximum number of previews
+            fetched at the same time. Defaults to 8.
+
+    Returns:
+        Either[Exception dict]: If the views are known, a Right holding the
+            number of previews 'fetched' and 'skipped', and the list of
+            (view, Exception) that 'failed'. Otherwise, a Left.
+    """
+    return harvest_previews_async(resource, dest, resolution, views, max_concurrency).result().flat_map(
+        lambda either: either)
+
+def harvest_previews_async(resource, dest, resolution='thumbnail', views=None, max_concurrency=8):
+    """Asynchronous version of harvest_previews.
+
+    The previews are fetched by a future per view, composed into a single
+    future: no task of the shared executor waits for another one.
+
+    Returns:
+        Future: A future resolving to the Either returned by harvest_previews.
+    """
+    def plan():
+        selected = views
+        if selected is None:
+            either = document_nviews(resource)
+            if either.is_left:
+                return either
+            selected = range(1, either.value + 1)
+        selected = list(selected)
+        try:
+            store = _ZipStore(dest) if dest.endswith('.zip') else _DirectoryStore(dest)
+        except Exception as ex:
+            return Left(ex)
+        names = [preview_name(view, resolution) for view in selected]
+        todo = [(view, name) for view, name in zip(selected, names) if name not in store]
+        return Either.pure((store, len(selected), todo))
+
+    def harvest(either):
+        if either.is_left:
+            return Future.pure(either)
+        store, nviews, todo = either.value
+        fetch = lambda job: Future.asyn(lambda: store.fetch(resource, resolution, *job))
+        return Future.traverse_par(todo, max_concurrency, fail_fast=False)(fetch).map(
+            lambda results: _summarize(store, nviews, todo, results))
+
+    return Future.asyn(plan).flat_map(harvest)
+
+def _summarize(store, nviews, todo, results):
+    """Closes store and counts the previews fetched, skipped and failed."""
+    try:
+        store.close()
+    except Exception as ex:
+        return Left(ex)
+    failed = [(view, either.value) for (view, _), either in zip(todo, results) if either.is_left]
+    return Either.pure({"fetched": len(todo) - len(failed), "skipped": nviews - len(todo),
+                        "failed": failed})
+
+def harvest_ocr(resources, dest, max_concurrency=8):
+    """Retrieves the OCR of every view of many documents into an OcrStore.
+
+    The views of the documents are counted concurrently with document_nviews,
+    then the ALTO documents of all their views are fetched concurrently, at
+    most max_concurrency at a time across documents. Each one is parsed as
+    soon as it arrives and appended to the store, so memory use depends on
+    max_concurrency only.
+    Views already in the store are skipped: an interrupted harvest resumes
+    where it stopped, page by page.
+
+    Args:
+        resources (iterable): The documents, Resource objects. A document
+            given several times is harvested once.
+        dest (str): The directory of the OcrStore, created if needed.
+        max_concurrency (:obj:int, optional): Maximum number of pages
+            fetched at the same time. Defaults to 8.
+
+    Returns:
+        Either[Exception dict]: If the store could be opened, a Right holding
+            the number of pages 'fetched' and 'skipped', the number of
+            'words' stored, and the list of (ark, view, Exception) that
+            'failed', view being None if the document could not be counted.
+            Otherwise, a Left.
+    """
+    try:
+        store = OcrStore(dest)
+    except Exception as ex:
+        return Left(ex)
+    summary = {"fetched": 0, "skipped": 0, "words": 0, "failed": []}
+    documents = collections.OrderedDict((str(resource.ark.root), resource) for resource in resources)
+    count = lambda resource: Future.asyn(lambda: document_nviews(resource))
+    with store:
+        counts = Future.traverse_par(list(documents.values()), max_concurrency, fail_fast=False)(
+            count).result().value
+        todo = []
+        for (ark, resource), either in zip(documents.items(), counts):
+            if either.is_left:
+                summary["failed"].append((ark, None, either.value))
+                continue
+            done = store.views(ark)
+            views = [view for view in range(1, either.value + 1) if view not in done]
+            todo += [(resource, ark, view) for view in views]
+            summary["skipped"] += either.value - len(views)
+        fetch = lambda job: Future.asyn(lambda: _harvest_page(store, *job))
+        results = Future.traverse_par(todo, max_concurrency, fail_fast=False)(fetch).result().value
+        for (_, ark, view), either in zip(todo, results):
+            if either.is_left:
+                summary["failed"].append((ark, view, either.value))
+            else:
+                summary["fetched"] += 1
+                summary["words"] += either.value
+    order = {ark: index for index, ark in enumerate(documents)}
+    summary["failed"].sort(key=lambda failure: order[failure[0]])
+    return Either.pure(summary)
+
+def _harvest_page(store, resource, ark, view):
+    """Fetches and parses the OCR of a view, then appends it to store."""
+    either = resource.ocr_page_sync(view)
+    try:
+        return either.map(lambda page: store.add(ark, view, page))
+    except Exception as ex:
+        return Left(ex)
+
+
+class _DirectoryStore:
+    """Previews as files of a directory."""
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def __contains__(self, name):
+        return os.path.exists(os.path.join(self.path, name))
+
+    def fetch(self, resource, resolution, view, name):
+        # Written to a .part file first, so that a partial preview is never skipped
+        return resource.image_preview_to_file_sync(os.path.join(self.path, name), resolution, view)
+
+    def close(self):
+        pass
+
+
+class _ZipStore:
+    """Previews as the members of a zip archive, stored without compression.
+
+    The directory of a zip archive is only written when it is closed. The
+    archive is thus written to path + '.part', renamed to path on close. If
+    a harvest is interrupted, the members of the .part file are recovered
+    from their local headers by the next one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        part = path + '.part'
+        if not os.path.exists(part) and os.path.exists(path):
+            shutil.copyfile(path, part)
+        if os.path.exists(part):
+            _recover_zip(part)
+        self._zip = zipfile.ZipFile(part, 'a', zipfile.ZIP_STORED)
+        self._names = set(self._zip.namelist())
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def fetch(self, resource, resolution, view, name):
+        either = resource.image_preview_sync(resolution, view)
+        if either.is_left:
+            return either
+        with self._lock:
+            self._zip.writestr(name, either.value)
+            self._names.add(name)
+        return Either.pure(name)
+
+    def close(self):
+        self._zip.close()
+        os.replace(self.path + '.part', self.path)
+
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+
+def _recover_zip(path):
+    """Rewrites the zip archive path from its complete members if its
+    directory is missing or damaged.
+
+    Members are read from their local headers, up to the first one that is
+    truncated, compressed, or whose CRC does not match.
+    """
+    try:
+        with zipfile.ZipFile(path):
+            return
+    except zipfile.BadZipFile:
+        pass
+    with open(path, 'rb') as damaged, zipfile.ZipFile(path + '.tmp', 'w', zipfile.ZIP_STORED) as archive:
+        while True:
+            header = damaged.read(_LOCAL_HEADER.size)
+            if len(header) < _LOCAL_HEADER.size:
+                break
+            (signature, _, flags, method, _, _, crc, size, _, name_length,
+             extra_length) = _LOCAL_HEADER.unpack(header)
+            if signature != b'PK\x03\x04' or flags & 0x08 or method != zipfile.ZIP_STORED:
+                break
+            name = damaged.read(name_length)
+            damaged.seek(extra_length, os.SEEK_CUR)
+            data = damaged.read(size)
+            if len(data) < size or zlib.crc32(data) != crc:
+                break
+            archive.writestr(name.decode('utf-8' if flags & 0x800 else 'cp437'), data)
+    os.replace(path + '.tmp', path)
@@ -17,39 +17,248 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 https://github.com/GeoHistoricalData/gallipy
 """
+import asyncio
+import os
+import urllib.error
 import urllib.parse
 import json
 from bs4 import BeautifulSoup
+from xmltodict import parse as parsexmltodict
+from .cache import default_single_flight
 from .monadic import Left, Either
+from .payload import Payload, SPILL_THRESHOLD
+from .transport import default_transport, default_async_transport
 
 
 _BASE_PARTS = {"scheme":"https", "netloc":"gallica.bnf.fr"}
 
-def fetch(url):
+CHUNK_SIZE = 64 * 1024
+
+def fetch(url, transport=None, cache=None, service=None):
     """Fetches data from an URL
 
     Fetch data from URL and wraps the unicode encoded response in an Either object.
 
     Args:
         url (str): An URL to fetch.
-        timeout (:obj:int, optional): Sets a timeout delay (Optional).
+        transport (:obj:Transport, optional): The Transport used to send the
+            request. Defaults to the shared default Transport.
+        cache (:obj:Cache, optional): A persistent cache of responses.
+        service (:obj:str, optional): The name of the Gallica service
+            queried by url, e.g. 'Pagination'. The cache only stores the
+            responses of the services it has a time-to-live for.
 
     Returns:
         Either[Exception Unicode]: The response content if everything went fine
             and Exception otherwise.
+
+    Concurrent fetches of the same URL, with the same transport, cache and
+    service, are coalesced: one request is sent and every caller receives its
+    Either. See cache.default_single_flight.
     """
+    transport = transport or default_transport()
+    return default_single_flight().do(_flight_key(url, transport, cache, service),
+                                      lambda: _fetch(url, transport, cache, service))
+
+def _flight_key(url, transport, cache, service):
+    """The key of a fetch in the single flight. Fetches through different
+    transports or caches must not share a result: one may be offline, or
+    have its own rate limits and retries. transport must be resolved, so
+    that fetches through the default transport share a key whether it was
+    given or not. A cache of None means no cache, there is no default one."""
+    return (url, id(transport), id(cache), service)
+
+def _fetch(url, transport, cache, service):
+    """Fetches data from an URL, without coalescing. See fetch."""
     try:
-        with urllib.request.urlopen(url, timeout=30) as res:
-            content = res.read()
-            if content:
-                return Either.pure(content)
-            raise Exception("Empty response from {}".format(url))
+        transport = transport or default_transport()
+        if cache is None:
+            content = transport.get(url)
+        else:
+            content = _get_cached(url, transport, cache, service)
+        if content:
+            return Either.pure(content)
+        raise Exception("Empty response from {}".format(url))
     except Exception as ex:
         pattern = "Error while fetching URL {}\n{}"
         err = urllib.error.URLError(pattern.format(url, str(ex)))
         return Left(err)
 
-def fetch_xml_html(url, parser='xml'):
+def fetch_stream(url, transport=None, chunk_size=CHUNK_SIZE):
+    """Fetches data from an URL as a stream of chunks
+
+    Unlike fetch, the response is never held in memory as a whole.
+    As a generator cannot return an Either, errors are raised.
+
+    Args:
+        url (str): An URL to fetch.
+        transport (:obj:Transport, optional): The Transport used to send the
+            request. Defaults to the shared default Transport.
+        chunk_size (:obj:int, optional): Maximum size in bytes of the chunks.
+
+    Yields:
+        bytes: The successive chunks of the response.
+
+    Raises:
+        urllib.error.URLError: If the request failed.
+    """
+    try:
+        with (transport or default_transport()).open(url) as res:
+            chunk = res.read(chunk_size)
+            while chunk:
+                yield chunk
+                chunk = res.read(chunk_size)
+    except urllib.error.URLError:
+        raise
+    except Exception as ex:
+        pattern = "Error while fetching URL {}\n{}"
+        raise urllib.error.URLError(pattern.format(url, str(ex)))
+
+def fetch_to_file(url, dest, transport=None, chunk_size=CHUNK_SIZE, resume=False):
+    """Fetches data from an URL and writes it to a file
+
+    The response is streamed to dest chunk by chunk, so memory use does not
+    depend on its size. If dest is a path, the data is first written to
+    dest + '.part', which is renamed to dest once complete: dest never holds
+    a truncated response.
+
+    Args:
+        url (str): An URL to fetch.
+        dest (str or file-like): A path, or a binary file-like object open
+            for writing.
+        transport (:obj:Transport, optional): The Transport used to send the
+            request. Defaults to the shared default Transport.
+        chunk_size (:obj:int, optional): Maximum size in bytes of the chunks.
+        resume (:obj:bool, optional): If True and dest is a path, an
+            interrupted transfer is resumed from the end of dest + '.part'
+            with a Range request, and dest + '.part' is kept on failure.
+            The transfer starts over if the server ignores the Range header.
+            Defaults to False.
+
+    Returns:
+        Either[Exception str or file-like]: dest if everything went fine,
+            Exception otherwise.
+    """
+    if not isinstance(dest, (str, bytes, os.PathLike)):
+        return _stream_to(url, dest, transport, chunk_size).map(lambda _: dest)
+    part = "{}.part".format(os.fsdecode(dest))
+    offset = os.path.getsize(part) if resume and os.path.exists(part) else 0
+    headers = {"Range": "bytes={}-".format(offset)} if offset else {}
+    try:
+        with (transport or default_transport()).open(url, headers) as res:
+            append = bool(offset) and res.status == 206
+            with open(part, "ab" if append else "wb") as ostream:
+                size = _copy(res, ostream, chunk_size)
+        if not (size or append):
+            raise Exception("Empty response from {}".format(url))
+        os.replace(part, dest)
+        return Either.pure(dest)
+    except urllib.error.HTTPError as ex:
+        if offset and ex.code == 416:  # The part file is complete, or corrupted
+            os.remove(part)
+            return fetch_to_file(url, dest, transport, chunk_size, resume)
+        error = ex
+    except Exception as ex:
+        error = ex
+    if not resume and os.path.exists(part):
+        os.remove(part)
+    pattern = "Error while fetching URL {}\n{}"
+    return Left(urllib.error.URLError(pattern.format(url, str(error))))
+
+def fetch_payload(url, transport=None, spill_threshold=SPILL_THRESHOLD, chunk_size=CHUNK_SIZE):
+    """Fetches data from an URL into a Payload
+
+    Unlike fetch, the data is exposed as a memoryview and, beyond
+    spill_threshold bytes, memory-mapped from a temporary file instead of
+    being held in memory. Payloads are neither cached nor coalesced.
+
+    Args:
+        url (str): An URL to fetch.
+        transport (:obj:Transport, optional): The Transport used to send the
+            request. Defaults to the shared default Transport.
+        spill_threshold (:obj:int, optional): See Payload.from_stream.
+        chunk_size (:obj:int, optional): Maximum size in bytes of the chunks.
+
+    Returns:
+        Either[Exception Payload]: The response data if everything went fine,
+            Exception otherwise.
+    """
+    try:
+        with (transport or default_transport()).open(url) as res:
+            payload = Payload.from_stream(res, spill_threshold, chunk_size)
+        if len(payload):
+            return Either.pure(payload)
+        raise Exception("Empty response from {}".format(url))
+    except Exception as ex:
+        pattern = "Error while fetching URL {}\n{}"
+        return Left(urllib.error.URLError(pattern.format(url, str(ex))))
+
+def _copy(istream, ostream, chunk_size):
+    """Copies istream to ostream chunk by chunk, returns the number of bytes copied."""
+    size = 0
+    chunk = istream.read(chunk_size)
+    while chunk:
+        ostream.write(chunk)
+        size += len(chunk)
+        chunk = istream.read(chunk_size)
+    return size
+
+def _stream_to(url, ostream, transport, chunk_size):
+    """Writes the chunks of fetch_stream to ostream.
+
+    Returns:
+        Either[Exception int]: The number of bytes written, or an Exception.
+    """
+    try:
+        size = 0
+        for chunk in fetch_stream(url, transport, chunk_size):
+            ostream.write(chunk)
+            size += len(chunk)
+        if size:
+            return Either.pure(size)
+        raise Exception("Empty response from {}".format(url))
+    except urllib.error.URLError as ex:
+        return Left(ex)
+    except Exception as ex:
+        pattern = "Error while fetching URL {}\n{}"
+        return Left(urllib.error.URLError(pattern.format(url, str(ex))))
+
+def fetch_xml(url, transport=None, cache=None, service=None):
+    """Fetches xml from an URL and parses it
+
+    Retrieves xml data from an URL and parses the raw bytes in a single pass
+    with xmltodict, which relies on the expat streaming parser. Unlike
+    fetch_xml_html, the document is never turned into a BeautifulSoup tree
+    nor serialised back to a string.
+
+    Args:
+      url (str): An URL to fetch.
+      transport (:obj:Transport, optional): The Transport used to send the
+          request. Defaults to the shared default Transport.
+      cache (:obj:Cache, optional): A persistent cache of responses. See fetch.
+      service (:obj:str, optional): The name of the service. See fetch.
+
+    Returns:
+        Either[Exception OrderedDict]: The parsed document if everything went
+        fine, Exception otherwise.
+    """
+    return fetch(url, transport, cache, service).flat_map(parse_xml)
+
+def parse_xml(data):
+    """Parses xml bytes into an OrderedDict
+
+    Args:
+        data (bytes): The xml document.
+
+    Returns:
+        Either[Exception OrderedDict]: The parsed document, or the parsing error.
+    """
+    try:
+        return Either.pure(parsexmltodict(data))
+    except Exception as ex:
+        return Left(ex)
+
+def fetch_xml_html(url, parser='xml', transport=None, cache=None, service=None):
     """Fetches xml or html from an URL
 
     Retrieves xml or html data from an URL and wraps it in an Either object.
@@ -58,37 +267,142 @@ def fetch_xml_html(url, parser='xml'):
     Args:
       url (str): An URL to fetch.
       parser (str): Any BeautifulSoup4 parser, e.g. 'html.parser'. Default: xml.
+      transport (:obj:Transport, optional): The Transport used to send the
+          request. Defaults to the shared default Transport.
+      cache (:obj:Cache, optional): A persistent cache of responses. See fetch.
+      service (:obj:str, optional): The name of the service. See fetch.
 
     Returns:
         Either[Exception String]: String if everything went fine, Exception
         otherwise.
     """
     try:
-        return fetch(url).map(lambda res: str(BeautifulSoup(res, parser)))
+        either = fetch(url, transport, cache, service)
+        return either.map(lambda res: str(BeautifulSoup(res, parser)))
     except urllib.error.URLError as ex:
         pattern = "Error while fetching XML from {}\n{}"
         err = urllib.error.URLError(pattern.format(url, str(ex)))
         return Left(err)
 
-def fetch_json(url):
+def fetch_json(url, transport=None, cache=None, service=None):
     """Fetches json from an URL
 
     Retrieves json data from an URL and wraps it in an Either object.
 
     Args:
         url (str): An URL to fetch.
+        transport (:obj:Transport, optional): The Transport used to send the
+            request. Defaults to the shared default Transport.
+        cache (:obj:Cache, optional): A persistent cache of responses. See fetch.
+        service (:obj:str, optional): The name of the service. See fetch.
 
     Returns:
         Either[Exception Unicode]: Unicode if everything went fine and
             Exception otherwise.
     """
     try:
-        return fetch(url).map(json.loads)
+        return fetch(url, transport, cache, service).map(json.loads)
     except urllib.error.URLError as ex:
         pattern = "Error while fetching JSON from {}\n{}"
         err = urllib.error.URLError(pattern.format(url, str(ex)))
         return Left(err)
 
+async def fetch_async(url, transport=None, cache=None, service=None):
+    """Fetches data from an URL (asyncio version)
+
+    See fetch.
+
+    Args:
+        url (str): An URL to fetch.
+        transport (:obj:AsyncTransport, optional): The AsyncTransport used to
+            send the request. Defaults to the event loop's default AsyncTransport.
+        cache (:obj:Cache, optional): A persistent cache of responses. See fetch.
+        service (:obj:str, optional): The name of the service. See fetch.
+
+    Returns:
+        Either[Exception Unicode]: The response content if everything went fine
+            and Exception otherwise.
+    """
+    transport = transport or default_async_transport()
+    return await default_single_flight().do_async(
+        _flight_key(url, transport, cache, service),
+        lambda: _fetch_async(url, transport, cache, service))
+
+async def _fetch_async(url, transport, cache, service):
+    """Fetches data from an URL, without coalescing. See fetch_async."""
+    try:
+        transport = transport or default_async_transport()
+        if cache is None:
+            content = await transport.get(url)
+        else:
+            content = await _get_cached_async(url, transport, cache, service)
+        if content:
+            return Either.pure(content)
+        raise Exception("Empty response from {}".format(url))
+    except Exception as ex:
+        pattern = "Error while fetching URL {}\n{}"
+        err = urllib.error.URLError(pattern.format(url, str(ex)))
+        return Left(err)
+
+async def fetch_xml_async(url, transport=None, cache=None, service=None):
+    """Fetches xml from an URL and parses it (asyncio version). See fetch_xml."""
+    return (await fetch_async(url, transport, cache, service)).flat_map(parse_xml)
+
+async def fetch_xml_html_async(url, parser='xml', transport=None, cache=None, service=None):
+    """Fetches xml or html from an URL (asyncio version). See fetch_xml_html."""
+    either = await fetch_async(url, transport, cache, service)
+    return either.map(lambda res: str(BeautifulSoup(res, parser)))
+
+async def fetch_json_async(url, transport=None, cache=None, service=None):
+    """Fetches json from an URL (asyncio version). See fetch_json."""
+    return (await fetch_async(url, transport, cache, service)).map(json.loads)
+
+def _get_cached(url, transport, cache, service):
+    """Gets a response from the cache, or from the network then stores it."""
+    entry = _lookup(url, cache, service)
+    if entry is not None and (entry.fresh or cache.offline):
+        return entry.body
+    with transport.open(url, _conditional_headers(entry)) as res:
+        body = res.read()
+        if res.status == 304 and entry is not None:
+            cache.touch(service, url)
+            return entry.body
+        headers = res.headers
+    if cache.ttl(service) is not None and body:
+        cache.put(service, url, body, headers.get("ETag"), headers.get("Last-Modified"))
+    return body
+
+async def _get_cached_async(url, transport, cache, service):
+    """Asyncio version of _get_cached. The database is accessed from a thread."""
+    loop = asyncio.get_event_loop()
+    entry = await loop.run_in_executor(None, _lookup, url, cache, service)
+    if entry is not None and (entry.fresh or cache.offline):
+        return entry.body
+    status, headers, body = await transport.request(url, _conditional_headers(entry))
+    if status == 304 and entry is not None:
+        await loop.run_in_executor(None, cache.touch, service, url)
+        return entry.body
+    if cache.ttl(service) is not None and body:
+        await loop.run_in_executor(
+            None, cache.put, service, url, body, headers.get("ETag"), headers.get("Last-Modified"))
+    return body
+
+def _lookup(url, cache, service):
+    """Looks url up in the cache. In offline mode, a miss is an error."""
+    entry = cache.get(service, url) if cache.ttl(service) is not None else None
+    if entry is None and cache.offline:
+        raise LookupError("{} is not cached and the cache is offline.".format(url))
+    return entry
+
+def _conditional_headers(entry):
+    """Headers revalidating an expired cache entry."""
+    headers = {}
+    if entry is not None and entry.etag:
+        headers["If-None-Match"] = entry.etag
+    if entry is not None and entry.last_modified:
+        headers["If-Modified-Since"] = entry.last_modified
+    return headers
+
 def build_service_url(parts=None, service_name=''):
     """Creates an URL to access Gallica services
 
@@ -0,0 +1,209 @@
+"""
+Gallipy - Python wrapper for the Gallica APIs
+Copyright (C) 2019  Bertrand Dumenieu
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+https://github.com/GeoHistoricalData/gallipy
+"""
+import collections
+import datetime
+import sqlite3
+import threading
+import time
+from .ark import Ark
+from .monadic import Either, Future, Left
+
+__all__ = ['Issue', 'IssueIndex', 'crawl_issues']
+
+_SCHEMA = ("""
+    CREATE TABLE IF NOT EXISTS issues (
+        periodical TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        year INTEGER NOT NULL,
+        ark TEXT NOT NULL,
+        PRIMARY KEY (periodical, day, ark)
+    ) WITHOUT ROWID
+""", """
+    CREATE TABLE IF NOT EXISTS years (
+        periodical TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        crawled REAL NOT NULL,
+        PRIMARY KEY (periodical, year)
+    ) WITHOUT ROWID
+""")
+
+# An issue of a periodical: its ARK, its date (datetime.date) and its year.
+Issue = collections.namedtuple("Issue", ("ark", "date", "year"))
+
+
+class IssueIndex:
+    """A persistent index of the issues of periodicals, stored in a SQLite database.
+
+    Issues are keyed by periodical, the root ARK of its 'date' resource, and
+    by date, stored as a day number. The index also records when each year of
+    each periodical was crawled, see crawl_issues. An IssueIndex is
+    thread-safe.
+
+    Args:
+        path (str): Path of the SQLite database. Created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+
+    def put_year(self, periodical, year, issues):
+        """Replaces the issues of a year of a periodical, and marks the year
+        as crawled now.
+
+        Args:
+            periodical (str): The root ARK of the periodical.
+            year (int): The year.
+            issues (iterable): The (ark, date) of its issues.
+        """
+        rows = [(periodical, date.toordinal(), year, ark) for ark, date in issues]
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM issues WHERE periodical = ? AND year = ?",
+                             (periodical, year))
+            self._db.executemany("INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?)", rows)
+            self._db.execute("INSERT OR REPLACE INTO years VALUES (?, ?, ?)",
+                             (periodical, year, time.time()))
+
+    def years(self, periodical):
+        """The crawled years of a periodical.
+
+        Returns:
+            dict: The time each year was last crawled, as seconds since the epoch.
+        """
+        with self._lock:
+            return dict(self._db.execute(
+                "SELECT year, crawled FROM years WHERE periodical = ?", (periodical,)))
+
+    def issues(self, periodical, start=None, end=None):
+        """The issues of a periodical between two dates, from the index only.
+
+        Args:
+            periodical (str): The root ARK of the periodical.
+            start (:obj:datetime.date or str, optional): The first date, as a
+                date or in ISO format ('1937-01-31'). Defaults to the first issue.
+            end (:obj:datetime.date or str, optional): The last date, included.
+                Defaults to the last issue.
+
+        Returns:
+            list: The Issue objects, by date.
+        """
+        sql, params = "SELECT ark, day, year FROM issues WHERE periodical = ?", [periodical]
+        for bound, operator in ((start, ">="), (end, "<=")):
+            if bound is not None:
+                sql += " AND day {} ?".format(operator)
+                params.append(_as_date(bound).toordinal())
+        with self._lock:
+            rows = self._db.execute(sql + " ORDER BY day, ark", params).fetchall()
+        return [Issue(ark, datetime.date.fromordinal(day), year) for ark, day, year in rows]
+
+    def __len__(self):
+        """The number of issues in the index."""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM issues").fetchone()[0]
+
+    def close(self):
+        """Closes the database."""
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def crawl_issues(resource, dest, max_concurrency=8):
+    """Indexes the issues of a periodical, year by year.
+
+    The years of the periodical are fetched first, with Resource.issues_sync,
+    then the issues of the years to crawl, concurrently. A year is crawled if
+    it is not in the index yet, or if it was still running when it was last
+    crawled, e.g. the current year: crawling again later, say every night,
+    only refreshes these years.
+
+    Args:
+        resource (Resource): The periodical, any ARK of it.
+        dest (str): The path of the IssueIndex, created if needed.
+        max_concurrency (:obj:int, optional): Maximum number of years
+            fetched at the same time. Defaults to 8.
+
+    Returns:
+        Either[Exception dict]: If the years could be listed, a Right holding
+            the number of years 'fetched' and 'skipped', the number of
+            'issues' indexed, and the list of (year, Exception) that
+            'failed'. Otherwise, a Left.
+    """
+    try:
+        periodical = str(resource.ark.root)
+        either = resource.issues_sync().map(_issue_years)
+        if either.is_left:
+            return either
+        years = either.value
+        index = IssueIndex(dest)
+    except Exception as ex:
+        return Left(ex)
+    summary = {"fetched": 0, "skipped": 0, "issues": 0, "failed": []}
+    with index:
+        crawled = index.years(periodical)
+        todo = [year for year in years if year not in crawled
+                or datetime.date.fromtimestamp(crawled[year]).year <= year]
+        results = Future.traverse_par(todo, max_concurrency, fail_fast=False)(
+            resource.issues).result().value
+        for year, either in zip(todo, results):
+            either = either.flat_map(lambda issues: _year_issues(resource.ark.naan, year, issues))
+            if either.is_left:
+                summary["failed"].append((year, either.value))
+                continue
+            index.put_year(periodical, year, either.value)
+            summary["fetched"] += 1
+            summary["issues"] += len(either.value)
+        summary["skipped"] = len(years) - len(todo)
+    return Either.pure(summary)
+
+
+def _issue_years(issues):
+    """The years of a periodical, from its Issues metadata without date."""
+    years = (issues.get('issues') or {}).get('year') or []
+    return [int(year) for year in (years if isinstance(years, list) else [years])]
+
+def _year_issues(naan, year, issues):
+    """The (ark, date) of the issues of a year, from its Issues metadata.
+
+    Gallica gives the day of the year of each issue, 1 for January 1st.
+    """
+    try:
+        items = (issues.get('issues') or {}).get('issue') or []
+        items = items if isinstance(items, list) else [items]
+        first = datetime.date(year, 1, 1)
+        return Either.pure([
+            (str(Ark(naan=naan, name=item['@ark'])),
+             first + datetime.timedelta(days=int(item['@dayOfYear']) - 1))
+            for item in items])
+    except Exception as ex:
+        return Left(ex)
+
+def _as_date(value):
+    return value if isinstance(value, datetime.date) else datetime.date.fromisoformat(value)
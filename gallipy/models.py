@@ -0,0 +1,316 @@
+"""
+Gallipy - Python wrapper for the Gallica APIs
+Copyright (C) 2019  Bertrand Dumenieu
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+https://github.com/GeoHistoricalData/gallipy
+"""
+import datetime
+import io
+import itertools
+import json
+from lxml import etree
+from .monadic import Either, Left
+
+__all__ = ['Page', 'Pagination', 'OAIRecord', 'IssueEntry', 'Issues', 'ImageInfo',
+           'Canvas', 'Manifest', 'parse_pagination', 'parse_oairecord', 'parse_issues',
+           'parse_image_info', 'parse_manifest']
+
+_DC = '{http://purl.org/dc/elements/1.1/}'
+
+# The children of a page in a Pagination response, and their rank in Page.
+_PAGE_FIELDS = {'numero': 0, 'ordre': 1, 'pagination_type': 2, 'image_width': 3, 'image_height': 4}
+
+# The Dublin Core elements of an OAI record, in the order of OAIRecord's slots.
+DC_ELEMENTS = ('title', 'creator', 'subject', 'description', 'publisher', 'contributor',
+               'date', 'type', 'format', 'identifier', 'source', 'language', 'relation',
+               'coverage', 'rights')
+
+
+class _Model:
+    """A read-only record with slots, compared and printed field by field."""
+
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        for name, value in itertools.zip_longest(self.__slots__, args):
+            object.__setattr__(self, name, kwargs.get(name, value))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} is read-only".format(type(self).__name__))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join(
+            "{}={!r}".format(name, getattr(self, name)) for name in self.__slots__))
+
+
+class Page(_Model):
+    """A view of a document: its number as printed, its order among the
+    views, its pagination type, and the size of its image, if known."""
+    __slots__ = ('number', 'order', 'type', 'width', 'height')
+
+
+class Pagination(_Model):
+    """The paging metadata of a document, see Resource.pagination_sync.
+
+    Attributes:
+        nviews (int): The number of views.
+        first_displayed (int): The view displayed first by Gallica.
+        has_toc (bool): Whether the document has a table of contents.
+        has_content (bool): Whether its text is available.
+        pages (tuple): Its views, Page objects.
+    """
+    __slots__ = ('nviews', 'first_displayed', 'has_toc', 'has_content', 'pages')
+
+
+class OAIRecord(_Model):
+    """The OAI record of a document, see Resource.oairecord_sync.
+
+    Each Dublin Core element of the record, e.g. title or creator, is a tuple
+    of strings, empty if the element is absent.
+
+    Attributes:
+        oai_identifier (str): The identifier of the record.
+        datestamp (datetime.date): The date of the record.
+        typedoc (str): The type of document in Gallica, e.g. 'monographie'.
+        provenance (str): The institution providing the document.
+    """
+    __slots__ = ('oai_identifier', 'datestamp', 'typedoc', 'provenance') + DC_ELEMENTS
+
+
+class IssueEntry(_Model):
+    """An issue of a periodical: its ARK name, its date and its label."""
+    __slots__ = ('ark', 'date', 'label')
+
+
+class Issues(_Model):
+    """The issues metadata of a periodical, see Resource.issues_sync.
+
+    Attributes:
+        parent_ark (str): The ARK of the periodical, e.g. 'cb32798952c/date'.
+        title (str): The title of the periodical.
+        year (int): The year of the issues, None without year.
+        years (tuple): The years with issues, as int, listed without year.
+        issues (tuple): The issues of year, IssueEntry objects.
+    """
+    __slots__ = ('parent_ark', 'title', 'year', 'years', 'issues')
+
+
+class ImageInfo(_Model):
+    """The IIIF metadata of an image, see Resource.iiif_info_sync.
+
+    Attributes:
+        id (str): The base URI of the image.
+        width (int), height (int): The size of the full image.
+        tile_width (int), tile_height (int): The size of its tiles, if any.
+        scale_factors (tuple): The scale factors of the tiles.
+        sizes (tuple): The (width, height) of the preferred sizes.
+        profile (str): The IIIF compliance level.
+    """
+    __slots__ = ('id', 'width', 'height', 'tile_width', 'tile_height', 'scale_factors',
+                 'sizes', 'profile')
+
+
+class Canvas(_Model):
+    """A view of a IIIF manifest: its URI, label, size and image URI."""
+    __slots__ = ('id', 'label', 'width', 'height', 'image')
+
+
+class Manifest(_Model):
+    """The IIIF manifest of a document, see Resource.iiif_info_sync.
+
+    Attributes:
+        id (str): The URI of the manifest.
+        label (str): The label of the document.
+        canvases (tuple): Its views, Canvas objects.
+    """
+    __slots__ = ('id', 'label', 'canvases')
+
+
+def parse_pagination(data):
+    """Parses a Pagination response into a Pagination.
+
+    The response is read by lxml as a stream of elements: each page is turned
+    into a Page as soon as it is read, then freed.
+
+    Args:
+        data (bytes): The response of the service Pagination.
+
+    Returns:
+        Either[Exception Pagination]: The paging metadata, or an Exception.
+    """
+    nviews = first_displayed = None
+    has_toc = has_content = False
+    pages = []
+    try:
+        tags = ('page', 'nbVueImages', 'firstDisplayedPage', 'hasToc', 'hasContent')
+        for elem, tag in _iterparse(data, tags):
+            if tag == 'page':
+                values = [None] * len(_PAGE_FIELDS)
+                for child in elem:
+                    if child.tag in _PAGE_FIELDS:
+                        values[_PAGE_FIELDS[child.tag]] = child.text
+                number, order, ptype, width, height = values
+                pages.append(Page(number, _int(order), ptype, _int(width), _int(height)))
+                _free(elem)
+            elif tag == 'nbVueImages':
+                nviews = _int(elem.text)
+            elif tag == 'firstDisplayedPage':
+                first_displayed = _int(elem.text)
+            elif tag == 'hasToc':
+                has_toc = _bool(elem.text)
+            elif tag == 'hasContent':
+                has_content = _bool(elem.text)
+        return Either.pure(Pagination(nviews, first_displayed, has_toc, has_content, tuple(pages)))
+    except Exception as ex:
+        return Left(ex)
+
+def parse_oairecord(data):
+    """Parses an OAIRecord response into an OAIRecord.
+
+    Args:
+        data (bytes): The response of the service OAIRecord.
+
+    Returns:
+        Either[Exception OAIRecord]: The record, or an Exception.
+    """
+    elements = {name: [] for name in DC_ELEMENTS}
+    fields = {'oai_identifier': None, 'datestamp': None, 'typedoc': None, 'provenance': None}
+    try:
+        for elem, tag in _iterparse(data):
+            if elem.tag.startswith(_DC) and tag in elements:
+                elements[tag].append((elem.text or '').strip())
+            elif tag == 'identifier':
+                fields['oai_identifier'] = elem.text
+            elif tag == 'datestamp':
+                fields['datestamp'] = _date(elem.text)
+            elif tag in ('typedoc', 'provenance'):
+                fields[tag] = elem.text
+        fields.update((name, tuple(values)) for name, values in elements.items())
+        return Either.pure(OAIRecord(**fields))
+    except Exception as ex:
+        return Left(ex)
+
+def parse_issues(data):
+    """Parses an Issues response into an Issues.
+
+    Dates are computed from the year and the day of the year of each issue.
+
+    Args:
+        data (bytes): The response of the service Issues, with or without year.
+
+    Returns:
+        Either[Exception Issues]: The issues metadata, or an Exception.
+    """
+    years, issues, entries = [], [], []
+    year = parent_ark = title = None
+    try:
+        for elem, tag in _iterparse(data):
+            if tag == 'year':
+                years.append(int(elem.text))
+            elif tag == 'issue':
+                entries.append((elem.get('ark'), int(elem.get('dayOfYear')), elem.text))
+                _free(elem)
+            elif tag == 'issues':
+                year = _int(elem.get('date'))
+                parent_ark, title = elem.get('parentArk'), elem.get('title')
+        if entries:
+            first = datetime.date(year, 1, 1)
+            issues = [IssueEntry(ark, first + datetime.timedelta(days=day - 1), label)
+                      for ark, day, label in entries]
+        return Either.pure(Issues(parent_ark, title, year, tuple(years), tuple(issues)))
+    except Exception as ex:
+        return Left(ex)
+
+def parse_image_info(data):
+    """Parses a IIIF info.json into an ImageInfo.
+
+    Both the IIIF Image API 2 'tiles' property and the 1.1 'tile_width',
+    'tile_height' and 'scale_factors' properties are understood.
+
+    Args:
+        data (bytes): The info.json of an image.
+
+    Returns:
+        Either[Exception ImageInfo]: The metadata of the image, or an Exception.
+    """
+    try:
+        info = json.loads(data)
+        tiles = (info.get('tiles') or [{}])[0]
+        tile_width = tiles.get('width', info.get('tile_width'))
+        profile = info.get('profile')
+        return Either.pure(ImageInfo(
+            info.get('@id'), int(info['width']), int(info['height']), _int(tile_width),
+            _int(tiles.get('height', info.get('tile_height', tile_width))),
+            tuple(tiles.get('scaleFactors', info.get('scale_factors')) or ()),
+            tuple((size['width'], size['height']) for size in info.get('sizes', ())),
+            profile[0] if isinstance(profile, list) else profile))
+    except Exception as ex:
+        return Left(ex)
+
+def parse_manifest(data):
+    """Parses a IIIF manifest into a Manifest.
+
+    Args:
+        data (bytes): The manifest.json of a document.
+
+    Returns:
+        Either[Exception Manifest]: The manifest, or an Exception.
+    """
+    try:
+        manifest = json.loads(data)
+        sequences = manifest.get('sequences') or [{}]
+        canvases = tuple(
+            Canvas(canvas.get('@id'), canvas.get('label'), _int(canvas.get('width')),
+                   _int(canvas.get('height')),
+                   ((canvas.get('images') or [{}])[0].get('resource') or {}).get('@id'))
+            for canvas in sequences[0].get('canvases', ()))
+        return Either.pure(Manifest(manifest.get('@id'), manifest.get('label'), canvases))
+    except Exception as ex:
+        return Left(ex)
+
+
+def _iterparse(data, tags=None):
+    """The elements of an XML document as they end, with their local name.
+
+    If tags is set, only the elements with these names, without namespace,
+    are yielded; the filtering is done by lxml.
+    """
+    for _, elem in etree.iterparse(io.BytesIO(data), tag=tags):
+        if isinstance(elem.tag, str):
+            yield elem, elem.tag.rpartition('}')[2]
+
+def _free(elem):
+    """Frees an element once read, and the siblings read before it."""
+    elem.clear()
+    parent = elem.getparent()
+    while parent is not None and elem.getprevious() is not None:
+        del parent[0]
+
+def _int(text):
+    return None if text is None or not str(text).strip() else int(text)
+
+def _bool(text):
+    return (text or '').strip().lower() == 'true'
+
+def _date(text):
+    return None if not text else datetime.date(*map(int, text.strip()[:10].split('-')))
@@ -2,8 +2,16 @@
 # https://www.toptal.com/javascript/option-maybe-either-future-monads-js*
 # by Alexey Karasev
 
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from functools import reduce
+import collections
+import concurrent.futures
+import logging
+import queue
 import threading
+import time
+
+DEFAULT_MAX_WORKERS = 16
 
 class Monad:
   # pure :: a -> M a. Same as unit: a -> M a
@@ -67,7 +75,115 @@ class Right(Either):
     self.value = value
     self.is_left = False
 
+class BoundedExecutor:
+  """Wraps an executor and blocks submissions when too many tasks are pending.
+
+  Tasks submitted from a thread of this executor never block, as waiting for
+  a slot there could deadlock a pool whose workers all wait for each other.
+  For the same reason, a worker waiting for a Future with Future.result runs
+  the queued tasks of this executor meanwhile, see help_until.
+  """
+  _local = threading.local()
+
+  # __init__ :: (Executor, int, bool) -> BoundedExecutor
+  def __init__(self, executor, max_pending, owned=False):
+    self.executor = executor
+    self.max_pending = max_pending
+    self.owned = owned
+    self._slots = threading.BoundedSemaphore(max_pending)
+    self._tasks = collections.deque()
+    self._ready = threading.Condition()
+
+  # current :: () -> BoundedExecutor
+  @staticmethod
+  def current():
+    """The BoundedExecutor running the calling thread's task, or None."""
+    return getattr(BoundedExecutor._local, 'executor', None)
+
+  # submit :: ((a -> b), a...) -> concurrent.futures.Future b
+  def submit(self, f, *args):
+    acquired = not getattr(self._local, 'worker', False)
+    if acquired:
+      self._slots.acquire()
+    def run():
+      previous = self.current()
+      self._local.worker = True
+      self._local.executor = self
+      try:
+        return f(*args)
+      finally:
+        self._local.executor = previous
+        if acquired:
+          self._slots.release()
+    # Tasks are queued here, and each submission to the executor runs the
+    # oldest one: a waiting worker can then run them too.
+    task = concurrent.futures.Future()
+    with self._ready:
+      self._tasks.append((task, run))
+      self._ready.notify_all()
+    try:
+      self.executor.submit(self._run_next)
+    except Exception:
+      with self._ready:
+        if (task, run) in self._tasks:
+          self._tasks.remove((task, run))
+      if acquired:
+        self._slots.release()
+      raise
+    return task
+
+  # help_until :: ((() -> bool), float) -> bool
+  def help_until(self, done, timeout=None):
+    """Runs queued tasks on the calling thread until done() is true.
+
+    Call wake() whenever done() may have become true.
+
+    Returns:
+      bool: done(), False if timeout seconds elapsed first.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+      with self._ready:
+        while not done() and not self._tasks:
+          remaining = None if deadline is None else deadline - time.monotonic()
+          if remaining is not None and remaining <= 0:
+            return False
+          self._ready.wait(remaining)
+        if done():
+          return True
+        item = self._tasks.popleft()
+      self._run(*item)
+
+  # wake :: () -> void
+  def wake(self):
+    """Wakes up the threads in help_until."""
+    with self._ready:
+      self._ready.notify_all()
+
+  # shutdown :: bool -> void
+  def shutdown(self, wait=True):
+    self.executor.shutdown(wait)
+
+  def _run_next(self):
+    with self._ready:
+      if not self._tasks:
+        return  # Already run by a waiting worker
+      item = self._tasks.popleft()
+    self._run(*item)
+
+  @staticmethod
+  def _run(task, run):
+    if not task.set_running_or_notify_cancel():
+      return
+    try:
+      task.set_result(run())
+    except BaseException as err:
+      task.set_exception(err)
+
 class Future(Monad):
+  _executor = None
+  _executor_lock = threading.Lock()
+
   # __init__ :: ((Either err a -> void) -> void) -> Future (Either err a)
   def __init__(self, f):
     self.subscribers = []
@@ -80,6 +196,42 @@ class Future(Monad):
   def pure(value):
     return Future(lambda cb: cb(Either.pure(value)))
 
+  # configure :: (int, int, Executor) -> BoundedExecutor
+  @staticmethod
+  def configure(max_workers=DEFAULT_MAX_WORKERS, max_pending=None, executor=None):
+    """Sets the executor shared by all asynchronous Futures.
+
+    Args:
+      max_workers (:obj:int, optional): Number of worker threads of the
+        default ThreadPoolExecutor. Ignored if executor is set.
+      max_pending (:obj:int, optional): Maximum number of tasks running or
+        waiting for a worker. Future.asyn blocks when it is reached.
+        Defaults to 4 * max_workers.
+      executor (:obj:concurrent.futures.Executor, optional): A user-supplied
+        executor to run the futures on.
+
+    Returns:
+      BoundedExecutor: The new shared executor.
+    """
+    owned = executor is None
+    executor = executor or ThreadPoolExecutor(max_workers, thread_name_prefix='gallipy')
+    bounded = BoundedExecutor(executor, max_pending or 4 * max_workers, owned)
+    with Future._executor_lock:
+      previous, Future._executor = Future._executor, bounded
+    if previous and previous.owned:  # Never shut down a user-supplied executor
+      previous.shutdown(wait=False)
+    return bounded
+
+  # executor :: () -> BoundedExecutor
+  @staticmethod
+  def executor():
+    """The executor shared by all asynchronous Futures, created on first use."""
+    with Future._executor_lock:
+      if Future._executor is None:
+        executor = ThreadPoolExecutor(DEFAULT_MAX_WORKERS, thread_name_prefix='gallipy')
+        Future._executor = BoundedExecutor(executor, 4 * DEFAULT_MAX_WORKERS, True)
+      return Future._executor
+
   def exec(f, cb):
     try:
       data = f()
@@ -87,12 +239,12 @@ class Future(Monad):
     except Exception as err:
       cb(Left(err))
 
-  def exec_on_thread(f, cb):
-    t = threading.Thread(target=Future.exec, args=[f, cb])
-    t.start()
+  def exec_on_executor(f, cb, executor=None):
+    (executor or Future.executor()).submit(Future.exec, f, cb)
 
-  def asyn(f):
-    return Future(lambda cb: Future.exec_on_thread(f, cb))
+  # asyn :: (() -> a) -> Future a
+  def asyn(f, executor=None):
+    return Future(lambda cb: Future.exec_on_executor(f, cb, executor))
 
   # flat_map :: (a -> Future b) -> Future b
   def flat_map(self, f):
@@ -111,16 +263,148 @@ class Future(Monad):
         )
       ), arr, Future.pure([]))
 
+  # traverse_par :: ([a], int, bool) -> (a -> Future b) -> Future [b]
+  def traverse_par(arr, max_concurrency=None, fail_fast=True):
+    """Concurrent version of traverse.
+
+    Calls f on the elements of arr with at most max_concurrency futures
+    pending at once, and keeps the results in input order. An element fails
+    if its future resolves to a Left, or to a Right holding a Left as the
+    futures returned by Resource do.
+
+    Args:
+      arr (iterable): The elements to traverse.
+      max_concurrency (:obj:int, optional): Maximum number of pending futures.
+        Unbounded if unset.
+      fail_fast (:obj:bool, optional): If True (default), the resulting
+        future resolves to the first failure and no new future is started
+        after it. Otherwise every element is run and the future resolves to
+        a Right holding the list of the Either of each element.
+
+    Returns:
+      function: A function taking f and returning a Future. If fail_fast is
+        True, the future holds the list of the unwrapped values.
+    """
+    arr = list(arr)
+    def run(f):
+      def start(cb):
+        state = {"next": 0, "done": 0, "slots": 0, "launching": False, "over": False}
+        results = [None] * len(arr)
+        lock = threading.Lock()
+        # Futures resolving synchronously would recurse through done()
+        # and launch(): only one thread launches at a time, in a loop, and
+        # the others hand it their free slots.
+        def launch(slots):
+          with lock:
+            state["slots"] += slots
+            if state["launching"]:
+              return
+            state["launching"] = True
+          while True:
+            with lock:
+              if state["over"] or not state["slots"] or state["next"] >= len(arr):
+                state["launching"] = False
+                return
+              state["slots"] -= 1
+              idx = state["next"]
+              state["next"] += 1
+            try:
+              future = f(arr[idx])
+            except Exception as err:
+              future = Future(lambda c, err=err: c(Left(err)))
+            future.subscribe(lambda value, idx=idx: done(idx, value))
+        def done(idx, value):
+          outcome = _outcome(value)
+          with lock:
+            if state["over"]:
+              return
+            results[idx] = outcome if not fail_fast else outcome.value
+            state["done"] += 1
+            failed = fail_fast and outcome.is_left
+            finished = failed or state["done"] == len(arr)
+            state["over"] = finished
+          if failed:
+            cb(outcome)
+          elif finished:
+            cb(Right(results))
+          else:
+            launch(1)
+        if not arr:
+          cb(Right([]))
+        launch(min(len(arr), max_concurrency or len(arr)))
+      return Future(start)
+    return run
+
+  # gather :: ([Future a], bool) -> Future [a]
+  def gather(futures, fail_fast=True):
+    """Combines already started futures into a future of their results.
+
+    See traverse_par for the meaning of fail_fast.
+    """
+    return Future.traverse_par(futures, fail_fast=fail_fast)(lambda future: future)
+
+  # as_completed :: ([Future a], float) -> Iterator Future a
+  def as_completed(futures, timeout=None):
+    """Yields futures as they resolve.
+
+    Args:
+      futures (iterable): The futures to wait for.
+      timeout (:obj:float, optional): Maximum number of seconds to wait for
+        the next future.
+
+    Yields:
+      Future: A resolved future, in order of completion.
+
+    Raises:
+      concurrent.futures.TimeoutError: If no future resolved within timeout.
+    """
+    futures = list(futures)
+    completed = queue.Queue()
+    for future in futures:
+      future.subscribe(lambda value, future=future: completed.put(future))
+    for _ in futures:
+      try:
+        yield completed.get(timeout=timeout)
+      except queue.Empty:
+        raise TimeoutError()
+
+  # result :: float -> Either err a
+  def result(self, timeout=None):
+    """Blocks until this future resolves and returns its value.
+
+    On a worker thread of the shared executor, the queued tasks are run
+    while waiting, instead of holding a worker that they may need. A task
+    run meanwhile may then delay the return beyond timeout.
+
+    Raises:
+      concurrent.futures.TimeoutError: If the future did not resolve within
+        timeout seconds.
+    """
+    executor = BoundedExecutor.current()
+    if executor is not None:
+      self.subscribe(lambda value: executor.wake())
+      if not executor.help_until(lambda: self.cache.defined, timeout):
+        raise TimeoutError()
+      return self.cache.value
+    resolved = threading.Event()
+    self.subscribe(lambda value: resolved.set())
+    if not resolved.wait(timeout):
+      raise TimeoutError()
+    return self.cache.value
+
   # callback :: Either err a -> void
+  # Subscribers run on the thread that resolves the future.
   def callback(self, value):
     self.semaphore.acquire()
     self.cache = Some(value)
-    while (len(self.subscribers) > 0):
-      sub = self.subscribers.pop(0)
-      t = threading.Thread(target=sub, args=[value])
-      t.start()
+    subscribers, self.subscribers = self.subscribers, []
     self.semaphore.release()
-  
+    for sub in subscribers:
+      try:
+        sub(value)
+      except Exception:
+        logging.getLogger(__name__).exception("Future subscriber failed")
+
   # subscribe :: (Either err a -> void) -> void
   def subscribe(self, subscriber):
     self.semaphore.acquire()
@@ -129,4 +413,13 @@ class Future(Monad):
       subscriber(self.cache.value)
     else:
       self.subscribers.append(subscriber)
-      self.semaphore.release()
\ No newline at end of file
+      self.semaphore.release()
+
+
+# _outcome :: Either err a -> Either err b
+# The Either describing the outcome of a future's value: its nested Either
+# for futures of Either, as returned by Resource, the value itself otherwise.
+def _outcome(value):
+  if not value.is_left and isinstance(value.value, Either):
+    return value.value
+  return value
@@ -0,0 +1,199 @@
+"""
+Gallipy - Python wrapper for the Gallica APIs
+Copyright (C) 2019  Bertrand Dumenieu
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+https://github.com/GeoHistoricalData/gallipy
+"""
+import os
+import sqlite3
+import threading
+from array import array
+from .alto import AltoPage
+
+try:
+    import numpy
+except ImportError:  # Optional, columns are then read as array.array
+    numpy = None
+
+__all__ = ['OcrStore', 'COLUMNS']
+
+# The numeric columns of an OcrStore: AltoPage attribute and array typecode.
+COLUMNS = (('hpos', 'f'), ('vpos', 'f'), ('widths', 'f'), ('heights', 'f'),
+           ('conf', 'f'), ('line', 'I'), ('block', 'I'))
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS pages (
+        ark TEXT NOT NULL,
+        view INTEGER NOT NULL,
+        row INTEGER NOT NULL,
+        nwords INTEGER NOT NULL,
+        words_offset INTEGER NOT NULL,
+        words_size INTEGER NOT NULL,
+        width REAL,
+        height REAL,
+        unit TEXT,
+        PRIMARY KEY (ark, view)
+    )
+"""
+
+
+class OcrStore:
+    """The words of many OCRized pages, stored column by column on disk.
+
+    A store is a directory holding one flat binary file per numeric column of
+    AltoPage (see COLUMNS), in native byte order, one row per word; the words
+    themselves in words.txt, one per line; and an SQLite index of the pages,
+    pages.sqlite, giving the ARK, view and rows of each page. Line and block
+    numbers are relative to their page.
+
+    Pages are appended: their columns are written first, then the page is
+    recorded in the index. A page absent from the index is therefore not
+    stored, and the rows it left behind after a crash are truncated the next
+    time the store is opened. An OcrStore is thread-safe.
+
+    Args:
+        path (str): The directory of the store. Created if it does not exist.
+    """
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, 'pages.sqlite'),
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(_SCHEMA)
+        self._rows, self._words_size = self._db.execute(
+            "SELECT COALESCE(MAX(row + nwords), 0), COALESCE(MAX(words_offset + words_size), 0)"
+            " FROM pages").fetchone()
+        self._files = {}
+        for name, typecode in COLUMNS + (('words', None),):
+            ostream = open(self._file_path(name), 'ab')
+            ostream.truncate(self._words_size if typecode is None
+                             else self._rows * array(typecode).itemsize)
+            self._files[name] = ostream
+
+    def add(self, ark, view, page):
+        """Appends a page to the store.
+
+        Args:
+            ark (str): The ARK of the document, usually its root.
+            view (int): The view of the page in the document.
+            page (AltoPage): The words of the page, see alto.parse_alto.
+
+        Returns:
+            int: The number of words of the page.
+        """
+        words = "".join(word.replace("\n", " ") + "\n" for word in page.words).encode("utf-8")
+        with self._lock:
+            for name, _ in COLUMNS:
+                getattr(page, name).tofile(self._files[name])
+            self._files["words"].write(words)
+            for ostream in self._files.values():
+                ostream.flush()
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (ark, view, self._rows, len(page), self._words_size, len(words),
+                 page.width, page.height, page.unit))
+            self._rows += len(page)
+            self._words_size += len(words)
+        return len(page)
+
+    def views(self, ark):
+        """The set of the views of a document already in the store."""
+        with self._lock:
+            return {row[0] for row in self._db.execute(
+                "SELECT view FROM pages WHERE ark = ?", (ark,))}
+
+    def pages(self):
+        """The pages of the store, in the order of their rows.
+
+        Returns:
+            list: (ark, view, first row, number of words) tuples.
+        """
+        with self._lock:
+            return self._db.execute(
+                "SELECT ark, view, row, nwords FROM pages ORDER BY row").fetchall()
+
+    def page(self, ark, view):
+        """Reads a page back from the store.
+
+        Returns:
+            AltoPage: The words of the page, without the IDs of its lines and
+                blocks. None if the page is not in the store.
+        """
+        with self._lock:
+            entry = self._db.execute(
+                "SELECT row, nwords, words_offset, words_size, width, height, unit FROM pages"
+                " WHERE ark = ? AND view = ?", (ark, view)).fetchone()
+        if entry is None:
+            return None
+        row, nwords, words_offset, words_size, width, height, unit = entry
+        page = AltoPage()
+        page.width, page.height, page.unit = width, height, unit
+        for name, typecode in COLUMNS:
+            column = getattr(page, name)
+            with open(self._file_path(name), 'rb') as istream:
+                istream.seek(row * column.itemsize)
+                column.fromfile(istream, nwords)
+        with open(self._file_path("words"), 'rb') as istream:
+            istream.seek(words_offset)
+            page.words = istream.read(words_size).decode("utf-8").split("\n")[:-1]
+        return page
+
+    def column(self, name):
+        """A whole numeric column of the store, one value per word.
+
+        Args:
+            name (str): One of the names of COLUMNS, e.g. 'hpos' or 'conf'.
+
+        Returns:
+            numpy.memmap or array.array: The column, memory-mapped read-only
+                if numpy is installed, otherwise read in an array.
+        """
+        typecode = dict(COLUMNS)[name]
+        with self._lock:
+            rows = self._rows
+        if numpy is not None:
+            if not rows:
+                return numpy.empty(0, typecode)
+            return numpy.memmap(self._file_path(name), typecode, 'r', shape=(rows,))
+        column = array(typecode)
+        with open(self._file_path(name), 'rb') as istream:
+            column.fromfile(istream, rows)
+        return column
+
+    def __len__(self):
+        """The number of words of the store."""
+        with self._lock:
+            return self._rows
+
+    def close(self):
+        """Closes the files and the index of the store."""
+        with self._lock:
+            for ostream in self._files.values():
+                ostream.close()
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _file_path(self, name):
+        return os.path.join(self.path, name + ('.txt' if name == 'words' else '.bin'))
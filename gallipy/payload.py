@@ -0,0 +1,174 @@
+"""
+Gallipy - Python wrapper for the Gallica APIs
+Copyright (C) 2019  Bertrand Dumenieu
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+https://github.com/GeoHistoricalData/gallipy
+"""
+import hashlib
+import io
+import mmap
+import tempfile
+
+__all__ = ['Payload', 'SPILL_THRESHOLD']
+
+# Payloads larger than this are spilled to a temporary file and memory-mapped.
+SPILL_THRESHOLD = 8 * 2**20
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class Payload:
+    """Binary data of a response, exposed as a read-only memoryview.
+
+    Small payloads live in a single buffer in memory. Larger ones are
+    written to an anonymous temporary file while they are received, then
+    memory-mapped: the operating system pages them in on demand and they
+    never occupy the Python heap. In both cases, slicing payload.view or
+    reading payload.open() does not copy the whole payload.
+
+    A Payload holds a buffer, and possibly a file, until it is closed. Use
+    it as a context manager, or call close() once done with it.
+    """
+
+    def __init__(self, view, mapping=None, file=None):
+        self._view = view
+        self._mapping = mapping
+        self._file = file
+
+    @staticmethod
+    def from_bytes(data):
+        """A Payload holding data, a bytes-like object, without copying it."""
+        return Payload(memoryview(data).cast('B').toreadonly())
+
+    @staticmethod
+    def from_stream(istream, spill_threshold=SPILL_THRESHOLD, chunk_size=_CHUNK_SIZE):
+        """Reads a binary stream to its end into a Payload.
+
+        Args:
+            istream (file-like): A binary stream, e.g. an HTTP response.
+            spill_threshold (:obj:int, optional): Size in bytes beyond which
+                the payload is spilled to a temporary file. Defaults to
+                SPILL_THRESHOLD.
+            chunk_size (:obj:int, optional): Size in bytes of the reads.
+
+        Returns:
+            Payload: The data of istream.
+        """
+        buffer = bytearray()
+        chunk = istream.read(chunk_size)
+        while chunk and len(buffer) + len(chunk) <= spill_threshold:
+            buffer += chunk
+            chunk = istream.read(chunk_size)
+        if not chunk:
+            return Payload(memoryview(buffer).toreadonly())
+        spill = tempfile.TemporaryFile()
+        try:
+            spill.write(buffer)
+            del buffer
+            while chunk:
+                spill.write(chunk)
+                chunk = istream.read(chunk_size)
+            spill.flush()
+            mapping = mmap.mmap(spill.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            spill.close()
+            raise
+        return Payload(memoryview(mapping), mapping, spill)
+
+    @property
+    def view(self):
+        """memoryview: The data, read-only."""
+        if self._view is None:
+            raise ValueError("I/O operation on closed Payload")
+        return self._view
+
+    @property
+    def spilled(self):
+        """bool: Whether the data is memory-mapped from a temporary file."""
+        return self._mapping is not None
+
+    def __len__(self):
+        return self.view.nbytes
+
+    def tobytes(self):
+        """A copy of the data in a bytes object."""
+        return self.view.tobytes()
+
+    def open(self):
+        """A seekable binary file-like object reading the data, e.g. for a
+        PDF or image library. It reads slices of the view, not a copy."""
+        return io.BufferedReader(_ViewReader(self.view))
+
+    def digest(self, algorithm='sha256'):
+        """The hexadecimal digest of the data, computed without copying it."""
+        return hashlib.new(algorithm, self.view).hexdigest()
+
+    def close(self):
+        """Releases the buffer, or unmaps and deletes the temporary file.
+
+        Slices of view taken before must not be used afterwards.
+        """
+        view, self._view = self._view, None
+        if view is not None:
+            view.release()
+        if self._mapping is not None:
+            try:
+                self._mapping.close()
+            except BufferError:  # A slice of the view is still alive
+                pass
+            self._file.close()
+            self._mapping = self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        state = "closed" if self._view is None else "{} bytes{}".format(
+            len(self), ", spilled" if self.spilled else "")
+        return "Payload({})".format(state)
+
+
+class _ViewReader(io.RawIOBase):
+    """A raw, seekable binary stream reading a memoryview."""
+
+    def __init__(self, view):
+        super().__init__()
+        self._view = view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._view[self._pos:self._pos + len(b)]
+        n = data.nbytes
+        memoryview(b).cast('B')[:n] = data
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        start = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._view.nbytes}[whence]
+        self._pos = max(0, start + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
@@ -0,0 +1,147 @@
+"""
+Gallipy - Python wrapper for the Gallica APIs
+Copyright (C) 2019  Bertrand Dumenieu
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+https://github.com/GeoHistoricalData/gallipy
+"""
+import asyncio
+import json
+import threading
+import time
+import urllib.parse
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+__all__ = ['RateLimiter', 'DEFAULT_RATES', 'service_of']
+
+# Requests per second and burst size of each kind of request. 'services' are
+# the metadata services (Pagination, OAIRecord, Issues...), 'iiif' the IIIF
+# Image API and 'content' everything else, i.e. PDFs, texts and previews.
+# '*' bounds all the requests together.
+DEFAULT_RATES = {
+    "services": (5, 10),
+    "iiif": (5, 10),
+    "content": (1, 2),
+}
+
+
+def service_of(url):
+    """The kind of request of url: 'services', 'iiif' or 'content'."""
+    path = urllib.parse.urlsplit(url).path
+    if path.startswith("/services/"):
+        return "services"
+    if path.startswith("/iiif/"):
+        return "iiif"
+    return "content"
+
+
+class RateLimiter:
+    """Token buckets bounding the rate of the requests sent to Gallica.
+
+    Each kind of request (see service_of) has its own bucket, refilled at a
+    number of tokens per second up to a burst size. A request takes a token
+    from its bucket and from the '*' bucket, if any, and waits until they are
+    available. Kinds of request without a bucket are not limited.
+
+    A RateLimiter is thread-safe. If path is set, the state of the buckets is
+    kept in this file, locked with fcntl.flock, so that every process using
+    the same path shares the same limits. This requires a Unix system.
+
+    Args:
+        rates (:obj:dict, optional): (requests per second, burst) per kind of
+            request, overriding DEFAULT_RATES. Set the rate of a kind of
+            request to None to stop limiting it.
+        path (:obj:str, optional): A file shared with other processes.
+    """
+
+    def __init__(self, rates=None, path=None):
+        self.rates = dict(DEFAULT_RATES)
+        self.rates.update(rates or {})
+        self.rates = {name: rate for name, rate in self.rates.items() if rate}
+        if path and fcntl is None:
+            raise RuntimeError("Sharing a RateLimiter across processes requires fcntl")
+        self.path = path
+        self._lock = threading.Lock()
+        self._buckets = {}  # name -> [tokens, time]
+        # The clocks of several processes must agree, a monotonic clock does not
+        self._clock = time.time if path else time.monotonic
+
+    def reserve(self, url):
+        """Takes the tokens of a request to url, available now or later.
+
+        Returns:
+            float: How long in seconds the request must wait for them.
+        """
+        names = [name for name in ("*", service_of(url)) if name in self.rates]
+        if not names:
+            return 0.0
+        with self._lock:
+            if not self.path:
+                return self._take(self._buckets, names)
+            with open(self.path, "a+") as shared:
+                fcntl.flock(shared, fcntl.LOCK_EX)
+                try:
+                    shared.seek(0)
+                    try:
+                        buckets = json.loads(shared.read() or "{}")
+                    except ValueError:
+                        buckets = {}
+                    delay = self._take(buckets, names)
+                    shared.seek(0)
+                    shared.truncate()
+                    shared.write(json.dumps(buckets))
+                    shared.flush()
+                finally:
+                    fcntl.flock(shared, fcntl.LOCK_UN)
+            return delay
+
+    def wait(self, url):
+        """Blocks until a request to url is allowed."""
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self, url):
+        """Waits until a request to url is allowed, without blocking the loop.
+
+        A shared file is locked and read in the default executor of the loop.
+        """
+        if self.path:
+            loop = asyncio.get_event_loop()
+            delay = await loop.run_in_executor(None, self.reserve, url)
+        else:
+            delay = self.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _take(self, buckets, names):
+        """Takes one token from the buckets names, refilled up to now.
+
+        A bucket goes below zero when tokens are taken in advance: later
+        requests then wait for it to be refilled.
+        """
+        now = self._clock()
+        delay = 0.0
+        for name in names:
+            rate, burst = self.rates[name]
+            tokens, last = buckets.get(name, (burst, now))
+            tokens = min(burst, tokens + max(0.0, now - last) * rate) - 1
+            buckets[name] = [tokens, now]
+            delay = max(delay, -tokens / rate)
+        return delay
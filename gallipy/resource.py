@@ -1,8 +1,17 @@
-from xmltodict import parse as parsexmltodict
+import collections
+import itertools
 from . import helpers as h
 from .monadic import Left, Future
 from .ark import Ark
+from .transport import default_transport
+from .cache import default_memo
+from .tiles import fetch_tiled, fetch_tiled_async
+from .harvest import harvest_previews, harvest_previews_async
+from .alto import parse_alto_payload
+from . import models
 
+# Number of hits of a ContentSearch result set.
+_RESULTS_PER_SET = 10
 
 class Resource():
     """Class Resource is the entry point to the Document and IIIF APIs.
@@ -24,16 +33,25 @@ class Resource():
 
     Args:
         ark (str or Ark): The ARK of  this resource.
+        transport (:obj:Transport, optional): The pool of HTTP connections used
+            to query Gallica. Defaults to a Transport shared by all resources.
+        cache (:obj:Cache, optional): A persistent cache of metadata responses.
+            See gallipy.cache.Cache.
+        memo (:obj:Memo, optional): The in-memory memo of the metadata looked
+            up by content_sync and iiif_data_sync. Defaults to a Memo shared by
+            all resources.
 
     Attributes:
         ark (Ark): The ark object of this resource.
+        transport (Transport): The Transport of this resource.
+        cache (Cache): The cache of this resource, or None.
 
     Raises:
         ValueError: If ark is neither a string or an Ark object, or if the
           parsing failed.
     """
 
-    def __init__(self, ark):
+    def __init__(self, ark, transport=None, cache=None, memo=None):
       if isinstance(ark, Ark):
         self._ark = ark
       elif isinstance(ark,str):
@@ -43,6 +61,9 @@ class Resource():
         self._ark = either.value
       else:
         raise ValueError("ark must be of type Ark or str.")
+      self._transport = transport or default_transport()
+      self._cache = cache
+      self._memo = memo or default_memo()
 
     @property
     def ark(self):
@@ -52,11 +73,27 @@ class Resource():
     def arkid(self):
       return self.ark.arkid
 
+    @property
+    def transport(self):
+      return self._transport
+
+    @property
+    def cache(self):
+      return self._cache
+
+    @property
+    def memo(self):
+      return self._memo
+
+    def invalidate_memo(self):
+      """Forgets the memoized metadata of this resource's document."""
+      self.memo.invalidate(str(self.ark.root))
+
     # ---
     # ASYNCHRONOUS METHODS
     # ---
 
-    def issues(self, year=''):
+    def issues(self, year='', typed=False):
         """Fetches metadata about the issues of a periodical journal (Async version). 
 
         The Document API service Issues retrieves metadata about a periodical journal.
@@ -66,47 +103,54 @@ class Resource():
 
         Args:
             year (:obj:int, optional): The year for which to retrieve the issues metadata.
+            typed (:obj:bool, optional): See Resource.issues_sync.
 
         Returns:
             Future: A Future object that will holds an Either object if it resolved.
                 This Either will hold the fetched data (Right) or an Exception (Left).
                 For more details, see Resource.issues_sync.
         """
-        return Future.asyn(lambda: self.issues_sync(year))
+        return Future.asyn(lambda: self.issues_sync(year, typed))
 
-    def oairecord(self):
+    def oairecord(self, typed=False):
         """Retrieves the OAI record of a document (Async version). 
 
         The Document API service OAIRecord retrieves the OAI record of a document.
         Qualifiers are ignored.
 
+        Args:
+            typed (:obj:bool, optional): See Resource.oairecord_sync.
+
         Returns:
             Future: A Future object that will holds an Either object if it resolved.
                 representation of the metadata.
                 This Either will hold the fetched data (Right) or an Exception (Left).
                 For more details, see Resource.oairecord_sync.
         """
-        return Future.asyn(self.oairecord_sync)
+        return Future.asyn(lambda: self.oairecord_sync(typed))
 
-    def pagination(self):
+    def pagination(self, typed=False):
         """Fetches paging metadata of a resource (Async version).
 
         The Document API service Pagination retrieves metadata about the paging
         of a document.
         Qualifiers are ignored.
 
+        Args:
+            typed (:obj:bool, optional): See Resource.pagination_sync.
+
         Returns:
             Future: A Future object that will holds an Either object if it resolved.
                 representation of the metadata.
                 This Either will hold the fetched data (Right) or an Exception (Left).
                 For more details, see Resource.pagination_sync.
         """
-        return Future.asyn(self.pagination_sync)
+        return Future.asyn(lambda: self.pagination_sync(typed))
 
-    def image_preview(self, resolution='thumbnail', view=1):
+    def image_preview(self, resolution='thumbnail', view=1, payload=False):
       """
       """
-      l = lambda: self.image_preview_sync(resolution, view)
+      l = lambda: self.image_preview_sync(resolution, view, payload)
       return Future.asyn(l)
 
     def fulltext_search(self, query='', view=1, results_per_set=10):
@@ -120,54 +164,89 @@ class Resource():
       """
       return Future.asyn(self.toc_sync)
 
-    def content(self, startview=None, nviews=None, mode='pdf'):
+    def content(self, startview=None, nviews=None, mode='pdf', payload=False):
+      """
+      """
+      l = lambda: self.content_sync(startview, nviews, mode, payload)
+      return Future.asyn(l)
+
+    def ocr_data(self, view, payload=False):
       """
       """
-      l = lambda: self.content_sync(startview, nviews, mode)
+      l = lambda: self.ocr_data_sync(view, payload)
       return Future.asyn(l)
 
-    def ocr_data(self, view):
+    def ocr_page(self, view):
       """
       """
-      l = lambda: self.ocr_data_sync(view)
+      l = lambda: self.ocr_page_sync(view)
       return Future.asyn(l)
 
-    def iiif_info(self, view=''):
+    def iiif_info(self, view='', typed=False):
       """
       """
-      l = lambda: self.iiif_info_sync(image)
+      l = lambda: self.iiif_info_sync(view, typed)
       return Future.asyn(l)
 
-    def iiif_data(self, view='', region=None, size='full', rotation=0, quality='native', imformat='png'):
+    def iiif_data(self, view='', region=None, size='full', rotation=0, quality='native', imformat='png', payload=False):
       """
       """
-      l = lambda: self.iiif_data_sync(image, region, size, rotation, quality, imformat)
+      l = lambda: self.iiif_data_sync(view, region, size, rotation, quality, imformat, payload)
+      return Future.asyn(l)
+
+    def image_previews(self, dest, resolution='thumbnail', views=None, max_concurrency=8):
+      """
+      """
+      return harvest_previews_async(self, dest, resolution, views, max_concurrency)
+
+    def iiif_tiled(self, dest, view=1, scale_factor=1, quality='native', imformat='jpg', max_concurrency=8):
+      """
+      """
+      return fetch_tiled_async(self, dest, view, scale_factor, quality, imformat,
+                               max_concurrency=max_concurrency)
+
+    def content_to_file(self, dest, startview=1, nviews=None, mode='pdf', resume=False):
+      """Async version of content_to_file_sync."""
+      return Future.asyn(lambda: self.content_to_file_sync(dest, startview, nviews, mode, resume))
+
+    def image_preview_to_file(self, dest, resolution='thumbnail', view=1):
+      """Async version of image_preview_to_file_sync."""
+      return Future.asyn(lambda: self.image_preview_to_file_sync(dest, resolution, view))
+
+    def iiif_data_to_file(self, dest, view=1, region=None, size='full', rotation=0, quality='native', imformat='png'):
+      """Async version of iiif_data_to_file_sync."""
+      l = lambda: self.iiif_data_to_file_sync(dest, view, region, size, rotation, quality, imformat)
       return Future.asyn(l)
 
     # ---
     # SYNCHRONOUS METHODS
     # ---
 
-    def oairecord_sync(self):
+    def oairecord_sync(self, typed=False):
         """Retrieves the OAI record of a document (Sync version). 
 
         Wraps Document API service 'OAIRecord'.
         The Document API service OAIRecord retrieves the OAI record of a document.
         Qualifiers are ignored.
 
+        Args:
+            typed (:obj:bool, optional): Return a models.OAIRecord instead of
+                an OrderedDict. Defaults to False.
+
         Returns:
             Either[Exception OrderedDict]: A Right object containing an OrderedDict
                 representation of the metadata in case of success.
                 Otherwise, a Left object containing an Exception.
         """
         try:
-            url_parts = {"query": {"ark": self.ark.name }}
-            url = h.build_service_url(url_parts, service_name="OAIRecord")
-            return h.fetch_xml_html(url).map(parsexmltodict)
+            if typed:
+                return h.fetch(self._oairecord_url(), **self._fetch_opts("OAIRecord")).flat_map(
+                    models.parse_oairecord)
+            return h.fetch_xml(self._oairecord_url(), **self._fetch_opts("OAIRecord"))
         except Exception as ex:
             return Left(ex)
 
-    def issues_sync(self, year=''):
+    def issues_sync(self, year='', typed=False):
         """Fetches metadata about the issues of a periodical journal (Sync version). 
 
         Wraps Document API service 'Issues'.
@@ -178,6 +257,8 @@ class Resource():
         Args:
             year (:obj:int, optional): The year for which to retrieve
                 the issues metadata.
+            typed (:obj:bool, optional): Return a models.Issues, with the
+                dates of the issues, instead of an OrderedDict. Defaults to False.
         
         Returns:
             Either[Exception OrderedDict]: If fetch is successful, a Right object
@@ -185,15 +266,14 @@ class Resource():
                 Otherwise, a Left object containing an Exception.
         """
         try:  # Try/catch because Ark(...) can throw an exception.
-            parts = self.ark.arkid.parts
-            parts['qualifier'] = 'date'  # Qualifier must be 'date'
-            url_parts = {"query":{"ark":Ark(**parts), "date":year}}
-            url = h.build_service_url(url_parts, service_name="Issues")
-            return h.fetch_xml_html(url).map(parsexmltodict)
+            if typed:
+                return h.fetch(self._issues_url(year), **self._fetch_opts("Issues")).flat_map(
+                    models.parse_issues)
+            return h.fetch_xml(self._issues_url(year), **self._fetch_opts("Issues"))
         except Exception as ex:
             return Left(ex)
 
-    def pagination_sync(self):
+    def pagination_sync(self, typed=False):
         """Fetches paging metadata of a resource (Sync version).
 
         Wraps Document API service 'Pagination'.
@@ -201,16 +281,22 @@ class Resource():
         of a document.
         Qualifiers are ignored.
 
+        Args:
+            typed (:obj:bool, optional): Return a models.Pagination, built
+                while the response is parsed, instead of an OrderedDict. It
+                is smaller and faster to walk. Defaults to False.
+
         Returns:
             Either[Exception OrderedDict]: If fetch is successful, a Right object
                 containing an OrderedDict representation of the metadata.
                 Otherwise, a Left object containing an Exception.
         """
-        url_parts = {"query": {"ark": self.ark.name}}
-        url = h.build_service_url(url_parts, service_name="Pagination")
-        return h.fetch_xml_html(url).map(parsexmltodict)
+        if typed:
+            return h.fetch(self._pagination_url(), **self._fetch_opts("Pagination")).flat_map(
+                models.parse_pagination)
+        return h.fetch_xml(self._pagination_url(), **self._fetch_opts("Pagination"))
 
-    def image_preview_sync(self, resolution='thumbnail', view=1):
+    def image_preview_sync(self, resolution='thumbnail', view=1, payload=False):
         """Retrieves the preview image of a view in a resource (Sync version).
 
         Wraps Document API method 'Image précalculée'.
@@ -221,14 +307,18 @@ class Resource():
             resolution (:obj:str, optional): One of 'thumbnail', 'lowres', 'medres', 'highres'.
                 Defaults to 'thumbnail'. 
             age (:obj:int, optional): The view to get the preview from. Defaults to 1.
+            payload (:obj:bool, optional): Return a payload.Payload instead
+                of bytes. See helpers.fetch_payload. Defaults to False.
 
         Returns:
             Either[Exception, Unicode]: If successful, a Right object
                 containing the data of the preview image in JPEG format.
                 Otherwise, a Left object containing an Exception.
         """
-        url = h.build_base_url({"path":'{}/f{}.{}'.format(self.ark.root, view, resolution)})
-        return h.fetch(url)
+        url = self._image_preview_url(resolution, view)
+        if payload:
+            return h.fetch_payload(url, self.transport)
+        return h.fetch(url, **self._fetch_opts("preview"))
 
     def fulltext_search_sync(self, query, view=1, results_per_set=10):
         """Performs a full-text search in a plain-text Resource (sync version).
@@ -258,9 +348,54 @@ class Resource():
                 containing the set of results as an OrderedDict.
                 Otherwise, a Left object containing an Exception.
         """
-        urlparts = {"query": {"ark": self.ark.name, "query": query, "startResult": results_per_set, "page":view}}
-        url = h.build_service_url(urlparts, service_name="ContentSearch")
-        return h.fetch_xml_html(url).map(parsexmltodict)
+        url = self._fulltext_search_url(query, view, results_per_set)
+        return h.fetch_xml(url, **self._fetch_opts("ContentSearch"))
+
+    def fulltext_search_iter(self, query, view=None, prefetch=4):
+        """Iterates over every hit of a full-text search in a Resource.
+
+        ContentSearch returns the hits by sets of 10. The first set gives
+        the total number of hits; the next prefetch sets are then fetched in
+        the background while the hits of the current one are consumed, so an
+        exhaustive search takes about as long as its slowest request. No new
+        request is sent once the caller stops iterating.
+        Qualifiers are ignored.
+
+        Args:
+            query (str): The words to search for in the text. See
+                fulltext_search_sync.
+            view (:obj:int, optional): The view in wich to search. If unset,
+                query is performed on all views.
+            prefetch (:obj:int, optional): Maximum number of result sets
+                fetched ahead. Defaults to 4.
+
+        Yields:
+            OrderedDict: The hits, i.e. the 'item' elements of the result sets, in order.
+
+        Raises:
+            Exception: The error of the first result set that failed.
+        """
+        fetch = lambda start: h.fetch_xml(self._fulltext_search_url(query, view, start),
+                                          **self._fetch_opts("ContentSearch"))
+        results = fetch(1)
+        if results.is_left:
+            raise results.value
+        starts = _search_starts(results.value)
+        pending = collections.deque()
+        items = _search_items(results.value)
+        while items:
+            for start in starts:
+                pending.append(Future.asyn(lambda start=start: fetch(start)))
+                if len(pending) >= max(prefetch, 1):
+                    break
+            for item in items:
+                yield item
+            if not pending:
+                return
+            results = pending.popleft().result().flat_map(lambda either: either)
+            if results.is_left:
+                raise results.value
+            items = _search_items(results.value)
 
     def toc_sync(self):
         """Retrieves the table of content of a resource as a HTML document.
@@ -272,44 +407,37 @@ class Resource():
             Either: If successful, a Right object containing the HTML ToC.
                 Otherwise, a Left object containing an Exception.
         """    
-        urlparts = {"query": {"ark": self.ark.name}}
-        url = h.build_service_url(urlparts, service_name="Toc")    
-        return h.fetch_xml_html(url, 'html.parser')
+        return h.fetch_xml_html(self._toc_url(), 'html.parser', **self._fetch_opts("Toc"))
 
-    def content_sync(self, startview=1, nviews=None, mode='pdf'):
+    def content_sync(self, startview=1, nviews=None, mode='pdf', payload=False):
         """Retrieves the content of a document.
 
         Wraps Document API method 'Texte Brut' and 'PDF'.
         self.qualifier is ignored by content_sync.
         If nviews is not defined, the wholed document is downloaded using
-        metadata retrieved by pagination_sync. 
+        metadata retrieved by pagination_sync, once per document: the number
+        of views is memoized. 
         Qualifiers are ignored.
         
         Args:
             startview (:obj:int, optional): The starting view to retrieve. Default: 1
             nviews (:obj:int, optional): The number of view to retrieve.
             mode (:obj:int, optional): One of {'pdf, 'texteBrut'}. Default: 'pdf'
+            payload (:obj:bool, optional): Return the raw response in a
+                payload.Payload, even in mode 'texteBrut'. See
+                helpers.fetch_payload. Default: False
         
         Returns:
             Either[Exception Unicode]: The Unicode data of the content.
                 Otherwise, a Left object containing an Exception.
         """
-        _nviews = 1
-        if not nviews:
-          either = self.pagination_sync()
-          if not either.is_left:
-              _nviews = int(either.value.get('livre').get('structure').get('nbVueImages'))
-              _nviews = _nviews-startview+1
-        else:
-          _nviews = nviews
-        pattern = '{}/f{}n{}.{}'
-        arkstr =pattern.format(self.ark.root, startview, _nviews, mode)
-        urlparts = {"path": arkstr}
-        url = h.build_base_url(urlparts)
-        print(url)
-        return h.fetch(url) if mode =='pdf' else h.fetch_xml_html(url, 'html.parser')
-
-    def ocr_data_sync(self, view):
+        url = self._content_url(startview, self._content_nviews(startview, nviews), mode)
+        if payload:
+            return h.fetch_payload(url, self.transport)
+        opts = self._fetch_opts("content")
+        return h.fetch(url, **opts) if mode =='pdf' else h.fetch_xml_html(url, 'html.parser', **opts)
+
+    def ocr_data_sync(self, view, payload=False):
         """Retrieves the OCR data from a ocrized document.
      
         The OCR data is retrienve in XML ALTO and transfomed into an OrderedDict.
@@ -317,30 +445,51 @@ class Resource():
 
         Args:
             view (int): View number from wich to retrieve the OCR data.
+            payload (:obj:bool, optional): Return a payload.Payload instead
+                of bytes. See helpers.fetch_payload. Defaults to False.
 
         Returns:
             Either[Exception OrderedDict]: an Either object containing the OCR data in XML ALTO. 
                 Otherwise, a Left object containing an Exception.
         """
-        query = {"O":self.ark.name, "E":"ALTO", "Deb":view }
-        urlparts = {"path": 'RequestDigitalElement', "query":query }
-        url = h.build_base_url(urlparts)
-        return h.fetch(url)
+        if payload:
+            return h.fetch_payload(self._ocr_data_url(view), self.transport)
+        return h.fetch(self._ocr_data_url(view), **self._fetch_opts("ALTO"))
+
+    def ocr_page_sync(self, view):
+        """Retrieves the words of an ocrized view with their coordinates.
+
+        The ALTO document of the view is streamed into an alto.AltoPage, a
+        compact columnar structure, without building its tree in memory.
+        Qualifiers are ignored.
+
+        Args:
+            view (int): View number from wich to retrieve the OCR data.
+
+        Returns:
+            Either[Exception AltoPage]: The words of the view.
+                Otherwise, a Left object containing an Exception.
+        """
+        return self.ocr_data_sync(view, payload=True).flat_map(parse_alto_payload)
 
-    def iiif_info_sync(self, view=1):
+    def iiif_info_sync(self, view=1, typed=False):
       """Retrieve IIIF metadata of a resource.
 
       Qualifiers are ignored.
+
+      Args:
+          view (:obj:int, optional): The view whose image metadata to retrieve.
+              If falsy, the IIIF manifest of the document is retrieved instead.
+          typed (:obj:bool, optional): Return a models.ImageInfo, or a
+              models.Manifest, instead of a dict. Defaults to False.
       """
-      if view:
-        path = '{}/{}/f{}/{}'.format('iiif', self.ark.root, view, 'info.json')
-      else:
-        # No image param : user wants the whole document infos
-        path = '{}/{}/{}'.format('iiif', self.ark.root, 'manifest.json')
-      url = h.build_base_url({"path":path})
-      return h.fetch_json(url).map(dict)
+      service = "info" if view else "manifest"
+      if typed:
+        parse = models.parse_image_info if view else models.parse_manifest
+        return h.fetch(self._iiif_info_url(view), **self._fetch_opts(service)).flat_map(parse)
+      return h.fetch_json(self._iiif_info_url(view), **self._fetch_opts(service)).map(dict)
 
-    def iiif_data_sync(self, view=1, region=None, size='full', rotation=0, quality='native', imformat='png'):
+    def iiif_data_sync(self, view=1, region=None, size='full', rotation=0, quality='native', imformat='png', payload=False):
       """Retrieve image data from a resource using the IIIF API.
 
       Qualifiers are ignored.
@@ -351,7 +500,8 @@ class Resource():
               image to extract as any 4-int iterable object :
               (lower left pixel, lower left pixel, width, height).
               If no region is provided, iiif_info_sync will be called to determine
-              the size of the image. The entire image will be retrieved.
+              the size of the image, once per view as the size is memoized.
+              The entire image will be retrieved.
               If metadata retrieval fails, a window of size 1px will be extacted.
           size (:obj:str, optional): The size of the image to retrieve. Defaults to 'full'.
           rotation (:obj:int, optional): Rotate the image by an angle in degrees.
@@ -360,20 +510,225 @@ class Resource():
               to 'native'.
           imformat (:obj:str, optional): The returned data will be encoded for this format.
               Possible values are 'png', 'tif', 'jpg' and 'gif'. Defaults to 'png'.
+          payload (:obj:bool, optional): Return a payload.Payload instead of
+              bytes. See helpers.fetch_payload. Defaults to False.
 
       Returns:
           Either[Exception Unicode]: an Either object holding the image data, or an Exception. 
       """
-      # If no region is provided, get the image size using iiif_info_sync(view)
-      if not region:
-          info = self.iiif_info_sync(view)
-          width = 1 if info.is_left else info.value['width']
-          height = 1 if info.is_left else info.value['height']
-          region = (0, 0, width, height)
+      region = self._iiif_region(view, region)
+      url = self._iiif_data_url(view, region, size, rotation, quality, imformat)
+      if payload:
+        return h.fetch_payload(url, self.transport)
+      return h.fetch(url, **self._fetch_opts("iiif"))
+
+    def image_previews_sync(self, dest, resolution='thumbnail', views=None, max_concurrency=8):
+        """Retrieves the preview images of many views, by default all of them.
+
+        Previews are fetched concurrently and written to a directory or a zip
+        archive, skipping those already there. See harvest.harvest_previews.
+
+        Args:
+            dest (str): A directory, or a path ending with '.zip'.
+            resolution (:obj:str, optional): One of 'thumbnail', 'lowres', 'medres', 'highres'.
+                Defaults to 'thumbnail'.
+            views (:obj:iterable, optional): The views to retrieve. Defaults to
+                every view, counted with Pagination or the IIIF manifest.
+            max_concurrency (:obj:int, optional): Maximum number of previews
+                fetched at the same time. Defaults to 8.
+
+        Returns:
+            Either[Exception dict]: The number of previews 'fetched' and
+                'skipped' and the (view, Exception) that 'failed'.
+                Otherwise, a Left object containing an Exception.
+        """
+        return harvest_previews(self, dest, resolution, views, max_concurrency)
+
+    def iiif_tiled_sync(self, dest, view=1, scale_factor=1, quality='native', imformat='jpg', max_concurrency=8):
+      """Retrieve a large image tile by tile using the IIIF API.
+
+      The tiles advertised by iiif_info_sync(view) are fetched in parallel and
+      stitched on disk, into a numpy array if dest ends with '.npy', a TIFF
+      if it ends with '.tif', or an image file otherwise. See tiles.fetch_tiled.
+      Requires numpy and Pillow.
+
+      Args:
+          dest (str): Path of the stitched image.
+          view (:obj:int, optional): View number to retrieve as an image.
+          scale_factor (:obj:int, optional): Downscaling factor, one of those
+              advertised in the IIIF metadata of the image. Defaults to 1.
+          quality (:obj:str, optional): The quality of the tiles. Defaults
+              to 'native'.
+          imformat (:obj:str, optional): The format of the tiles. Defaults to 'jpg'.
+          max_concurrency (:obj:int, optional): Maximum number of tiles
+              fetched at the same time. Defaults to 8.
+
+      Returns:
+          Either[Exception str]: dest, or an Exception listing the tiles
+              that could not be retrieved.
+      """
+      return fetch_tiled(self, dest, view, scale_factor, quality, imformat,
+                         max_concurrency=max_concurrency)
+
+    def content_to_file_sync(self, dest, startview=1, nviews=None, mode='pdf', resume=False):
+        """Retrieves the content of a document and writes it to a file.
+
+        Same as content_sync, but the content is streamed to dest instead of
+        being loaded in memory, whatever its size.
+
+        Args:
+            dest (str or file-like): A path, or a binary file-like object open
+                for writing. See helpers.fetch_to_file.
+            startview (:obj:int, optional): The starting view to retrieve. Default: 1
+            nviews (:obj:int, optional): The number of view to retrieve.
+            mode (:obj:int, optional): One of {'pdf, 'texteBrut'}. Default: 'pdf'
+            resume (:obj:bool, optional): Resume an interrupted transfer to
+                the path dest. See helpers.fetch_to_file. Default: False
+
+        Returns:
+            Either[Exception str or file-like]: dest if successful.
+                Otherwise, a Left object containing an Exception.
+        """
+        url = self._content_url(startview, self._content_nviews(startview, nviews), mode)
+        return h.fetch_to_file(url, dest, self.transport, resume=resume)
+
+    def image_preview_to_file_sync(self, dest, resolution='thumbnail', view=1):
+        """Retrieves the preview image of a view and writes it to a file.
+
+        Same as image_preview_sync, but the image is streamed to dest.
+
+        Args:
+            dest (str or file-like): A path, or a binary file-like object open
+                for writing. See helpers.fetch_to_file.
+            resolution (:obj:str, optional): One of 'thumbnail', 'lowres', 'medres', 'highres'.
+                Defaults to 'thumbnail'.
+            view (:obj:int, optional): The view to get the preview from. Defaults to 1.
+
+        Returns:
+            Either[Exception str or file-like]: dest if successful.
+                Otherwise, a Left object containing an Exception.
+        """
+        return h.fetch_to_file(self._image_preview_url(resolution, view), dest, self.transport)
+
+    def iiif_data_to_file_sync(self, dest, view=1, region=None, size='full', rotation=0, quality='native', imformat='png'):
+      """Retrieve image data using the IIIF API and writes it to a file.
+
+      Same as iiif_data_sync, but the image is streamed to dest.
+
+      Args:
+          dest (str or file-like): A path, or a binary file-like object open
+              for writing. See helpers.fetch_to_file.
+          Other arguments: see iiif_data_sync.
+
+      Returns:
+          Either[Exception str or file-like]: dest if successful.
+              Otherwise, a Left object containing an Exception.
+      """
+      region = self._iiif_region(view, region)
+      url = self._iiif_data_url(view, region, size, rotation, quality, imformat)
+      return h.fetch_to_file(url, dest, self.transport)
+
+    def _content_nviews(self, startview, nviews):
+      """The number of views to retrieve from startview, nviews if it is set.
+
+      Otherwise, all the views up to the last one of the document. If the
+      number of views of the document is unknown, 1.
+      """
+      if nviews:
+        return nviews
+      either = self._memoized('nviews', lambda: self.pagination_sync().map(_nviews_from_pagination))
+      return 1 if either.is_left else either.value-startview+1
+
+    def _iiif_region(self, view, region):
+      """region if it is set, otherwise the whole image using iiif_info_sync(view)."""
+      if region:
+        return region
+      info = self._memoized(('size', view), lambda: self.iiif_info_sync(view).map(_image_size))
+      return (0, 0) + ((1, 1) if info.is_left else info.value)
+
+    def _memoized(self, name, compute):
+      """Looks up name in the memo of this resource's document, or computes it."""
+      return self.memo.get_or_compute((str(self.ark.root), name), compute)
+
+    def _fetch_opts(self, service):
+      """Keyword arguments of the helpers.fetch* functions for a service."""
+      return {"transport": self.transport, "cache": self.cache, "service": service}
+
+    # ---
+    # URL BUILDERS, shared with AsyncResource
+    # ---
+
+    def _oairecord_url(self):
+      url_parts = {"query": {"ark": self.ark.name }}
+      return h.build_service_url(url_parts, service_name="OAIRecord")
+
+    def _issues_url(self, year=''):
+      parts = self.ark.arkid.parts
+      parts['qualifier'] = 'date'  # Qualifier must be 'date'
+      url_parts = {"query":{"ark":Ark(**parts), "date":year}}
+      return h.build_service_url(url_parts, service_name="Issues")
+
+    def _pagination_url(self):
+      url_parts = {"query": {"ark": self.ark.name}}
+      return h.build_service_url(url_parts, service_name="Pagination")
+
+    def _image_preview_url(self, resolution='thumbnail', view=1):
+      return h.build_base_url({"path":'{}/f{}.{}'.format(self.ark.root, view, resolution)})
+
+    def _fulltext_search_url(self, query, view=1, results_per_set=10):
+      urlparts = {"query": {"ark": self.ark.name, "query": query, "startResult": results_per_set}}
+      if view is not None:
+        urlparts["query"]["page"] = view
+      return h.build_service_url(urlparts, service_name="ContentSearch")
 
+    def _toc_url(self):
+      urlparts = {"query": {"ark": self.ark.name}}
+      return h.build_service_url(urlparts, service_name="Toc")
+
+    def _content_url(self, startview, nviews, mode):
+      pattern = '{}/f{}n{}.{}'
+      arkstr = pattern.format(self.ark.root, startview, nviews, mode)
+      return h.build_base_url({"path": arkstr})
+
+    def _ocr_data_url(self, view):
+      query = {"O":self.ark.name, "E":"ALTO", "Deb":view }
+      urlparts = {"path": 'RequestDigitalElement', "query":query }
+      return h.build_base_url(urlparts)
+
+    def _iiif_info_url(self, view=1):
+      if view:
+        path = '{}/{}/f{}/{}'.format('iiif', self.ark.root, view, 'info.json')
+      else:
+        # No image param : user wants the whole document infos
+        path = '{}/{}/{}'.format('iiif', self.ark.root, 'manifest.json')
+      return h.build_base_url({"path":path})
+
+    def _iiif_data_url(self, view, region, size='full', rotation=0, quality='native', imformat='png'):
       region_str = ','.join(map(str, region))
       pattern = "iiif/{}/f{}/{}/{}/{}/{}.{}"
       path = pattern.format(self.ark.root, view, region_str, size, rotation, quality, imformat)
-      urlparts = {"path": path}  
-      url = h.build_base_url(urlparts)
-      return h.fetch(url)
\ No newline at end of file
+      return h.build_base_url({"path": path})
+
+
+def _nviews_from_pagination(pagination):
+    """Total number of views of a document, from its Pagination metadata."""
+    return int(pagination.get('livre').get('structure').get('nbVueImages'))
+
+def _search_items(results):
+    """The hits of a ContentSearch result set, as a list."""
+    items = (results.get('results') or {}).get('item') or []
+    return items if isinstance(items, list) else [items]
+
+def _search_starts(results):
+    """The startResult of the result sets following the first one.
+
+    Unbounded if the first set does not give the total number of hits.
+    """
+    count = (results.get('results') or {}).get('@countResults')
+    if count is None:
+        return itertools.count(_RESULTS_PER_SET + 1, _RESULTS_PER_SET)
+    return iter(range(_RESULTS_PER_SET + 1, int(count) + 1, _RESULTS_PER_SET))
+
+def _image_size(info):
+    """Width and height of an image, from its IIIF info.json."""
+    return (info['width'], info['height'])
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""
+Gallipy - Python wrapper for the Gallica APIs
+Copyright (C) 2019  Bertrand Dumenieu
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+https://github.com/GeoHistoricalData/gallipy
+"""
+import asyncio
+import email.utils
+import http.client
+import logging
+import random
+import socket
+import time
+import urllib.error
+
+__all__ = ['RetryPolicy', 'RETRYABLE_STATUSES']
+
+# HTTP statuses worth retrying: the server is overloaded, throttling us or
+# failed for a reason that has nothing to do with the request.
+RETRYABLE_STATUSES = frozenset((408, 425, 429, 500, 502, 503, 504))
+
+_RETRYABLE_ERRORS = (ConnectionError, socket.timeout, asyncio.TimeoutError,
+                     http.client.IncompleteRead, http.client.BadStatusLine,
+                     asyncio.IncompleteReadError)
+
+_logger = logging.getLogger(__name__)
+
+
+class RetryPolicy:
+    """When and how long to wait before sending a failed request again.
+
+    Timeouts, connection resets, incomplete responses and the HTTP statuses
+    in RETRYABLE_STATUSES are transient: the request is attempted again after
+    a delay growing exponentially with the number of attempts, with full
+    jitter so that concurrent clients do not retry in lockstep. A Retry-After
+    header sent with a 429 or 503 response overrides this delay. Any other
+    error, e.g. a 404 or an invalid URL, is raised at once.
+
+    A call never lasts longer than budget seconds plus the duration of its
+    last attempt: the policy gives up rather than sleeping past the budget.
+
+    Args:
+        max_attempts (:obj:int, optional): Maximum number of attempts per
+            call, the first one included. 1 disables retries. Default: 4
+        base_delay (:obj:float, optional): Maximum delay in seconds before
+            the second attempt, doubled at each attempt. Default: 0.5
+        max_delay (:obj:float, optional): Maximum delay in seconds between
+            two attempts, unless Retry-After asks for more. Default: 30
+        budget (:obj:float, optional): Total time in seconds allowed for a
+            call, delays included. Default: 120
+        jitter (:obj:bool, optional): Draw each delay uniformly between 0 and
+            its maximum. Default: True
+        statuses (:obj:iterable, optional): HTTP statuses to retry.
+            Default: RETRYABLE_STATUSES
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=30, budget=120,
+                 jitter=True, statuses=RETRYABLE_STATUSES):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+
+    def is_retryable(self, error):
+        """Whether error is transient, so that the request may succeed later."""
+        if isinstance(error, urllib.error.HTTPError):
+            return error.code in self.statuses
+        if isinstance(error, urllib.error.URLError) and isinstance(error.reason, BaseException):
+            return self.is_retryable(error.reason)
+        return isinstance(error, _RETRYABLE_ERRORS)
+
+    def backoff(self, attempt):
+        """The delay in seconds after the attempt-th failed attempt, from 1."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def delay(self, attempt, error):
+        """The delay before retrying after the attempt-th attempt failed with error.
+
+        Returns:
+            float: The delay in seconds, or None if error must not be retried.
+        """
+        if attempt >= self.max_attempts or not self.is_retryable(error):
+            return None
+        retry_after = _retry_after(error)
+        return self.backoff(attempt) if retry_after is None else retry_after
+
+    def call(self, f, *args, **kwargs):
+        """Calls f(*args, **kwargs) until it returns, following this policy.
+
+        Raises:
+            Exception: The error of the last attempt.
+        """
+        deadline = time.monotonic() + self.budget
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return f(*args, **kwargs)
+            except Exception as ex:
+                delay = self._next_delay(attempt, ex, deadline)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+
+    async def call_async(self, f, *args, **kwargs):
+        """Awaits f(*args, **kwargs) until it returns, following this policy.
+
+        Raises:
+            Exception: The error of the last attempt.
+        """
+        deadline = time.monotonic() + self.budget
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await f(*args, **kwargs)
+            except Exception as ex:
+                delay = self._next_delay(attempt, ex, deadline)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+
+    def _next_delay(self, attempt, error, deadline):
+        """The delay before the next attempt, or None to give up."""
+        delay = self.delay(attempt, error)
+        if delay is None or time.monotonic() + delay > deadline:
+            return None
+        _logger.debug("Attempt %d failed (%s), retrying in %.2fs", attempt, error, delay)
+        return delay
+
+
+def _retry_after(error):
+    """The delay in seconds asked by the Retry-After header of an HTTPError, if any."""
+    headers = getattr(error, "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
@@ -0,0 +1,262 @@
+"""
+Gallipy - Python wrapper for the Gallica APIs
+Copyright (C) 2019  Bertrand Dumenieu
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+https://github.com/GeoHistoricalData/gallipy
+"""
+import collections
+import html
+import re
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from .monadic import Either, Left
+
+__all__ = ['TextIndex', 'Hit', 'tokenize']
+
+_SCHEMA = ("""
+    CREATE TABLE IF NOT EXISTS units (
+        id INTEGER PRIMARY KEY,
+        ark TEXT NOT NULL,
+        view INTEGER NOT NULL,
+        ntokens INTEGER NOT NULL,
+        boxes BLOB,
+        UNIQUE (ark, view)
+    )
+""", """
+    CREATE TABLE IF NOT EXISTS postings (
+        term TEXT NOT NULL,
+        unit INTEGER NOT NULL,
+        positions BLOB NOT NULL,
+        PRIMARY KEY (term, unit)
+    ) WITHOUT ROWID
+""", "CREATE INDEX IF NOT EXISTS postings_unit ON postings (unit)")
+
+# A match: the document, the view (None for a whole text), the position of
+# the first token in the view, and the bounding boxes of the matched words
+# as (hpos, vpos, width, height) tuples, if the view came from ALTO.
+Hit = collections.namedtuple("Hit", ("ark", "view", "position", "boxes"))
+
+_TOKEN = re.compile(r"\w+")
+_COMBINING = re.compile("[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+_TAG = re.compile(r"<[^>]*>")
+# Elements whose content is not text, and comments, removed before the tags
+_HIDDEN = re.compile(r"<(script|style)\b[^>]*>.*?</\1\s*>|<!--.*?-->", re.IGNORECASE | re.DOTALL)
+_CLAUSE = re.compile(r'"([^"]*)"|([^\s,"]+)')
+
+
+def tokenize(text):
+    """The tokens of text: its words, case-folded and without diacritics."""
+    if not text.isascii():
+        text = _COMBINING.sub("", unicodedata.normalize('NFKD', text))
+    return _TOKEN.findall(text.casefold())
+
+
+class TextIndex:
+    """A local full-text index of documents, stored in a SQLite database.
+
+    The index records the positions of each token in each indexed text, so
+    that phrases are matched exactly. A text is a view of a document, e.g. an
+    AltoPage, whose word boxes are kept, or a whole document, e.g. the result
+    of Resource.content_sync(mode='texteBrut'). Texts are added or replaced
+    one at a time, at any time: the index grows with the harvested documents.
+
+    A TextIndex is thread-safe.
+
+    Args:
+        path (str): Path of the SQLite database. Created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+
+    def add_text(self, ark, text, view=None):
+        """Indexes a text, replacing its previous version if any.
+
+        Args:
+            ark (str): The ARK of the document, usually its root.
+            text (str or bytes): The text. Markup is ignored, as well as
+                scripts, styles and comments, so the HTML returned in mode
+                'texteBrut' can be given as is.
+            view (:obj:int, optional): The view of the text. Defaults to None,
+                the whole document.
+
+        Returns:
+            int: The number of tokens of the text.
+        """
+        if isinstance(text, (bytes, bytearray, memoryview)):
+            text = bytes(text).decode('utf-8', errors='replace')
+        tokens = tokenize(html.unescape(_TAG.sub(" ", _HIDDEN.sub(" ", text))))
+        self._add(ark, view or 0, tokens, None)
+        return len(tokens)
+
+    def add_page(self, ark, view, page):
+        """Indexes the words of a page with their boxes, replacing its
+        previous version if any.
+
+        Args:
+            ark (str): The ARK of the document, usually its root.
+            view (int): The view of the page.
+            page (AltoPage): Its words, see alto.parse_alto.
+
+        Returns:
+            int: The number of tokens of the page.
+        """
+        tokens, boxes = [], array('f')
+        for i, word in enumerate(page.words):
+            for token in tokenize(word):
+                tokens.append(token)
+                boxes.extend(page.box(i))
+        self._add(ark, view, tokens, boxes.tobytes())
+        return len(tokens)
+
+    def add_store(self, store):
+        """Indexes the pages of an OcrStore that are not indexed yet.
+
+        Returns:
+            int: The number of pages indexed.
+        """
+        indexed, count = {}, 0
+        for ark, view, _, _ in store.pages():
+            if ark not in indexed:
+                indexed[ark] = self.views(ark)
+            if view not in indexed[ark]:
+                self.add_page(ark, view, store.page(ark, view))
+                count += 1
+        return count
+
+    def views(self, ark):
+        """The set of the indexed views of a document, None for a whole text."""
+        with self._lock:
+            return {row[0] or None for row in self._db.execute(
+                "SELECT view FROM units WHERE ark = ?", (ark,))}
+
+    def remove(self, ark, view=None):
+        """Removes a text from the index, or every text of a document if
+        view is None."""
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            where, params = "ark = ?", (ark,)
+            if view is not None:
+                where, params = "ark = ? AND view = ?", (ark, view)
+            self._db.execute("DELETE FROM postings WHERE unit IN (SELECT id FROM units WHERE "
+                             + where + ")", params)
+            self._db.execute("DELETE FROM units WHERE " + where, params)
+
+    def search(self, query, ark=None, limit=None):
+        """Searches words and phrases in the indexed texts.
+
+        Phrases must be double quoted, e.g '"candidat à la présidence"'.
+        Words and phrases can be combined with commas or spaces: a text
+        matches if it contains any of them. Case and diacritics are ignored.
+
+        Args:
+            query (str): The words and phrases to search for.
+            ark (:obj:str, optional): Only search the texts of this document.
+            limit (:obj:int, optional): Maximum number of hits.
+
+        Returns:
+            Either[Exception list]: If successful, a Right object containing
+                the list of Hit, ordered by document, view and position.
+                Otherwise, a Left object containing an Exception.
+        """
+        try:
+            phrases = [tokenize(phrase if phrase else word)
+                       for phrase, word in _CLAUSE.findall(query)]
+            phrases = [phrase for phrase in phrases if phrase]
+            if not phrases:
+                raise ValueError("No word to search for in {!r}".format(query))
+            with self._lock:
+                matches = set()
+                for phrase in phrases:
+                    matches.update(self._match(phrase, ark))
+                units = {unit: self._db.execute(
+                    "SELECT ark, view, boxes FROM units WHERE id = ?", (unit,)).fetchone()
+                         for unit in {match[0] for match in matches}}
+            matches = sorted(matches, key=lambda m: (units[m[0]][:2], m[1]))[:limit]
+            return Either.pure([_hit(units[unit], start, length) for unit, start, length in matches])
+        except Exception as ex:
+            return Left(ex)
+
+    def close(self):
+        """Closes the database."""
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _add(self, ark, view, tokens, boxes):
+        """Replaces the text (ark, view) by tokens, in one transaction."""
+        positions = collections.defaultdict(lambda: array('I'))
+        for position, token in enumerate(tokens):
+            positions[token].append(position)
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            row = self._db.execute("SELECT id FROM units WHERE ark = ? AND view = ?",
+                                   (ark, view)).fetchone()
+            if row is not None:
+                self._db.execute("DELETE FROM postings WHERE unit = ?", row)
+                self._db.execute("DELETE FROM units WHERE id = ?", row)
+            unit = self._db.execute("INSERT INTO units (ark, view, ntokens, boxes) VALUES (?, ?, ?, ?)",
+                                    (ark, view, len(tokens), boxes)).lastrowid
+            self._db.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                                 ((term, unit, p.tobytes()) for term, p in positions.items()))
+
+    def _postings(self, term, ark):
+        """The positions of term in each text, as a dict unit -> array."""
+        sql = "SELECT unit, positions FROM postings WHERE term = ?"
+        params = (term,)
+        if ark is not None:
+            sql += " AND unit IN (SELECT id FROM units WHERE ark = ?)"
+            params += (ark,)
+        result = {}
+        for unit, blob in self._db.execute(sql, params):
+            result[unit] = positions = array('I')
+            positions.frombytes(blob)
+        return result
+
+    def _match(self, phrase, ark):
+        """The (unit, first position, length) of the occurrences of phrase."""
+        postings = [self._postings(term, ark) for term in phrase]
+        units = set.intersection(*(set(p) for p in postings))
+        for unit in units:
+            starts = set(postings[0][unit])
+            for offset, term_postings in enumerate(postings[1:], 1):
+                starts &= {position - offset for position in term_postings[unit]}
+            for start in starts:
+                yield (unit, start, len(phrase))
+
+
+def _hit(unit, start, length):
+    """The Hit of length tokens from start in unit, an (ark, view, boxes) row."""
+    ark, view, blob = unit
+    boxes = None
+    if blob is not None:
+        coords = array('f')
+        coords.frombytes(blob[16 * start:16 * (start + length)])
+        boxes = [tuple(coords[i:i + 4]) for i in range(0, len(coords), 4)]
+    return Hit(ark, view or None, start, boxes)
@@ -0,0 +1,266 @@
+"""
+Gallipy - Python wrapper for the Gallica APIs
+Copyright (C) 2019  Bertrand Dumenieu
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+https://github.com/GeoHistoricalData/gallipy
+"""
+import collections
+import logging
+import os
+import struct
+import time
+from .monadic import Either, Future, Left
+from .retry import RetryPolicy
+
+try:
+    import numpy
+    from numpy.lib.format import open_memmap
+    from PIL import Image
+except ImportError:  # Optional dependencies, see extras_require 'tiles'
+    numpy = None
+
+__all__ = ['Tile', 'tile_grid', 'fetch_tiled', 'fetch_tiled_async']
+
+DEFAULT_TILE_SIZE = 1024
+
+# Size in bytes of the strips of the TIFF files written by fetch_tiled.
+_STRIP_SIZE = 2**20
+
+# A tile: its region in the full image, and its size in the stitched image.
+Tile = collections.namedtuple("Tile", ("x", "y", "width", "height", "out_width", "out_height"))
+
+_logger = logging.getLogger(__name__)
+
+
+def tile_grid(info, scale_factor=1):
+    """The tiles covering an image, from its IIIF info.json.
+
+    Both the IIIF Image API 2 'tiles' property and the 1.1 'tile_width',
+    'tile_height' and 'scale_factors' properties are understood. Without
+    them, tiles of DEFAULT_TILE_SIZE pixels are used.
+
+    Args:
+        info (dict): The IIIF metadata of the image, see Resource.iiif_info_sync.
+        scale_factor (:obj:int, optional): Downscaling factor of the stitched
+            image, one of the scale factors advertised by the server.
+            Defaults to 1, the full resolution.
+
+    Returns:
+        tuple: The width and height of the stitched image, and its tiles
+            row by row.
+
+    Raises:
+        ValueError: If the server does not serve tiles at scale_factor.
+    """
+    width, height = int(info['width']), int(info['height'])
+    if info.get('tiles'):
+        spec = info['tiles'][0]
+        tile_width = int(spec['width'])
+        tile_height = int(spec.get('height', tile_width))
+        factors = spec.get('scaleFactors')
+    else:
+        tile_width = int(info.get('tile_width', DEFAULT_TILE_SIZE))
+        tile_height = int(info.get('tile_height', tile_width))
+        factors = info.get('scale_factors')
+    if factors and scale_factor not in factors:
+        raise ValueError("Scale factor {} not in the scale factors of the image {}".format(
+            scale_factor, factors))
+    step_x, step_y = tile_width * scale_factor, tile_height * scale_factor
+    tiles = [Tile(x, y, min(step_x, width - x), min(step_y, height - y),
+                  _ceil_div(min(step_x, width - x), scale_factor),
+                  _ceil_div(min(step_y, height - y), scale_factor))
+             for y in range(0, height, step_y) for x in range(0, width, step_x)]
+    return _ceil_div(width, scale_factor), _ceil_div(height, scale_factor), tiles
+
+def fetch_tiled(resource, dest, view=1, scale_factor=1, quality='native', imformat='jpg',
+                mode='RGB', max_concurrency=8, trials=3, retry=None):
+    """Retrieves an image tile by tile with the IIIF API and stitches the tiles.
+
+    The tiles advertised in the image's info.json are fetched in parallel,
+    max_concurrency at a time, and written as they arrive into a numpy array
+    memory-mapped from disk. A failed tile is retried on its own, up to
+    trials times. The array is written to dest + '.part' meanwhile: dest
+    never holds a partial image.
+
+    If dest ends with '.npy', the stitched array is the result, readable with
+    numpy.load(dest, mmap_mode='r'). If it ends with '.tif' or '.tiff', the
+    array is copied strip by strip into an uncompressed TIFF. In both cases,
+    memory use does not depend on the size of the image. Otherwise the array
+    is saved by Pillow, in the format given by the extension of dest, which
+    needs the whole image in memory.
+
+    Requires numpy and Pillow: pip install gallipy[tiles].
+
+    Args:
+        resource (Resource): The document.
+        dest (str): The path of the stitched image.
+        view (:obj:int, optional): The view to retrieve. Defaults to 1.
+        scale_factor (:obj:int, optional): See tile_grid. Defaults to 1.
+        quality (:obj:str, optional): IIIF quality of the tiles. Defaults to 'native'.
+        imformat (:obj:str, optional): Format of the tiles. Defaults to 'jpg'.
+        mode (:obj:str, optional): Pillow mode of the stitched image, 'RGB'
+            or 'L'. Defaults to 'RGB'.
+        max_concurrency (:obj:int, optional): Maximum number of tiles
+            fetched at the same time. Defaults to 8.
+        trials (:obj:int, optional): Attempts per tile. Defaults to 3.
+        retry (:obj:RetryPolicy, optional): Backoff between the attempts of
+            a tile. Defaults to RetryPolicy().
+
+    Returns:
+        Either[Exception str]: dest if every tile has been retrieved,
+            otherwise an Exception listing the failed tiles.
+    """
+    return fetch_tiled_async(resource, dest, view, scale_factor, quality, imformat, mode,
+                             max_concurrency, trials, retry).result().flat_map(lambda either: either)
+
+def fetch_tiled_async(resource, dest, view=1, scale_factor=1, quality='native', imformat='jpg',
+                      mode='RGB', max_concurrency=8, trials=3, retry=None):
+    """Asynchronous version of fetch_tiled.
+
+    The tiles are fetched by a future each, composed into a single future:
+    no task of the shared executor waits for another one.
+
+    Returns:
+        Future: A future resolving to the Either returned by fetch_tiled.
+    """
+    if numpy is None:
+        return Future.pure(Left(ImportError("Tiled retrieval requires numpy and Pillow: "
+                                            "pip install gallipy[tiles]")))
+    retry = retry or RetryPolicy()
+    array_path = dest + '.part'
+
+    def plan():
+        either = resource.iiif_info_sync(view)
+        if either.is_left:
+            return either
+        try:
+            width, height, tiles = tile_grid(either.value, scale_factor)
+            shape = (height, width, 3) if mode == 'RGB' else (height, width)
+            canvas = open_memmap(array_path, mode='w+', dtype=numpy.uint8, shape=shape)
+        except Exception as ex:
+            return Left(ex)
+        return Either.pure((canvas, tiles))
+
+    def fetch_tile(canvas, tile):
+        size = 'full' if scale_factor == 1 else '{},'.format(tile.out_width)
+        region = (tile.x, tile.y, tile.width, tile.height)
+        for attempt in range(1, trials + 1):
+            either = resource.iiif_data_sync(view, region, size, 0, quality, imformat, payload=True)
+            either = either.flat_map(lambda payload: _paste(canvas, tile, scale_factor, mode, payload))
+            if not either.is_left or attempt == trials:
+                return either
+            _logger.debug("Tile %s failed (%s), attempt %d of %d", region, either.value,
+                          attempt, trials)
+            time.sleep(retry.backoff(attempt))
+
+    def stitch(either):
+        if either.is_left:
+            return Future.pure(either)
+        canvas, tiles = either.value
+        fetch = lambda tile: Future.asyn(lambda: fetch_tile(canvas, tile))
+        return Future.traverse_par(tiles, max_concurrency, fail_fast=False)(fetch).map(
+            lambda results: _save(canvas, tiles, results, array_path, dest))
+
+    return Future.asyn(plan).flat_map(stitch)
+
+
+def _save(canvas, tiles, results, array_path, dest):
+    """Moves the stitched array to dest, unless a tile failed."""
+    failed = [tile for tile, either in zip(tiles, results) if either.is_left]
+    try:
+        if failed:
+            return Left(Exception("{} of {} tiles could not be retrieved: {}".format(
+                len(failed), len(tiles), [(t.x, t.y, t.width, t.height) for t in failed])))
+        canvas.flush()
+        if dest.endswith('.npy'):
+            os.replace(array_path, dest)
+        elif dest.lower().endswith(('.tif', '.tiff')):
+            _write_tiff(array_path, canvas.shape, dest)
+        else:
+            Image.fromarray(canvas).save(dest)
+        return Either.pure(dest)
+    except Exception as ex:
+        return Left(ex)
+    finally:
+        del canvas
+        if os.path.exists(array_path):
+            os.remove(array_path)
+
+def _write_tiff(array_path, shape, dest):
+    """Copies the pixels of a .npy array of shape (height, width[, 3]) into an
+    uncompressed baseline TIFF, strip by strip.
+
+    The pixels are read with plain file reads, not through a memory map, so
+    that only one strip is in memory at a time.
+    """
+    height, width = shape[:2]
+    samples = shape[2] if len(shape) == 3 else 1
+    row_size = width * samples
+    nbytes = height * row_size
+    if nbytes + 4096 > 2**32:
+        raise ValueError("Image too large for a TIFF file, save it as .npy instead")
+    rows = max(1, min(height, _STRIP_SIZE // row_size))
+    strips = [(y, min(rows, height - y) * row_size) for y in range(0, height, rows)]
+    header = 8
+    ifd_offset = header + nbytes + (nbytes % 2)
+    entries = 10
+    extra = ifd_offset + 2 + 12 * entries + 4  # Values that do not fit in their entry
+    offsets_at, counts_at, bits_at = extra, extra + 4 * len(strips), extra + 8 * len(strips)
+
+    def entry(tag, kind, count, value):
+        if kind == 3 and count == 1:
+            return struct.pack('<HHIHH', tag, kind, count, value, 0)
+        return struct.pack('<HHII', tag, kind, count, value)
+
+    with open(array_path, 'rb') as istream, open(dest + '.tmp', 'wb') as ostream:
+        istream.seek(os.path.getsize(array_path) - nbytes)  # Pixels end the .npy file
+        ostream.write(b'II*\x00' + struct.pack('<I', ifd_offset))
+        for _, size in strips:
+            ostream.write(istream.read(size))
+        ostream.write(b'\x00' * (nbytes % 2))
+        single = len(strips) == 1
+        ostream.write(struct.pack('<H', entries) + b''.join([
+            entry(256, 4, 1, width),
+            entry(257, 4, 1, height),
+            entry(258, 3, samples, 8 if samples == 1 else bits_at),
+            entry(259, 3, 1, 1),  # No compression
+            entry(262, 3, 1, 2 if samples == 3 else 1),  # RGB or black is zero
+            entry(273, 4, len(strips), header if single else offsets_at),
+            entry(277, 3, 1, samples),
+            entry(278, 4, 1, rows),
+            entry(279, 4, len(strips), strips[0][1] if single else counts_at),
+            entry(284, 3, 1, 1),  # Chunky pixels
+        ]) + struct.pack('<I', 0))
+        ostream.write(b''.join(struct.pack('<I', header + y * row_size) for y, _ in strips))
+        ostream.write(b''.join(struct.pack('<I', size) for _, size in strips))
+        ostream.write(struct.pack('<3H', 8, 8, 8))
+    os.replace(dest + '.tmp', dest)
+
+def _paste(canvas, tile, scale_factor, mode, payload):
+    """Decodes a tile and writes it at its place in canvas."""
+    try:
+        with payload, Image.open(payload.open()) as image:
+            pixels = numpy.asarray(image.convert(mode))
+        x, y = tile.x // scale_factor, tile.y // scale_factor
+        height = min(pixels.shape[0], tile.out_height)
+        width = min(pixels.shape[1], tile.out_width)
+        canvas[y:y + height, x:x + width] = pixels[:height, :width]
+        return Either.pure(tile)
+    except Exception as ex:
+        return Left(ex)
+
+def _ceil_div(a, b):
+    return -(-a // b)
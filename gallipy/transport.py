@@ -0,0 +1,454 @@
+"""
+Gallipy - Python wrapper for the Gallica APIs
+Copyright (C) 2019  Bertrand Dumenieu
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+https://github.com/GeoHistoricalData/gallipy
+"""
+import asyncio
+import contextlib
+import http.client
+import io
+import ssl
+import threading
+import urllib.error
+import urllib.parse
+import weakref
+from .retry import RetryPolicy
+
+__all__ = ['Transport', 'AsyncTransport', 'default_transport', 'default_async_transport']
+
+_REDIRECT_CODES = (301, 302, 303, 307, 308)
+_DEFAULT_HEADERS = {"User-Agent": "gallipy", "Connection": "keep-alive"}
+
+
+class Transport:
+    """A pool of persistent HTTP(S) connections.
+
+    Opening a new connection, and for HTTPS performing a new TLS handshake,
+    costs more than most Gallica requests. A Transport keeps up to pool_size
+    idle keep-alive connections per host and reuses them for subsequent
+    requests. A Transport is thread-safe: a connection is only ever used by
+    one request at a time.
+
+    Args:
+        pool_size (:obj:int, optional): Maximum number of idle connections kept
+            per host. Defaults to 4.
+        timeout (:obj:float, optional): Socket timeout in seconds, for
+            connecting and reading. Defaults to None: no timeout, since
+            Gallica may take minutes to generate a large PDF.
+        max_redirects (:obj:int, optional): Maximum number of redirections to
+            follow. Defaults to 5.
+        retry (:obj:RetryPolicy, optional): When to send a failed request
+            again. Defaults to RetryPolicy(). Use RetryPolicy(max_attempts=1)
+            to disable retries.
+        rate_limiter (:obj:RateLimiter, optional): Bounds the rate of every
+            request sent, retries and redirections included. Defaults to
+            no limit.
+    """
+
+    def __init__(self, pool_size=4, timeout=None, max_redirects=5, retry=None,
+                 rate_limiter=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.retry = retry or RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None):
+        """Performs a GET request and reads the whole response body.
+
+        Transient failures, while waiting for the response or reading its
+        body, are retried following self.retry.
+
+        Args:
+            url (str): The URL to fetch.
+            headers (:obj:dict, optional): Additional request headers.
+
+        Returns:
+            bytes: The response body.
+
+        Raises:
+            urllib.error.HTTPError: If the server answered with an error status.
+            OSError: If the connection failed.
+        """
+        return self.retry.call(self._get, url, headers)
+
+    @contextlib.contextmanager
+    def open(self, url, headers=None):
+        """Performs a GET request and yields the response.
+
+        Redirections are followed. The connection goes back to the pool once
+        the response has been fully read and the context is exited; it is
+        discarded otherwise. Transient failures are retried following
+        self.retry until the response is yielded, but not while its body is
+        read by the caller.
+
+        Args:
+            url (str): The URL to fetch.
+            headers (:obj:dict, optional): Additional request headers.
+
+        Yields:
+            http.client.HTTPResponse: The response, with an extra attribute
+                'url' holding the final URL after redirections.
+
+        Raises:
+            urllib.error.HTTPError: If the server answered with an error status.
+            OSError: If the connection failed.
+        """
+        key, conn, res = self.retry.call(self._response, url, headers)
+        try:
+            yield res
+        finally:
+            self._release(key, conn, res)
+
+    def _get(self, url, headers):
+        """One attempt of get."""
+        key, conn, res = self._response(url, headers)
+        try:
+            return res.read()
+        finally:
+            self._release(key, conn, res)
+
+    def _response(self, url, headers):
+        """Sends a GET request and follows redirections.
+
+        Returns:
+            tuple: The pool key, the connection and the successful response.
+        """
+        for _ in range(self.max_redirects + 1):
+            key, conn, res = self._request(url, headers)
+            res.url = url
+            if res.status in _REDIRECT_CODES and res.getheader("Location"):
+                res.read()
+                self._release(key, conn, res)
+                url = urllib.parse.urljoin(url, res.getheader("Location"))
+                continue
+            if res.status >= 400:
+                body = res.read()
+                self._release(key, conn, res)
+                raise urllib.error.HTTPError(
+                    url, res.status, "{} {}".format(res.reason, body[:200]),
+                    res.headers, None)
+            return key, conn, res
+        raise urllib.error.URLError("Too many redirections from {}".format(url))
+
+    def close(self):
+        """Closes every idle connection of this pool."""
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for idle in pools.values():
+            for conn in idle:
+                conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _request(self, url, headers):
+        """Sends a GET request, on a pooled connection if possible.
+
+        A pooled connection may have been closed by the server since its last
+        use. In this case the request is sent again once on a new connection.
+        """
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise urllib.error.URLError("Unsupported URL scheme: {}".format(url))
+        key = (parts.scheme, parts.netloc)
+        target = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        all_headers = dict(_DEFAULT_HEADERS)
+        all_headers.update(headers or {})
+        if self.rate_limiter:
+            self.rate_limiter.wait(url)
+        conn, reused = self._acquire(key)
+        try:
+            conn.request("GET", target, headers=all_headers)
+            return key, conn, conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError,
+                BrokenPipeError, http.client.BadStatusLine):
+            conn.close()
+            if not reused:
+                raise
+        except Exception:
+            conn.close()
+            raise
+        conn = self._connect(key)
+        try:
+            conn.request("GET", target, headers=all_headers)
+            return key, conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def _acquire(self, key):
+        """Gets an idle connection to key, or a new one.
+
+        Returns:
+            tuple: The connection and whether it was taken from the pool.
+        """
+        with self._lock:
+            idle = self._pools.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._connect(key), False
+
+    def _connect(self, key):
+        """Creates a new connection to key."""
+        scheme, netloc = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _release(self, key, conn, res):
+        """Puts a connection back in the pool if it can be reused."""
+        if not res.isclosed() or res.will_close:
+            conn.close()
+            return
+        with self._lock:
+            idle = self._pools.setdefault(key, [])
+            if len(idle) < self.pool_size:
+                idle.append(conn)
+                return
+        conn.close()
+
+
+class AsyncTransport:
+    """A pool of persistent HTTP(S) connections for asyncio.
+
+    The non-blocking counterpart of Transport, built on asyncio streams.
+    A semaphore bounds the number of requests in flight, so that thousands of
+    coroutines can share one AsyncTransport without opening thousands of
+    sockets. An AsyncTransport must only be used from one event loop.
+
+    Args:
+        pool_size (:obj:int, optional): Maximum number of idle connections kept
+            per host. Defaults to 16.
+        timeout (:obj:float, optional): Timeout in seconds of a request,
+            including reading the response. Defaults to None: no timeout.
+        max_redirects (:obj:int, optional): Maximum number of redirections to
+            follow. Defaults to 5.
+        max_concurrency (:obj:int, optional): Maximum number of requests in
+            flight. Defaults to 32.
+        retry (:obj:RetryPolicy, optional): When to send a failed request
+            again. Defaults to RetryPolicy(). Use RetryPolicy(max_attempts=1)
+            to disable retries.
+        rate_limiter (:obj:RateLimiter, optional): Bounds the rate of every
+            request sent, retries and redirections included. Defaults to
+            no limit.
+    """
+
+    def __init__(self, pool_size=16, timeout=None, max_redirects=5, max_concurrency=32,
+                 retry=None, rate_limiter=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.max_concurrency = max_concurrency
+        self.retry = retry or RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self._pools = {}
+        self._semaphore = None
+
+    async def get(self, url, headers=None):
+        """Performs a GET request and reads the whole response body.
+
+        Args:
+            url (str): The URL to fetch.
+            headers (:obj:dict, optional): Additional request headers.
+
+        Returns:
+            bytes: The response body.
+
+        Raises:
+            urllib.error.HTTPError: If the server answered with an error status.
+            OSError: If the connection failed.
+            asyncio.TimeoutError: If the request timed out.
+        """
+        return (await self.request(url, headers))[2]
+
+    async def request(self, url, headers=None):
+        """Performs a GET request and reads the whole response.
+
+        Redirections are followed. Responses with a status lower than 400 that
+        are not redirections, e.g. 304 Not Modified, are returned as is.
+        Transient failures are retried following self.retry. A request
+        waiting to be retried does not count in max_concurrency.
+
+        Args:
+            url (str): The URL to fetch.
+            headers (:obj:dict, optional): Additional request headers.
+
+        Returns:
+            tuple: The status, the headers (http.client.HTTPMessage) and the
+                body (bytes) of the response.
+
+        Raises:
+            urllib.error.HTTPError: If the server answered with an error status.
+            OSError: If the connection failed.
+            asyncio.TimeoutError: If the request timed out.
+        """
+        return await self.retry.call_async(self._attempt, url, headers)
+
+    async def _attempt(self, url, headers):
+        """One attempt of request."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            for _ in range(self.max_redirects + 1):
+                if self.rate_limiter:
+                    await self.rate_limiter.wait_async(url)
+                status, reason, res_headers, body = await asyncio.wait_for(
+                    self._request(url, headers), self.timeout)
+                if status in _REDIRECT_CODES and res_headers.get("Location"):
+                    url = urllib.parse.urljoin(url, res_headers.get("Location"))
+                    continue
+                if status >= 400:
+                    raise urllib.error.HTTPError(
+                        url, status, "{} {}".format(reason, body[:200]), res_headers, None)
+                return status, res_headers, body
+        raise urllib.error.URLError("Too many redirections from {}".format(url))
+
+    def close(self):
+        """Closes every idle connection of this pool."""
+        pools, self._pools = self._pools, {}
+        for idle in pools.values():
+            for _, writer in idle:
+                writer.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    async def _request(self, url, headers):
+        """Sends a GET request, on a pooled connection if possible.
+
+        Returns:
+            tuple: The status, reason, headers and body of the response.
+        """
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise urllib.error.URLError("Unsupported URL scheme: {}".format(url))
+        key = (parts.scheme, parts.netloc)
+        target = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        all_headers = dict(_DEFAULT_HEADERS)
+        all_headers["Host"] = parts.netloc
+        all_headers.update(headers or {})
+        lines = ["GET {} HTTP/1.1".format(target)]
+        lines += ["{}: {}".format(k, v) for k, v in all_headers.items()]
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        idle = self._pools.get(key)
+        if idle:
+            conn = idle.pop()
+            try:
+                return await self._exchange(key, conn, request)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn[1].close()  # Closed by the server while idle
+        return await self._exchange(key, await self._connect(parts), request)
+
+    async def _exchange(self, key, conn, request):
+        """Writes a request on conn and reads the response."""
+        reader, writer = conn
+        try:
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readuntil(b"\r\n")
+            version, status, reason = (status_line.decode("latin-1").rstrip("\r\n")
+                                       .split(" ", 2) + [""])[:3]
+            raw_headers = []
+            while True:
+                line = await reader.readuntil(b"\r\n")
+                raw_headers.append(line)
+                if line == b"\r\n":
+                    break
+            res_headers = http.client.parse_headers(io.BytesIO(b"".join(raw_headers)))
+            body, reusable = await self._read_body(reader, int(status), res_headers)
+            reusable = reusable and version == "HTTP/1.1" \
+                and res_headers.get("Connection", "").lower() != "close"
+        except BaseException:
+            writer.close()
+            raise
+        if reusable and len(self._pools.setdefault(key, [])) < self.pool_size:
+            self._pools[key].append(conn)
+        else:
+            writer.close()
+        return int(status), reason, res_headers, body
+
+    @staticmethod
+    async def _read_body(reader, status, headers):
+        """Reads a response body.
+
+        Returns:
+            tuple: The body and whether the connection can be reused.
+        """
+        if status in (204, 304) or 100 <= status < 200:
+            return b"", True
+        if headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if not size:
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            # Skip trailers
+            while (await reader.readuntil(b"\r\n")) != b"\r\n":
+                pass
+            return b"".join(chunks), True
+        if headers.get("Content-Length") is not None:
+            return await reader.readexactly(int(headers.get("Content-Length"))), True
+        return await reader.read(), False
+
+    async def _connect(self, parts):
+        """Opens a new connection."""
+        https = parts.scheme == "https"
+        port = parts.port or (443 if https else 80)
+        context = ssl.create_default_context() if https else None
+        return await asyncio.open_connection(parts.hostname, port, ssl=context)
+
+
+_DEFAULT_TRANSPORT = None
+_DEFAULT_LOCK = threading.Lock()
+
+def default_transport():
+    """The Transport shared by every Resource created without one.
+
+    Returns:
+        Transport: The process-wide default Transport.
+    """
+    global _DEFAULT_TRANSPORT
+    with _DEFAULT_LOCK:
+        if _DEFAULT_TRANSPORT is None:
+            _DEFAULT_TRANSPORT = Transport()
+        return _DEFAULT_TRANSPORT
+
+_DEFAULT_ASYNC_TRANSPORTS = weakref.WeakKeyDictionary()
+
+def default_async_transport():
+    """The AsyncTransport shared by every AsyncResource of the running loop.
+
+    Returns:
+        AsyncTransport: The default AsyncTransport of the running event loop.
+    """
+    loop = asyncio.get_event_loop()
+    transport = _DEFAULT_ASYNC_TRANSPORTS.get(loop)
+    if transport is None:
+        transport = _DEFAULT_ASYNC_TRANSPORTS[loop] = AsyncTransport()
+    return transport
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+"""
+A simple command-line tool to harvest the OCR of every view of Gallica
+resources into a columnar store when their ARKs are known.
+"""
+
+import argparse
+import logging
+import sys
+from gallipy import Resource, monadic
+from gallipy.harvest import harvest_ocr
+from getpreviews import read_arks, positive_int
+
+logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.INFO)
+
+def harvest(arks, output_dir, workers):
+    """Harvest the OCR of the resources to the store output_dir
+
+    Returns:
+        bool: True if the OCR of every view has been harvested, False otherwise.
+    """
+    resources = []
+    for ark in arks:
+        try:
+            resources.append(Resource(ark))
+        except Exception as ex: # An invalid ARK must not stop the other ones
+            logging.error("Skipping %s: %s", ark, " ".join(str(ex).split()))
+    either = harvest_ocr(resources, output_dir, max_concurrency=workers)
+    if either.is_left:
+        logging.error("Cannot open the store %s: %s", output_dir, either.value)
+        return False
+    summary = either.value
+    for ark, view, reason in summary["failed"]:
+        if view is None:
+            logging.error("%s failed: %s", ark, reason)
+        else:
+            logging.debug("View %d of %s failed: %s", view, ark, reason)
+    logging.info("%d pages harvested (%d words), %d already there, %d failed -> %s",
+                 summary["fetched"], summary["words"], summary["skipped"],
+                 len(summary["failed"]), output_dir)
+    return len(resources) == len(arks) and not summary["failed"]
+
+def parse_args():
+    """Parse arguments"""
+    parser = argparse.ArgumentParser(description="""A simple script to harvest the OCR
+                                        of every view of archival resources hosted on gallica.bnf.fr.""")
+    parser.add_argument("ark", type=str, nargs="*",
+                        help="""The Archival Resource Keys of the resources.
+                        Can be Gallica URLs (https://gallica.bnf.fr/ark:/12148/bpt6k9764647w)
+                        or ARK URIs (ark:/12148/bpt6k9764647w)""")
+    parser.add_argument("-f", "--arks-file", type=str,
+                        help="A file listing ARKs, one per line.")
+    parser.add_argument("-o", "--output-dir", type=str, default="ocr",
+                        help="Directory of the OCR store. Default value: ocr")
+    parser.add_argument("--workers", type=positive_int, default=8,
+                        help="Number of pages downloaded concurrently. Default value: 8")
+    pargs = parser.parse_args()
+
+    arks = list(pargs.ark)
+    if pargs.arks_file:
+        arks += read_arks(pargs.arks_file)
+    if not arks:
+        parser.error("No ARK given")
+    if pargs.workers > monadic.DEFAULT_MAX_WORKERS:
+        monadic.Future.configure(max_workers=pargs.workers)
+    return arks, pargs.output_dir, pargs.workers
+
+if __name__ == "__main__":
+    sys.exit(0 if harvest(*parse_args()) else 1)
@@ -7,12 +7,19 @@ when its ARK is known.
 
 import io
 import argparse
+import hashlib
+import json
 import sys
 import logging
 import os
+import threading
+import time
 from collections import namedtuple
-from PyPDF2 import PdfFileReader, PdfFileMerger, PdfFileWriter, PageRange
+from PyPDF2 import PdfFileReader, PdfFileMerger, PageRange
 from gallipy import Resource, monadic
+from gallipy.blocks import AdaptiveBlockSize, adaptive_blocks
+from gallipy.retry import RetryPolicy
+from gallipy.transport import default_transport
 
 
 logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.INFO)
@@ -21,33 +28,177 @@ DEFAULT_NUM_TRIALS = 5
 DEFAULT_N_VIEWS = 1000 # An arbitrary value of the total number of views in a
                        # resource if this value can not be retrieved from Gallica
 
+BLOCK_RETRY = RetryPolicy(base_delay=2, max_delay=60) # Backoff between the trials of a block
+
 Block = namedtuple("Block", ("start", "n")) # Immutable named tuple
 
-def download_pdf(resource, start, end, blocksize, trials, output_path):
-    """ Download the PDF resource in blocks of size blocksize and save it to output_path"""
-    partials = []
+def download_pdf(resource, start, end, blocksize, trials, output_path, workers=1, sizer=None):
+    """ Download the PDF resource in blocks of size blocksize and save it to output_path
+
+    Up to workers blocks are downloaded concurrently, each with its own
+    trials. Blocks are merged in view order. Each verified block is recorded
+    in a checkpoint manifest next to output_path: if the download fails, a
+    new call only fetches the missing blocks, and interrupted transfers are
+    resumed where the server allows it.
+
+    If sizer, a gallipy.blocks.AdaptiveBlockSize, is set, blocksize and
+    workers are ignored: blocks are downloaded one after the other and their
+    size follows the pace of Gallica.
+
+    Returns:
+        bool: True if the resource has been downloaded, False otherwise.
+    """
+    checkpoint = Checkpoint.load(output_path, resource.arkid)
+    completed = checkpoint.completed(start, end)
+    missing = checkpoint.missing(start, end)
+    if completed:
+        logging.info("Resuming download: %d blocks already downloaded.", len(completed))
+
+    def download_block(block, trials=trials):
+        reason = "Download block "+str(block)
+        partial = partial_path(output_path, block)
+        either = fetch_block(resource, block.start, block.n, trials, reason, partial)
+        either = either.flat_map(check_pdf)
+        if either.is_left:
+            if os.path.exists(partial):
+                os.remove(partial)  # Not a valid PDF, start over next time
+            if sizer and os.path.exists(partial + ".part"):
+                os.remove(partial + ".part")  # The retry has another size, hence another path
+        else:
+            checkpoint.add(block, partial)
+        return either
+
     try:
-        for idx, block in enumerate(generate_blocks(start, end, blocksize)):
-            reason = "Download block "+str(block)
-            either = fetch_block(resource, block.start, block.n, trials, reason)
-            if either.is_left:
-                raise Exception(
-                    "Failed to fetch resource {} from view {} to view {}.\nReason: {}".format(
-                        resource.arkid,
-                        block.start,
-                        block.start+block.n-1,
-                        either.value))
-            pdfdata = PdfFileReader(io.BytesIO(either.value))
-            partial = "{}.{}".format(output_path, idx)
-            partials.append(partial)
-            write_pdfdata(pdfdata, partial)
+        if sizer:
+            blocks, failures = download_adaptive(download_block, missing, sizer, trials)
+        else:
+            blocks, failures = download_concurrent(download_block, missing, blocksize, workers)
+        for block, reason in failures:
+            logging.error(
+                "Failed to fetch resource %s from view %d to view %d.\nReason: %s",
+                resource.arkid, block.start, block.start+block.n-1, reason)
+        if failures:
+            logging.critical(
+                "The resource has not been downloaded: %d blocks failed. "
+                "Run the same command again to download the missing blocks only.",
+                len(failures))
+            return False
+        partials = [partial_path(output_path, block)
+                    for block in sorted(completed + blocks)]
         merge_partials(output_path, partials)
     except Exception as ex: # PEP8 will complain (W0703) but we don't care ¯\_(ツ)_/¯
         logging.exception(ex)
         logging.critical("The resource has not been downloaded.")
-    finally:
-        for partial in partials:
-            os.remove(partial)
+        return False
+    for partial in partials:
+        os.remove(partial)
+    checkpoint.remove()
+    return True
+
+def download_concurrent(download_block, ranges, blocksize, workers):
+    """Download the view ranges in blocks of blocksize views, workers at a time
+
+    Returns:
+        tuple: The blocks downloaded, and the (block, reason) of each failure.
+    """
+    blocks = [block for inf, sup in ranges for block in generate_blocks(inf, sup, blocksize)]
+    traversal = monadic.Future.traverse_par(blocks, workers, fail_fast=False)
+    results = traversal(lambda block: monadic.Future.asyn(lambda: download_block(block)))
+    eithers = results.result().value
+    failures = [(block, e.value) for block, e in zip(blocks, eithers) if e.is_left]
+    return [block for block, e in zip(blocks, eithers) if not e.is_left], failures
+
+def download_adaptive(download_block, ranges, sizer, trials):
+    """Download the view ranges one block at a time, in blocks sized by sizer
+
+    Returns:
+        tuple: The blocks downloaded, and the (block, reason) of the failure if any.
+    """
+    blocks = []
+    for inf, sup in ranges:
+        fetch = lambda start, n: download_block(Block(start=start, n=n), trials=1)
+        for start, n, either in adaptive_blocks(fetch, inf, sup, sizer, trials):
+            if either.is_left:
+                return blocks, [(Block(start=start, n=n), either.value)]
+            blocks.append(Block(start=start, n=n))
+            stats = sizer.stats
+            logging.info("Downloaded views %d to %d at %.1f views/s, next block: %d views.",
+                         start, start+n-1, stats["throughput"], sizer.size)
+    return blocks, []
+
+def partial_path(output_path, block):
+    """Path of the partial file of a block"""
+    return "{}.{}-{}".format(output_path, block.start, block.start+block.n-1)
+
+class Checkpoint:
+    """The manifest of the blocks of output_path downloaded and verified so far.
+
+    The manifest is saved as JSON in output_path.parts.json after each block.
+    A block is only trusted on reload if its partial file still has the
+    recorded size and SHA-256.
+    """
+
+    def __init__(self, output_path, ark, blocks=None):
+        self.path = output_path + ".parts.json"
+        self.ark = str(ark)
+        self.blocks = blocks or {}  # Block -> {"file", "size", "sha256"}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def load(output_path, ark):
+        """Load the manifest of output_path, keeping verified blocks only"""
+        checkpoint = Checkpoint(output_path, ark)
+        try:
+            with open(checkpoint.path) as istream:
+                manifest = json.load(istream)
+        except (OSError, ValueError):
+            return checkpoint
+        if manifest.get("ark") != checkpoint.ark:
+            logging.warning("Ignoring %s, made for another resource.", checkpoint.path)
+            return checkpoint
+        for entry in manifest.get("blocks", []):
+            path = entry["file"]
+            if (os.path.exists(path) and os.path.getsize(path) == entry["size"]
+                    and file_digest(path) == entry["sha256"]):
+                block = Block(start=entry["start"], n=entry["n"])
+                checkpoint.blocks[block] = entry
+            else:
+                logging.warning("Block %s of %s is missing or corrupted.",
+                                path, checkpoint.path)
+        return checkpoint
+
+    def add(self, block, path):
+        """Record a verified block and save the manifest"""
+        entry = {"start": block.start, "n": block.n, "file": path,
+                 "size": os.path.getsize(path), "sha256": file_digest(path)}
+        with self._lock:
+            self.blocks[block] = entry
+            manifest = {"ark": self.ark, "blocks": sorted(
+                self.blocks.values(), key=lambda e: e["start"])}
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as ostream:
+                json.dump(manifest, ostream, indent=2)
+            os.replace(tmp, self.path)
+
+    def completed(self, start, end):
+        """Recorded blocks between views start and end, sorted by first view"""
+        return sorted(b for b in self.blocks if b.start >= start and b.start+b.n-1 <= end)
+
+    def missing(self, start, end):
+        """View ranges (first, last) between start and end not covered by a block"""
+        ranges = []
+        for block in self.completed(start, end):
+            if block.start > start:
+                ranges.append((start, block.start-1))
+            start = max(start, block.start+block.n)
+        if start <= end:
+            ranges.append((start, end))
+        return ranges
+
+    def remove(self):
+        """Delete the manifest"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
 
 def generate_blocks(inf, sup, blocksize):
     """Compute the blocks based on the total view range and a block size"""
@@ -67,29 +218,51 @@ def merge_partials(path, partials):
     merger.write(path)
     merger.close()
 
-def write_pdfdata(pdffilereader, path):
-    """Write a partial file"""
-    with open(path, "wb+") as ostream:
-        writer = PdfFileWriter()
-        writer.appendPagesFromReader(pdffilereader)
-        writer.write(ostream)
+def file_digest(path):
+    """SHA-256 of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as istream:
+        for chunk in iter(lambda: istream.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def check_pdf(path):
+    """Make sure a partial file is a readable PDF"""
+    try:
+        with open(path, "rb") as istream:
+            PdfFileReader(istream).getNumPages()
+        return monadic.Right(path)
+    except Exception as ex:
+        return monadic.Left(ex)
+
+def fetch_block(resource, from_view, nviews, trials, reason, path=None, attempt=1):
+    """Retrieve a block of PDF data from Gallica
 
-def fetch_block(resource, from_view, nviews, trials, reason):
-    """Retrieve a block of PDF data from Gallica"""
+    If path is set, the data is streamed to the file path instead of being
+    returned, and the Either holds path. Failed attempts are retried after
+    an exponential backoff, on top of the retries of the transport.
+    """
     logging.debug(
         "Fetching resource %s from view %d to view %d",
         resource.ark.arkid,
         from_view,
         from_view+nviews-1)
 
-    res = resource.content_sync(startview=from_view, nviews=nviews, mode="pdf")
+    if path:
+        res = resource.content_to_file_sync(
+            path, startview=from_view, nviews=nviews, mode="pdf", resume=True)
+    else:
+        res = resource.content_sync(startview=from_view, nviews=nviews, mode="pdf")
     if res.is_left:
         if res.value:
             logging.exception(res.value)
         logging.debug("Reason for calling fetch_block was: <%s>.", reason)
         logging.info("%s attempt left", trials-1)
         if trials > 1:
-            return fetch_block(resource, from_view, nviews, trials-1, reason)
+            delay = BLOCK_RETRY.backoff(attempt)
+            logging.info("Retrying in %.1f seconds", delay)
+            time.sleep(delay)
+            return fetch_block(resource, from_view, nviews, trials-1, reason, path, attempt+1)
     return res
 
 # Helpers
@@ -111,7 +284,7 @@ def gallica_nviews(resource):
     mdata = resource.pagination_sync()
     def get_from_dict(dic):
         try:
-            return monadic.Right(int(dic["livre"]["structures"]["nbVueImages"]))
+            return monadic.Right(int(dic["livre"]["structure"]["nbVueImages"]))
         except Exception as ex:
             return monadic.Left(ex)
     nviews = mdata.flat_map(get_from_dict)
@@ -145,6 +318,20 @@ def parse_args():
     parser.add_argument("--trials", type=non_negative_int, default=DEFAULT_NUM_TRIALS,
                         help="""If defined, the resource will be downloaded
                             in blocks of --blocksize views.""")
+    parser.add_argument("--workers", type=non_negative_int, default=1,
+                        help="""Number of blocks downloaded concurrently.
+                            Default value: 1""")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="""Adapt the size of the blocks to the pace of Gallica,
+                            starting from --blocksize views. Blocks are then
+                            downloaded one at a time.""")
+    parser.add_argument("--min-blocksize", type=non_negative_int, default=10,
+                        help="Smallest block size in adaptive mode. Default value: 10")
+    parser.add_argument("--max-blocksize", type=non_negative_int, default=500,
+                        help="Largest block size in adaptive mode. Default value: 500")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="""Timeout in seconds of each request, generating
+                            a block included. Default value: no timeout""")
     parser.add_argument("outputfile", type=str,
                         help="The output PDF file.")
     pargs = parser.parse_args()
@@ -154,12 +341,22 @@ def parse_args():
         parser.print_help(sys.stderr)
         sys.exit(1)
 
+    default_transport().timeout = pargs.timeout
     resource = Resource(pargs.ark)
     nviews = gallica_nviews(resource)
     start = clamp(pargs.start, 1, nviews)
     end = clamp(pargs.end, start, nviews) if pargs.end else nviews
     blocksize = clamp(pargs.blocksize, 1, end-start+1)
     trials = pargs.trials or 1 # Force trial to be at least 1
+    workers = pargs.workers or 1
+    if workers > monadic.DEFAULT_MAX_WORKERS:
+        monadic.Future.configure(max_workers=workers)
+
+    sizer = None
+    if pargs.adaptive:
+        minimum = clamp(pargs.min_blocksize, 1, end-start+1)
+        maximum = clamp(pargs.max_blocksize, minimum, end-start+1)
+        sizer = AdaptiveBlockSize(initial=pargs.blocksize or 100, minimum=minimum, maximum=maximum)
 
     logging.debug(
         "Downloading views %d to %d %s from resource %s with %d views",
@@ -169,7 +366,7 @@ def parse_args():
         resource.arkid,
         nviews)
 
-    return resource, start, end, blocksize, trials, pargs.outputfile
+    return resource, start, end, blocksize, trials, pargs.outputfile, workers, sizer
 
 if __name__ == "__main__":
-    download_pdf(*parse_args())
+    sys.exit(0 if download_pdf(*parse_args()) else 1)
@@ -2,8 +2,20 @@
 
 import bibtexparser, argparse
 import getpdf, logging
+import json
 import os.path
-from gallipy import Resource
+import queue
+import sys
+import threading
+import time
+from collections import namedtuple
+try:
+  from bibtexparser.bibdatabase import BibDatabase  # bibtexparser 1
+except ImportError:
+  BibDatabase = None
+  from bibtexparser.model import Entry, Field  # bibtexparser 2
+from gallipy import Resource, monadic
+from gallipy.transport import default_transport
 
 logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.DEBUG)
 
@@ -12,31 +24,213 @@ parser.add_argument('bibtex', type=str,
                     help='A path to a Bibtex file or a string containing a set of Bibtex entries.' )
 parser.add_argument('--key', type=str, default='eprint',
                     help='Name of the Bibtex key containing the ARK.' )
+parser.add_argument('--documents', type=getpdf.non_negative_int, default=1,
+                    help='Number of documents downloaded concurrently. Default value: 1' )
+parser.add_argument('--workers', type=getpdf.non_negative_int, default=1,
+                    help='Number of blocks of each document downloaded concurrently. Default value: 1' )
+parser.add_argument('--blocksize', type=getpdf.non_negative_int, default=100,
+                    help='Size of the blocks of views. Default value: 100' )
+parser.add_argument('--trials', type=getpdf.non_negative_int, default=getpdf.DEFAULT_NUM_TRIALS,
+                    help='Number of attempts to download each block.' )
+parser.add_argument('--output-dir', type=str, default='.',
+                    help='Directory of the PDF files. Default value: the current directory' )
+parser.add_argument('--summary', type=str, default='getpdfbib.summary.json',
+                    help='Path of the JSON summary of the successes and failures.' )
+parser.add_argument('--failed', type=str, default='getpdfbib.failed.bib',
+                    help='Path of a Bibtex file receiving the entries that failed, to run them again.' )
+parser.add_argument('--timeout', type=float, default=None,
+                    help='Timeout in seconds of each request, generating a block included. Default value: no timeout' )
 
+# One document to download, for one or more Bibtex entries
+Job = namedtuple('Job', ('ark', 'start', 'end', 'path', 'entries'))
+
+# Bibtex entries, as dictionaries of their fields with their key as 'ID' and
+# their type as 'ENTRYTYPE', like the entries of bibtexparser 1
+Bibliography = namedtuple('Bibliography', ('entries',))
+
+
+def loads_bibtex(text):
+  """Parses Bibtex entries with bibtexparser 1 or 2.
+
+  Returns:
+    Bibliography: The entries.
+  """
+  if BibDatabase is not None:
+    return Bibliography(bibtexparser.loads(text).entries)
+  entries = []
+  for entry in bibtexparser.parse_string(text).entries:
+    fields = {name: field.value for name, field in entry.fields_dict.items()}
+    fields.update(ID=entry.key, ENTRYTYPE=entry.entry_type)
+    entries.append(fields)
+  return Bibliography(entries)
+
+def dumps_bibtex(entries):
+  """Writes entries as returned by loads_bibtex to a Bibtex string."""
+  if BibDatabase is not None:
+    database = BibDatabase()
+    database.entries = list(entries)
+    return bibtexparser.dumps(database)
+  return bibtexparser.write_string(bibtexparser.Library([
+    Entry(bib['ENTRYTYPE'], bib['ID'],
+          [Field(name, value) for name, value in bib.items() if name not in ('ID', 'ENTRYTYPE')])
+    for bib in entries]))
 
-def download_from_bibdb(bib_database, ark_key):
-  for idx, bib in enumerate(bib_database.entries):
-    entrytype = bib['ENTRYTYPE']
-    bibkey = bib['ID']
-    ark = bib[ark_key]
-    if bib.get('vues'):
-      vues = [int(s) for s in bib.get('vues').split('--') if s.isdigit()]
-    else:
-      vues = [1,0]
 
-    logging.info("Downloading {} {}: {} [{}]{}".format(entrytype, idx+1, bibkey, ark, ', views {} to {}'.format(vues[0], vues[1]) if bib.get('vues') else ''))
+def parse_vues(vues):
+  """Parses the view range of an entry, "start--end" or a single view.
+
+  Returns:
+    tuple: The first and last views, (1, 0) for the whole document if vues
+      is empty.
+
+  Raises:
+    ValueError: If vues is not a range of views.
+  """
+  if not vues:
+    return 1, 0  # The whole document
+  bounds = [s.strip() for s in vues.split('--')]
+  if len(bounds) > 2 or not all(s.isdigit() for s in bounds):
+    raise ValueError('Invalid "vues" {!r}, expected a view or a range "start--end"'.format(vues))
+  start, end = int(bounds[0]), int(bounds[-1])
+  if not 1 <= start <= end:
+    raise ValueError('Invalid "vues" {!r}, views start at 1 and end after the start'.format(vues))
+  return start, end
+
+def plan_jobs(bib_database, ark_key, output_dir='.'):
+  """Groups the entries pointing to the same ARK and view range in one job each.
+
+  Entries with an invalid ARK or view range are not planned.
+
+  Returns:
+    tuple: The jobs in the order of their first entry, and the entries that
+      can not be downloaded, each with the reason why.
+  """
+  jobs, invalid = {}, []
+  for bib in bib_database.entries:
+    bibkey = bib['ID']
+    try:
+      ark = Resource(bib[ark_key]).ark
+    except Exception as e:
+      invalid.append((bib, 'Invalid or missing ARK in "{}": {}'.format(ark_key, ' '.join(str(e).split()))))
+      continue
+    try:
+      vues = parse_vues(bib.get('vues'))
+    except ValueError as e:
+      invalid.append((bib, str(e)))
+      continue
+    key = (str(ark.root), vues[0], vues[1])
+    if key in jobs:
+      logging.info("Entry {} is the same document as {}".format(bibkey, jobs[key].entries[0]['ID']))
+      jobs[key].entries.append(bib)
+      continue
     name = "{}{}.pdf".format(bibkey,'_'+str(vues[0])+'_'+str(vues[1]) if bib.get('vues') else '')
-    resource = Resource(ark)
-    getpdf.download_pdf(resource, vues[0], vues[1], 100, 5, name)
+    jobs[key] = Job(ark, vues[0], vues[1], os.path.join(output_dir, name), [bib])
+  return list(jobs.values()), invalid
+
+def download_job(job, blocksize=100, trials=5, workers=1):
+  """Downloads the document of a job.
+
+  Returns:
+    str: None if the document has been downloaded, the reason why not otherwise.
+  """
+  try:
+    resource = Resource(job.ark)
+    end = job.end or getpdf.gallica_nviews(resource)
+    blocksize = getpdf.clamp(blocksize, 1, max(1, end-job.start+1))
+    if getpdf.download_pdf(resource, job.start, end, blocksize, trials, job.path, workers):
+      return None
+    return 'Download failed, see the log. Run again to resume it.'
+  except Exception as e:
+    logging.exception(e)
+    return str(e)
+
+def download_from_bibdb(bib_database, ark_key, documents=1, workers=1, blocksize=100,
+                        trials=5, output_dir='.', summary_path=None, failed_path=None):
+  """Downloads the documents of a Bibtex database, documents at a time.
+
+  Entries pointing to the same ARK and view range are downloaded once. If
+  summary_path is set, the successes and failures are written there as JSON
+  once every document has been processed, and if failed_path is set, the
+  entries that failed are written there as Bibtex, to run them again.
+
+  Returns:
+    dict: The summary.
+  """
+  jobs, invalid = plan_jobs(bib_database, ark_key, output_dir)
+  total = len(bib_database.entries)
+  results = {'succeeded': [], 'failed': []}
+  for bib, reason in invalid:
+    logging.error("Skipping {}: {}".format(bib['ID'], reason))
+    results['failed'].append(_summary_entry(bib, ark_key, None, reason))
+  lock = threading.Lock()
+  counter = [0]
+  work = queue.Queue()
+  for job in jobs:
+    work.put(job)
+
+  def worker():
+    while True:
+      try:
+        job = work.get_nowait()
+      except queue.Empty:
+        return
+      keys = ', '.join(bib['ID'] for bib in job.entries)
+      views = ', views {} to {}'.format(job.start, job.end) if job.end else ''
+      logging.info("Starting {} [{}]{}".format(keys, job.ark, views))
+      began = time.time()
+      reason = download_job(job, blocksize, trials, workers)
+      with lock:
+        for bib in job.entries:
+          counter[0] += 1
+          outcome = 'failed' if reason else 'succeeded'
+          results[outcome].append(_summary_entry(bib, ark_key, job, reason))
+        logging.info("[{}/{}] {} {} in {:.0f}s{}".format(
+          counter[0] + len(invalid), total, keys, 'failed' if reason else 'downloaded',
+          time.time() - began, ': ' + reason if reason else ''))
+
+  threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, documents))]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  logging.info("{} entries downloaded, {} failed.".format(len(results['succeeded']), len(results['failed'])))
+  if summary_path:
+    with open(summary_path, 'w') as summary_file:
+      json.dump(results, summary_file, indent=2)
+  if failed_path and results['failed']:
+    failed_ids = set(entry['ID'] for entry in results['failed'])
+    with open(failed_path, 'w') as failed_file:
+      failed_file.write(dumps_bibtex(bib for bib in bib_database.entries if bib['ID'] in failed_ids))
+    logging.info("Run the failed entries again with: getpdfbib.py {}".format(failed_path))
+  return results
+
+def _summary_entry(bib, ark_key, job, reason):
+  """The summary of an entry, as written in the JSON summary."""
+  entry = {'ID': bib['ID'], 'ark': bib.get(ark_key), 'vues': bib.get('vues')}
+  if job:
+    entry['file'] = job.path
+  if reason:
+    entry['reason'] = reason
+  return entry
 
 if __name__ == "__main__":
     try:
       args = parser.parse_args()
+      opts = {'documents': args.documents or 1, 'workers': args.workers or 1,
+              'blocksize': args.blocksize or 100, 'trials': args.trials or 1,
+              'output_dir': args.output_dir, 'summary_path': args.summary,
+              'failed_path': args.failed}
+      default_transport().timeout = args.timeout
+      if opts['documents'] * opts['workers'] > monadic.DEFAULT_MAX_WORKERS:
+        monadic.Future.configure(max_workers=opts['documents'] * opts['workers'])
       if args.bibtex:
         if os.path.exists(args.bibtex):
           with open(args.bibtex) as bibtex_file:
-            download_from_bibdb(bibtexparser.load(bibtex_file),args.key)
+            results = download_from_bibdb(loads_bibtex(bibtex_file.read()), args.key, **opts)
         else:
-            download_from_bibdb(bibtexparser.loads(args.bibtex), args.key)
+            results = download_from_bibdb(loads_bibtex(args.bibtex), args.key, **opts)
+        sys.exit(1 if results['failed'] else 0)
     except Exception as e:
       logging.critical(str(e))
+      sys.exit(1)
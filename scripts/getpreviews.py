@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+"""
+A simple command-line tool to download the preview images of every view of
+Gallica resources when their ARKs are known.
+"""
+
+import argparse
+import logging
+import os
+import sys
+from gallipy import Resource, monadic
+
+logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.INFO)
+
+RESOLUTIONS = ("thumbnail", "lowres", "medres", "highres")
+
+def download_previews(arks, output_dir, resolution, packed, workers):
+    """Download the previews of each resource to its own directory or zip archive
+
+    Returns:
+        bool: True if every preview has been downloaded, False otherwise.
+    """
+    succeeded = True
+    for idx, ark in enumerate(arks):
+        try:
+            resource = Resource(ark)
+        except Exception as ex: # An invalid ARK must not stop the other ones
+            logging.error("Skipping %s: %s", ark, " ".join(str(ex).split()))
+            succeeded = False
+            continue
+        name = resource.ark.name + (".zip" if packed else "")
+        dest = os.path.join(output_dir, name)
+        either = resource.image_previews_sync(dest, resolution, max_concurrency=workers)
+        if either.is_left:
+            logging.error("[%d/%d] %s failed: %s", idx+1, len(arks), ark, either.value)
+            succeeded = False
+            continue
+        summary = either.value
+        for view, reason in summary["failed"]:
+            logging.debug("View %d of %s failed: %s", view, ark, reason)
+        logging.info("[%d/%d] %s: %d previews downloaded, %d already there, %d failed -> %s",
+                     idx+1, len(arks), ark, summary["fetched"], summary["skipped"],
+                     len(summary["failed"]), dest)
+        succeeded = succeeded and not summary["failed"]
+    return succeeded
+
+def read_arks(path):
+    """The ARKs of a file, one per line. Blank lines and lines starting with # are ignored"""
+    with open(path) as istream:
+        lines = (line.strip() for line in istream)
+        return [line for line in lines if line and not line.startswith("#")]
+
+def positive_int(value):
+    """Positive integer"""
+    ivalue = int(value)
+    if ivalue < 1:
+        raise argparse.ArgumentTypeError("Parameter must be a positive integer, not %s" % value)
+    return ivalue
+
+def parse_args():
+    """Parse arguments"""
+    parser = argparse.ArgumentParser(description="""A simple script to download the previews
+                                        of every view of archival resources hosted on gallica.bnf.fr.""")
+    parser.add_argument("ark", type=str, nargs="*",
+                        help="""The Archival Resource Keys of the resources.
+                        Can be Gallica URLs (https://gallica.bnf.fr/ark:/12148/bpt6k9764647w)
+                        or ARK URIs (ark:/12148/bpt6k9764647w)""")
+    parser.add_argument("-f", "--arks-file", type=str,
+                        help="A file listing ARKs, one per line.")
+    parser.add_argument("-o", "--output-dir", type=str, default=".",
+                        help="""Directory receiving one directory (or zip archive) of previews
+                            per resource. Default value: the current directory""")
+    parser.add_argument("-r", "--resolution", choices=RESOLUTIONS, default="thumbnail",
+                        help="Resolution of the previews. Default value: thumbnail")
+    parser.add_argument("--zip", action="store_true",
+                        help="Pack the previews of each resource in a zip archive.")
+    parser.add_argument("--workers", type=positive_int, default=8,
+                        help="Number of previews downloaded concurrently. Default value: 8")
+    pargs = parser.parse_args()
+
+    arks = list(pargs.ark)
+    if pargs.arks_file:
+        arks += read_arks(pargs.arks_file)
+    if not arks:
+        parser.error("No ARK given")
+    os.makedirs(pargs.output_dir, exist_ok=True)
+    if pargs.workers > monadic.DEFAULT_MAX_WORKERS:
+        monadic.Future.configure(max_workers=pargs.workers)
+    return arks, pargs.output_dir, pargs.resolution, pargs.zip, pargs.workers
+
+if __name__ == "__main__":
+    sys.exit(0 if download_previews(*parse_args()) else 1)
@@ -14,11 +14,17 @@ setuptools.setup(
     url="https://github.com/GeoHistoricalData/gallipy",
     packages=setuptools.find_packages(),
     classifiers=[
-        "Programming Language :: Python :: 3.5",
+        "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3 :: Only",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
+        "Programming Language :: Python :: 3.12",
         "License :: OSI Approved :: GNU Affero General Public License v3 or later (AGPLv3+)",
         "Operating System :: OS Independent",
     ],
-    python_requires='>=3.5',
+    python_requires='>=3.8',
     install_requires=[
         'xmltodict',
         'beautifulsoup4',
@@ -26,6 +32,9 @@ setuptools.setup(
         'lark-parser',
         'lxml',
     ],
+    extras_require={
+        'tiles': ['numpy', 'Pillow'],
+    },
     setup_requires=['pytest-runner'],
     tests_require=['pytest'],
 )
@@ -0,0 +1,66 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+
+class _Handler(BaseHTTPRequestHandler):
+  """Serves the routes of the server, a dict path -> handler(request)."""
+  protocol_version = "HTTP/1.1"
+  disable_nagle_algorithm = True
+
+  def do_GET(self):
+    self.server.requests.append(self.path)
+    route = self.server.routes.get(self.path)
+    if route is None:
+      status, headers, body = 404, {}, b"not found"
+    else:
+      status, headers, body = route(self) if callable(route) else route
+    self.send_response(status)
+    for key, value in headers.items():
+      self.send_header(key, value)
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def setup(self):
+    super().setup()
+    self.server.connections += 1
+
+  def log_message(self, *args):
+    pass
+
+
+@pytest.fixture
+def server():
+  """A local HTTP/1.1 keep-alive server.
+
+  Set routes with server.routes[path] = (status, headers, body), or a callable
+  taking the request handler and returning such a tuple.
+  """
+  httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+  httpd.daemon_threads = True
+  httpd.routes = {}
+  httpd.requests = []
+  httpd.connections = 0
+  httpd.url = "http://127.0.0.1:{}".format(httpd.server_address[1])
+  thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+  thread.start()
+  yield httpd
+  httpd.shutdown()
+  httpd.server_close()
+
+
+@pytest.fixture
+def gallica(server, monkeypatch):
+  """The local server, standing in for gallica.bnf.fr in every built URL."""
+  from gallipy import helpers
+  monkeypatch.setitem(helpers._BASE_PARTS, "scheme", "http")
+  monkeypatch.setitem(helpers._BASE_PARTS, "netloc", server.url.split("//")[1])
+  return server
+
+
+@pytest.fixture(autouse=True)
+def clear_default_memo():
+  """Metadata memoized by a test must not leak into the next one."""
+  from gallipy.cache import default_memo
+  default_memo().invalidate()
@@ -0,0 +1,59 @@
+import math
+import pytest
+from gallipy import Resource
+from gallipy import alto
+from gallipy.alto import parse_alto
+from gallipy.monadic import Left
+
+ALTO = b'''<?xml version="1.0" encoding="UTF-8"?>
+<alto xmlns="http://bibnum.bnf.fr/ns/alto_prod">
+  <Description><MeasurementUnit>pixel</MeasurementUnit></Description>
+  <Layout><Page ID="PAG_1" WIDTH="2000" HEIGHT="3000"><PrintSpace>
+    <TextBlock ID="TB1">
+      <TextLine ID="TL1">
+        <String CONTENT="Rue" HPOS="10" VPOS="20" WIDTH="50" HEIGHT="10" WC="0.9"/><SP/>
+        <String CONTENT="de" HPOS="70" VPOS="20" WIDTH="20" HEIGHT="10" WC="0.8"/>
+      </TextLine>
+      <TextLine ID="TL2"><String CONTENT="Rivoli" HPOS="10" VPOS="40" WIDTH="60" HEIGHT="10"/></TextLine>
+    </TextBlock>
+    <TextBlock ID="TB2"><TextLine ID="TL3">
+      <String CONTENT="Paris" HPOS="1000" VPOS="2000" WIDTH="80" HEIGHT="12" WC="0.5"/>
+    </TextLine></TextBlock>
+  </PrintSpace></Page></Layout>
+</alto>'''
+
+
+def test_columns():
+  page = parse_alto(ALTO).value
+  assert page.words == ["Rue", "de", "Rivoli", "Paris"]
+  assert list(page.hpos) == [10, 70, 10, 1000] and page.box(3) == (1000, 2000, 80, 12)
+  assert list(page.line) == [0, 0, 1, 2] and page.line_ids == ["TL1", "TL2", "TL3"]
+  assert list(page.block) == [0, 0, 0, 1] and page.block_ids == ["TB1", "TB2"]
+  assert page.conf[0] == pytest.approx(0.9) and math.isnan(page.conf[2])
+  assert (page.width, page.height, page.unit) == (2000, 3000, "pixel")
+  assert page.text() == "Rue de\nRivoli\nParis"
+
+def test_without_namespace():
+  page = parse_alto(ALTO.replace(b' xmlns="http://bibnum.bnf.fr/ns/alto_prod"', b"")).value
+  assert len(page) == 4
+
+@pytest.mark.parametrize("vectorised", [True, False])
+def test_select(monkeypatch, vectorised):
+  if vectorised:
+    pytest.importorskip("numpy")
+  else:
+    monkeypatch.setattr(alto, "numpy", None)
+  page = parse_alto(ALTO).value
+  assert page.select(0, 0, 100, 100) == [0, 1, 2]
+  assert page.select(0, 0, 80, 100, contained=True) == [0, 2]
+  assert page.select(55, 15, 500, 10) == [0, 1]
+  assert page.text(page.select(0, 0, 100, 35)) == "Rue de"
+
+def test_invalid_document():
+  assert isinstance(parse_alto(b"<alto><String"), Left)
+
+def test_ocr_page(gallica):
+  gallica.routes["/RequestDigitalElement?O=bpt6k5738219s&E=ALTO&Deb=4"] = (200, {}, ALTO)
+  resource = Resource('ark:/12148/bpt6k5738219s')
+  assert resource.ocr_page_sync(4).value.words[-1] == "Paris"
+  assert len(resource.ocr_page(4).result(5).value.value) == 4
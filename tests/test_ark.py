@@ -119,3 +119,24 @@ def test_copy(test):
     """Test copy constructor."""
     ark = Ark.parse(test).value
     assert str(ark.copy()) == str(ark)
+
+TEST_CASES = [
+    ('ark:/12148/bpt6k5619759j'),
+    ('ark:/12148/bpt6k5619759j/f1n10.pdf'),
+    ('https://gallica.bnf.fr/ark:/12148/bpt6k5619759j/f1n10.pdf?query=test'),
+    ('http://gallica.bnf.fr:80/ark:/12148/bpt6k5619759j#date'),
+    ('https://gallica.bnf.fr/ark:/12148/cb32798952c/date&date=1937'),
+]
+
+@pytest.mark.parametrize("test", TEST_CASES)
+def test_fast_path_equivalent_to_slow_path(test):
+    """Ensure the regex fast path and the Lark parser agree."""
+    assert repr(Ark.parse(test).value) == repr(Ark._parse_slow(test).value)
+
+def test_parse_many():
+    """Test bulk parsing keeps input order and does not stop on failures."""
+    tests = ['ark:/12148/bpt6k5619759j', 'ark:/12148/', None,
+             'https://gallica.bnf.fr/ark:/12148/cb32798952c/date']
+    results = list(Ark.parse_many(tests))
+    assert [type(r) for r in results] == [Right, Left, Left, Right]
+    assert str(results[-1].value) == tests[-1]
@@ -0,0 +1,58 @@
+import asyncio
+import urllib.error
+import pytest
+from gallipy import AsyncResource
+from gallipy.monadic import Left, Right
+from gallipy.transport import AsyncTransport
+
+ARK = 'ark:/12148/bpt6k5738219s'
+PAGINATION = b'<livre><structure><nbVueImages>3</nbVueImages></structure></livre>'
+
+
+def run(coroutine):
+  return asyncio.run(coroutine)
+
+def test_transport_reuses_connections(server):
+  server.routes["/a"] = (200, {}, b"hello")
+  async def main():
+    async with AsyncTransport() as transport:
+      return [await transport.get(server.url + "/a") for _ in range(5)]
+  assert run(main()) == [b"hello"] * 5
+  assert server.connections == 1
+
+def test_transport_error_status(server):
+  async def main():
+    async with AsyncTransport() as transport:
+      await transport.get(server.url + "/missing")
+  with pytest.raises(urllib.error.HTTPError):
+    run(main())
+
+def test_pagination_returns_either(gallica):
+  gallica.routes["/services/Pagination?ark=bpt6k5738219s"] = (200, {}, PAGINATION)
+  either = run(AsyncResource(ARK).pagination())
+  assert isinstance(either, Right)
+  assert either.value['livre']['structure']['nbVueImages'] == '3'
+  assert isinstance(run(AsyncResource(ARK).toc()), Left)
+
+def test_content_uses_pagination(gallica):
+  gallica.routes["/services/Pagination?ark=bpt6k5738219s"] = (200, {}, PAGINATION)
+  gallica.routes["/ark:/12148/bpt6k5738219s/f2n2.pdf"] = (200, {}, b"%PDF")
+  assert run(AsyncResource(ARK).content(startview=2)).value == b"%PDF"
+
+def test_concurrency_is_bounded(gallica):
+  inflight = []
+  peak = []
+  def slow(request):
+    inflight.append(1)
+    peak.append(len(inflight))
+    import time; time.sleep(0.05)
+    inflight.pop()
+    return 200, {}, b"img"
+  for view in range(1, 11):
+    gallica.routes["/ark:/12148/bpt6k5738219s/f{}.thumbnail".format(view)] = slow
+  resource = AsyncResource(ARK, max_concurrency=3)  # Before the loop runs
+  async def main():
+    return await asyncio.gather(*(resource.image_preview(view=v) for v in range(1, 11)))
+  results = run(main())
+  assert all(r.value == b"img" for r in results)
+  assert max(peak) <= 3
@@ -0,0 +1,62 @@
+import socket
+import pytest
+from gallipy import Resource
+from gallipy.blocks import AdaptiveBlockSize, adaptive_blocks, content_blocks
+from gallipy.monadic import Left, Right
+
+
+def test_size_grows_when_fast_and_shrinks_when_slow():
+  sizer = AdaptiveBlockSize(initial=10, minimum=5, maximum=40, target=10)
+  assert sizer.success(10, 1) == 15
+  assert sizer.success(15, 1) == 22
+  assert sizer.success(22, 0.1) == 33
+  assert sizer.success(33, 0.1) == 40
+  assert sizer.success(40, 7) == 40
+  assert sizer.success(40, 20) == 20
+  assert sizer.stats["blocks"] == 6 and sizer.stats["views"] == 160
+
+def test_size_shrinks_after_errors_and_more_after_timeouts():
+  sizer = AdaptiveBlockSize(initial=100, minimum=5, maximum=100)
+  assert sizer.failure(Exception("503")) == 50
+  assert sizer.failure(socket.timeout("timed out")) == 12
+  assert sizer.failure(Exception("<urlopen error timed out>")) == 5
+  assert (sizer.stats["errors"], sizer.stats["timeouts"]) == (1, 2)
+
+def test_invalid_limits():
+  with pytest.raises(ValueError):
+    AdaptiveBlockSize(minimum=10, maximum=5)
+
+def test_adaptive_blocks_cover_the_range_and_retry_smaller():
+  calls = []
+  def fetch(start, n):
+    calls.append((start, n))
+    return Left(Exception("503")) if len(calls) == 2 else Right(n)
+  sizer = AdaptiveBlockSize(initial=4, minimum=1, maximum=8, target=10)
+  blocks = [(start, n) for start, n, _ in adaptive_blocks(fetch, 1, 20, sizer, clock=lambda: 0)]
+  assert calls[:3] == [(1, 4), (5, 6), (5, 3)]
+  assert blocks[0] == (1, 4) and blocks[1] == (5, 3)
+  assert sum(n for _, n in blocks) == 20
+  assert all(a + n == b for (a, n), (b, _) in zip(blocks, blocks[1:]))
+
+def test_adaptive_blocks_stop_after_trials():
+  fetch = lambda start, n: Left(Exception("503")) if start > 1 else Right(n)
+  sizer = AdaptiveBlockSize(initial=4, minimum=1, maximum=4)
+  results = list(adaptive_blocks(fetch, 1, 20, sizer, trials=3, clock=lambda: 0))
+  assert [(start, n) for start, n, _ in results] == [(1, 4), (5, 1)]
+  assert isinstance(results[-1][2], Left)
+
+def test_content_blocks(gallica):
+  gallica.routes["/services/Pagination?ark=bpt6k5738219s"] = (
+    200, {}, b'<livre><structure><nbVueImages>5</nbVueImages></structure></livre>')
+  for path in ("/ark:/12148/bpt6k5738219s/f1n2.pdf", "/ark:/12148/bpt6k5738219s/f3n3.pdf"):
+    gallica.routes[path] = (200, {}, b"%PDF")
+  sizer = AdaptiveBlockSize(initial=2, minimum=1, maximum=3)
+  blocks = list(content_blocks(Resource('ark:/12148/bpt6k5738219s'), sizer=sizer))
+  assert [(start, n, e.value) for start, n, e in blocks] == [(1, 2, b"%PDF"), (3, 3, b"%PDF")]
+
+def test_content_blocks_without_nviews(gallica):
+  gallica.routes["/services/Pagination?ark=bpt6k5738219s"] = (500, {}, b"")
+  gallica.routes["/iiif/ark:/12148/bpt6k5738219s/manifest.json"] = (404, {}, b"")
+  blocks = list(content_blocks(Resource('ark:/12148/bpt6k5738219s'), trials=1))
+  assert len(blocks) == 1 and blocks[0][:2] == (1, 0) and isinstance(blocks[0][2], Left)
+  assert not any(".pdf" in path for path in gallica.requests)
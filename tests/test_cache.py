@@ -0,0 +1,67 @@
+import asyncio
+from gallipy import Resource, AsyncResource
+from gallipy.cache import Cache
+from gallipy.monadic import Left
+
+ARK = 'ark:/12148/bpt6k5738219s'
+PAGINATION_PATH = "/services/Pagination?ark=bpt6k5738219s"
+PAGINATION = b'<livre><structure><nbVueImages>3</nbVueImages></structure></livre>'
+
+
+def etag_route(request):
+  if request.headers.get("If-None-Match") == '"v1"':
+    return 304, {"ETag": '"v1"'}, b""
+  return 200, {"ETag": '"v1"'}, PAGINATION
+
+def test_fresh_entries_are_served_from_cache(gallica, tmp_path):
+  gallica.routes[PAGINATION_PATH] = (200, {}, PAGINATION)
+  with Cache(str(tmp_path / "cache.db")) as cache:
+    first = Resource(ARK, cache=cache).pagination_sync()
+    second = Resource(ARK, cache=cache).pagination_sync()
+  assert first.value == second.value
+  assert gallica.requests == [PAGINATION_PATH]
+
+def test_expired_entries_are_revalidated(gallica, tmp_path):
+  gallica.routes[PAGINATION_PATH] = etag_route
+  with Cache(str(tmp_path / "cache.db"), ttls={"Pagination": 0}) as cache:
+    Resource(ARK, cache=cache).pagination_sync()
+    either = Resource(ARK, cache=cache).pagination_sync()
+  assert either.value['livre']['structure']['nbVueImages'] == '3'
+  assert len(gallica.requests) == 2
+
+def test_cache_persists_and_works_offline(gallica, tmp_path):
+  gallica.routes[PAGINATION_PATH] = (200, {}, PAGINATION)
+  path = str(tmp_path / "cache.db")
+  with Cache(path) as cache:
+    Resource(ARK, cache=cache).pagination_sync()
+  with Cache(path, ttls={"Pagination": 0}, offline=True) as cache:
+    resource = Resource(ARK, cache=cache)
+    assert not resource.pagination_sync().is_left
+    assert isinstance(resource.oairecord_sync(), Left)
+    assert isinstance(resource.image_preview_sync(), Left)
+  assert len(gallica.requests) == 1
+
+def test_uncached_services_are_not_stored(gallica, tmp_path):
+  gallica.routes["/ark:/12148/bpt6k5738219s/f1.thumbnail"] = (200, {}, b"jpeg")
+  with Cache(str(tmp_path / "cache.db")) as cache:
+    assert Resource(ARK, cache=cache).image_preview_sync().value == b"jpeg"
+    assert cache.size() == 0
+
+def test_lru_eviction(tmp_path):
+  with Cache(str(tmp_path / "cache.db"), max_size=25) as cache:
+    for key in ("a", "b", "c"):
+      cache.put("Pagination", key, b"x" * 10)
+      cache.get("Pagination", "a")  # Keeps a recently used
+    assert cache.get("Pagination", "b") is None
+    assert cache.get("Pagination", "a") is not None
+    assert cache.size() <= 25
+
+def test_async_resource_uses_cache(gallica, tmp_path):
+  gallica.routes[PAGINATION_PATH] = etag_route
+  with Cache(str(tmp_path / "cache.db"), ttls={"Pagination": 0}) as cache:
+    async def main():
+      resource = AsyncResource(ARK, cache=cache)
+      return [await resource.pagination() for _ in range(2)]
+    first, second = asyncio.run(main())
+  assert first.value == second.value
+  assert len(gallica.requests) == 2
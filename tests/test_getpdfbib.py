@@ -0,0 +1,62 @@
+import os
+import sys
+import pytest
+
+pytest.importorskip("bibtexparser")
+pytest.importorskip("PyPDF2")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+import getpdfbib
+
+ARK = "https://gallica.bnf.fr/ark:/12148/bpt6k5738219s"
+
+
+class Database:
+  def __init__(self, *entries):
+    self.entries = list(entries)
+
+def entry(key, vues=None, ark=ARK):
+  bib = {"ID": key, "eprint": ark}
+  if vues is not None:
+    bib["vues"] = vues
+  return bib
+
+
+def test_duplicate_entries_share_a_job():
+  jobs, invalid = getpdfbib.plan_jobs(Database(
+    entry("a", "3--5"), entry("b", "3--5", ARK + "/f3.item"), entry("c")), "eprint", "out")
+  assert not invalid
+  assert [[bib["ID"] for bib in job.entries] for job in jobs] == [["a", "b"], ["c"]]
+  assert [(job.start, job.end, job.path) for job in jobs] == [
+    (3, 5, os.path.join("out", "a_3_5.pdf")), (1, 0, os.path.join("out", "c.pdf"))]
+
+def test_overlapping_views_are_separate_jobs():
+  jobs, invalid = getpdfbib.plan_jobs(Database(
+    entry("a", "1--10"), entry("b", "5--12"), entry("c", "5")), "eprint")
+  assert not invalid
+  assert [(job.start, job.end) for job in jobs] == [(1, 10), (5, 12), (5, 5)]
+  assert len(set(job.path for job in jobs)) == 3
+
+@pytest.mark.parametrize("vues", ["--", "abc", "5--", "--5", "3--x", "1--2--3", "0--4", "9--2"])
+def test_malformed_views_are_invalid(vues):
+  jobs, invalid = getpdfbib.plan_jobs(Database(entry("a", vues), entry("b", "1--2")), "eprint")
+  assert [job.entries[0]["ID"] for job in jobs] == ["b"]
+  assert len(invalid) == 1 and invalid[0][0]["ID"] == "a" and "vues" in invalid[0][1]
+
+def test_invalid_arks_are_invalid():
+  jobs, invalid = getpdfbib.plan_jobs(Database(entry("a", ark="nope"), {"ID": "b"}), "eprint")
+  assert not jobs and [bib["ID"] for bib, _ in invalid] == ["a", "b"]
+
+def test_bibtex_round_trip():
+  text = "@book{a,\n  eprint = {ark:/12148/bpt6k5738219s},\n  vues = {3--5}\n}\n"
+  entries = getpdfbib.loads_bibtex(text).entries
+  assert entries == [{"ID": "a", "ENTRYTYPE": "book", "eprint": "ark:/12148/bpt6k5738219s", "vues": "3--5"}]
+  assert getpdfbib.loads_bibtex(getpdfbib.dumps_bibtex(entries)).entries == entries
+
+def test_invalid_entries_are_failed(tmp_path):
+  text = "@book{a,\n  eprint = {ark:/12148/bpt6k5738219s},\n  vues = {--}\n}\n" \
+         "@book{b,\n  eprint = {nope}\n}\n"
+  failed = str(tmp_path / "failed.bib")
+  results = getpdfbib.download_from_bibdb(getpdfbib.loads_bibtex(text), "eprint", failed_path=failed)
+  assert results["succeeded"] == [] and [entry["ID"] for entry in results["failed"]] == ["a", "b"]
+  with open(failed) as failed_file:
+    assert [bib["ID"] for bib in getpdfbib.loads_bibtex(failed_file.read()).entries] == ["a", "b"]
@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+import zipfile
+from gallipy import Resource, harvest
+from gallipy.monadic import Future
+from gallipy.harvest import document_nviews, harvest_ocr
+from gallipy.ocrstore import OcrStore
+
+ARK = 'ark:/12148/bpt6k5738219s'
+PAGINATION_PATH = "/services/Pagination?ark=bpt6k5738219s"
+PAGINATION = b'<livre><structure><nbVueImages>4</nbVueImages></structure></livre>'
+
+
+def serve_previews(gallica, nviews, failing=()):
+  gallica.routes[PAGINATION_PATH] = (200, {}, PAGINATION)
+  for view in range(1, nviews + 1):
+    status = 404 if view in failing else 200
+    gallica.routes["/ark:/12148/bpt6k5738219s/f{}.thumbnail".format(view)] = (status, {}, b"jpeg%d" % view)
+
+
+def test_nviews_from_manifest_if_pagination_fails(gallica):
+  manifest = {"sequences": [{"canvases": [{}, {}, {}]}]}
+  gallica.routes["/iiif/ark:/12148/bpt6k5738219s/manifest.json"] = (200, {}, json.dumps(manifest).encode())
+  assert document_nviews(Resource(ARK)).value == 3
+
+def test_previews_to_directory_skip_existing(gallica, tmp_path):
+  serve_previews(gallica, 4, failing=[3])
+  (tmp_path / "f2.thumbnail.jpg").write_bytes(b"old")
+  summary = Resource(ARK).image_previews_sync(str(tmp_path)).value
+  assert (summary["fetched"], summary["skipped"]) == (2, 1)
+  assert [view for view, _ in summary["failed"]] == [3]
+  assert (tmp_path / "f4.thumbnail.jpg").read_bytes() == b"jpeg4"
+  assert (tmp_path / "f2.thumbnail.jpg").read_bytes() == b"old"
+  assert "/ark:/12148/bpt6k5738219s/f2.thumbnail" not in gallica.requests
+
+def test_previews_to_zip(gallica, tmp_path):
+  serve_previews(gallica, 4)
+  dest = str(tmp_path / "previews.zip")
+  resource = Resource(ARK)
+  assert resource.image_previews_sync(dest, views=[1, 2]).value["fetched"] == 2
+  summary = resource.image_previews(dest).result(5).value.value
+  assert (summary["fetched"], summary["skipped"]) == (2, 2)
+  with zipfile.ZipFile(dest) as archive:
+    assert sorted(archive.namelist()) == ["f{}.thumbnail.jpg".format(v) for v in range(1, 5)]
+    assert archive.read("f3.thumbnail.jpg") == b"jpeg3"
+
+def test_ocr_harvest_resumes_page_by_page(gallica, tmp_path):
+  alto = b'<alto><Page><TextLine><String CONTENT="v%d"/><String CONTENT="mot"/></TextLine></Page></alto>'
+  serve_previews(gallica, 4)
+  for view in range(1, 5):
+    gallica.routes["/RequestDigitalElement?O=bpt6k5738219s&E=ALTO&Deb={}".format(view)] = (
+      404 if view == 3 else 200, {}, alto % view)
+  dest = str(tmp_path / "ocr")
+  summary = harvest_ocr([Resource(ARK), Resource('ark:/12148/bpt6k0000000q')], dest).value
+  assert (summary["fetched"], summary["skipped"], summary["words"]) == (3, 0, 6)
+  assert [(ark, view) for ark, view, _ in summary["failed"]] == [
+    ("ark:/12148/bpt6k5738219s", 3), ("ark:/12148/bpt6k0000000q", None)]
+
+  gallica.routes["/RequestDigitalElement?O=bpt6k5738219s&E=ALTO&Deb=3"] = (200, {}, alto % 3)
+  del gallica.requests[:]
+  summary = harvest_ocr([Resource(ARK)], dest, max_concurrency=2).value
+  assert (summary["fetched"], summary["skipped"], summary["failed"]) == (1, 3, [])
+  assert [path for path in gallica.requests if "ALTO" in path] == [
+    "/RequestDigitalElement?O=bpt6k5738219s&E=ALTO&Deb=3"]
+  with OcrStore(dest) as store:
+    assert store.page(ARK, 3).words == ["v3", "mot"] and len(store) == 8
+
+def test_concurrent_harvests_do_not_starve_the_pool(gallica, tmp_path):
+  serve_previews(gallica, 4)
+  Future.configure(max_workers=2)
+  try:
+    futures = [Resource(ARK).image_previews(str(tmp_path / str(i))) for i in range(3)]
+    assert [future.result(5).value.value["fetched"] for future in futures] == [4, 4, 4]
+  finally:
+    Future.configure()
+
+def test_interrupted_zip_harvest_resumes(gallica, tmp_path):
+  serve_previews(gallica, 4)
+  dest = str(tmp_path / "previews.zip")
+  store = harvest._ZipStore(dest)
+  for view in (1, 2):
+    store.fetch(Resource(ARK), "thumbnail", view, "f{}.thumbnail.jpg".format(view))
+  store._zip.fp.flush()
+  # The process is killed while a third preview is being written
+  killed = (tmp_path / "previews.zip.part").read_bytes() + b"PK\x03\x04truncated"
+  store._zip.close()
+  (tmp_path / "previews.zip.part").write_bytes(killed)
+  assert not zipfile.is_zipfile(dest + ".part")
+
+  del gallica.requests[:]
+  summary = Resource(ARK).image_previews_sync(dest).value
+  assert (summary["fetched"], summary["skipped"]) == (2, 2)
+  assert sorted(path for path in gallica.requests if "thumbnail" in path) == [
+    "/ark:/12148/bpt6k5738219s/f3.thumbnail", "/ark:/12148/bpt6k5738219s/f4.thumbnail"]
+  assert not (tmp_path / "previews.zip.part").exists()
+  with zipfile.ZipFile(dest) as archive:
+    assert sorted(archive.namelist()) == ["f{}.thumbnail.jpg".format(v) for v in range(1, 5)]
+    assert archive.read("f1.thumbnail.jpg") == b"jpeg1" and archive.testzip() is None
+
+def test_ocr_harvest_runs_documents_concurrently(gallica, tmp_path):
+  alto = b'<alto><Page><TextLine><String CONTENT="mot"/></TextLine></Page></alto>'
+  names = ["bpt6k00000{}".format(i) for i in range(1, 5)]
+  lock, active, peak = threading.Lock(), [0], [0]
+  def slow_alto(request):
+    with lock:
+      active[0] += 1
+      peak[0] = max(peak[0], active[0])
+    time.sleep(0.2)
+    with lock:
+      active[0] -= 1
+    return 200, {}, alto
+  for name in names:
+    gallica.routes["/services/Pagination?ark=" + name] = (
+      200, {}, b'<livre><structure><nbVueImages>1</nbVueImages></structure></livre>')
+    gallica.routes["/RequestDigitalElement?O={}&E=ALTO&Deb=1".format(name)] = slow_alto
+  resources = [Resource("ark:/12148/" + name) for name in names + names[:1]]
+  summary = harvest_ocr(resources, str(tmp_path / "ocr"), max_concurrency=4).value
+  assert (summary["fetched"], summary["failed"]) == (4, [])
+  assert peak[0] == 4
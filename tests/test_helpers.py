@@ -0,0 +1,69 @@
+from bs4 import BeautifulSoup
+from xmltodict import parse as parsexmltodict
+from gallipy import helpers as h
+from gallipy.monadic import Left
+from gallipy.transport import Transport
+
+PAGINATION = (b'<?xml version="1.0" encoding="UTF-8"?>\n<livre><structure>'
+              b'<nbVueImages>2</nbVueImages></structure><pages>'
+              b'<page><numero>1</numero><ordre>1</ordre></page>'
+              b'<page><numero>\xc3\xa9</numero><ordre>2</ordre></page>'
+              b'</pages></livre>')
+
+
+def test_fetch_xml_same_as_beautifulsoup_roundtrip(server):
+  """Single-pass parsing gives the same tree as the former soup->str->dict path."""
+  server.routes["/services/Pagination"] = (200, {}, PAGINATION)
+  with Transport() as transport:
+    either = h.fetch_xml(server.url + "/services/Pagination", transport)
+  assert either.value == parsexmltodict(str(BeautifulSoup(PAGINATION, 'xml')))
+  assert either.value['livre']['pages']['page'][1]['numero'] == 'é'
+
+def test_fetch_xml_invalid_document(server):
+  server.routes["/services/Pagination"] = (200, {}, b"<livre>")
+  with Transport() as transport:
+    assert isinstance(h.fetch_xml(server.url + "/services/Pagination", transport), Left)
+
+def test_fetch_stream_yields_chunks(server):
+  server.routes["/big"] = (200, {}, b"x" * 1000)
+  with Transport() as transport:
+    chunks = list(h.fetch_stream(server.url + "/big", transport, chunk_size=300))
+  assert [len(c) for c in chunks] == [300, 300, 300, 100]
+
+def test_fetch_to_file(server, tmp_path):
+  server.routes["/big"] = (200, {}, b"x" * 1000)
+  dest = str(tmp_path / "big.bin")
+  with Transport() as transport:
+    assert h.fetch_to_file(server.url + "/big", dest, transport).value == dest
+    assert isinstance(h.fetch_to_file(server.url + "/missing", str(tmp_path / "no"), transport), Left)
+  assert open(dest, "rb").read() == b"x" * 1000
+  assert sorted(p.name for p in tmp_path.iterdir()) == ["big.bin"]
+
+def test_fetch_to_file_resumes_partial_download(server, tmp_path):
+  data = bytes(range(256)) * 4
+  def ranged(request):
+    offset = int(request.headers.get("Range", "bytes=0-")[6:-1])
+    if not offset:
+      return 200, {}, data
+    content_range = "bytes {}-{}/{}".format(offset, len(data) - 1, len(data))
+    return 206, {"Content-Range": content_range}, data[offset:]
+  server.routes["/big"] = ranged
+  dest = str(tmp_path / "big.bin")
+  with open(dest + ".part", "wb") as ostream:
+    ostream.write(data[:300])
+  with Transport() as transport:
+    assert h.fetch_to_file(server.url + "/big", dest, transport, resume=True).value == dest
+  assert open(dest, "rb").read() == data
+  assert not (tmp_path / "big.bin.part").exists()
+
+def test_resource_to_file_variants(gallica, tmp_path):
+  import io
+  from gallipy import Resource
+  gallica.routes["/ark:/12148/bpt6k5738219s/f1n2.pdf"] = (200, {}, b"%PDF")
+  gallica.routes["/ark:/12148/bpt6k5738219s/f3.thumbnail"] = (200, {}, b"jpeg")
+  resource = Resource('ark:/12148/bpt6k5738219s')
+  buffer = io.BytesIO()
+  assert resource.content_to_file_sync(buffer, nviews=2).value is buffer
+  assert buffer.getvalue() == b"%PDF"
+  dest = str(tmp_path / "f3.jpg")
+  assert resource.image_preview_to_file(dest, view=3).result(5).value.value == dest
@@ -0,0 +1,50 @@
+import datetime
+from gallipy import Resource
+from gallipy.issues import Issue, IssueIndex, crawl_issues
+
+ARK = 'ark:/12148/cb32798952c/date'
+ISSUES_PATH = "/services/Issues?ark=ark%3A%2F12148%2Fcb32798952c%2Fdate&date={}"
+THIS_YEAR = datetime.date.today().year
+
+
+def serve_years(gallica, years, failing=()):
+  gallica.routes[ISSUES_PATH.format("")] = (200, {}, "<issues>{}</issues>".format(
+    "".join("<year>{}</year>".format(year) for year in years)).encode())
+  for year in years:
+    issues = "".join('<issue ark="bpt6k{0}{1:03d}" dayOfYear="{1}">{1}</issue>'.format(year, day)
+                     for day in (1, 32, 60))
+    gallica.routes[ISSUES_PATH.format(year)] = (404 if year in failing else 200, {},
+                                                '<issues date="{}">{}</issues>'.format(year, issues).encode())
+
+def fetched_years(gallica):
+  return sorted(path.rpartition("=")[2] for path in gallica.requests if "Issues" in path)
+
+
+def test_crawl_and_query(gallica, tmp_path):
+  serve_years(gallica, [1936, 1937, 1938], failing=[1938])
+  dest = str(tmp_path / "issues.sqlite")
+  summary = crawl_issues(Resource(ARK), dest).value
+  assert (summary["fetched"], summary["skipped"], summary["issues"]) == (2, 0, 6)
+  assert [year for year, _ in summary["failed"]] == [1938]
+  with IssueIndex(dest) as index:
+    issues = index.issues("ark:/12148/cb32798952c", "1936-02-01", datetime.date(1937, 1, 1))
+    assert issues == [Issue("ark:/12148/bpt6k1936032", datetime.date(1936, 2, 1), 1936),
+                      Issue("ark:/12148/bpt6k1936060", datetime.date(1936, 2, 29), 1936),
+                      Issue("ark:/12148/bpt6k1937001", datetime.date(1937, 1, 1), 1937)]
+    assert len(index.issues("ark:/12148/cb32798952c")) == len(index) == 6
+    assert index.issues("ark:/12148/other") == []
+
+def test_refresh_only_fetches_running_and_new_years(gallica, tmp_path):
+  dest = str(tmp_path / "issues.sqlite")
+  serve_years(gallica, [1937, THIS_YEAR], failing=[1937])
+  crawl_issues(Resource(ARK), dest)
+  serve_years(gallica, [1936, 1937, THIS_YEAR])
+  del gallica.requests[:]
+  summary = crawl_issues(Resource(ARK), dest, max_concurrency=2).value
+  assert (summary["fetched"], summary["skipped"], summary["failed"]) == (3, 0, [])
+  del gallica.requests[:]
+  summary = crawl_issues(Resource(ARK), dest).value
+  assert (summary["fetched"], summary["skipped"]) == (1, 2)
+  assert fetched_years(gallica) == ["", str(THIS_YEAR)]
+  with IssueIndex(dest) as index:
+    assert len(index) == 9
@@ -0,0 +1,55 @@
+import threading
+from gallipy import Resource
+from gallipy.cache import Memo
+from gallipy.monadic import Left, Right
+
+ARK = 'ark:/12148/bpt6k5738219s'
+PAGINATION_PATH = "/services/Pagination?ark=bpt6k5738219s"
+PAGINATION = b'<livre><structure><nbVueImages>3</nbVueImages></structure></livre>'
+
+
+def test_content_looks_pagination_up_once_per_document(gallica):
+  gallica.routes[PAGINATION_PATH] = (200, {}, PAGINATION)
+  for view in (1, 2, 3):
+    gallica.routes["/ark:/12148/bpt6k5738219s/f{}n{}.pdf".format(view, 4 - view)] = (200, {}, b"%PDF")
+  assert Resource(ARK).content_sync(startview=1).value == b"%PDF"
+  assert Resource(ARK + '/f2').content_sync(startview=2).value == b"%PDF"
+  assert Resource(ARK).content_sync(startview=3).value == b"%PDF"
+  assert gallica.requests.count(PAGINATION_PATH) == 1
+
+def test_iiif_data_looks_size_up_once_per_view(gallica):
+  for view in (1, 2):
+    info = '/iiif/ark:/12148/bpt6k5738219s/f{}/info.json'.format(view)
+    gallica.routes[info] = (200, {}, b'{"width": 20, "height": 10}')
+    gallica.routes['/iiif/ark:/12148/bpt6k5738219s/f{}/0,0,20,10/full/0/native.png'.format(view)] = (200, {}, b"png")
+  resource = Resource(ARK)
+  for _ in range(3):
+    assert resource.iiif_data_sync(view=1).value == b"png"
+    assert resource.iiif_data_sync(view=2).value == b"png"
+  assert len(gallica.requests) == 2 + 6
+  resource.invalidate_memo()
+  resource.iiif_data_sync(view=1)
+  assert len(gallica.requests) == 2 + 6 + 2
+
+def test_memo_is_bounded_and_ignores_failures():
+  memo = Memo(max_entries=2)
+  assert memo.get_or_compute(('a', 1), lambda: Left(ValueError())).is_left
+  assert not memo.get(('a', 1)).defined
+  for i in range(3):
+    memo.get_or_compute(('a', i), lambda: Right(i))
+  assert len(memo) == 2 and not memo.get(('a', 0)).defined
+
+def test_memo_computes_once_under_concurrency():
+  memo = Memo()
+  calls = []
+  barrier = threading.Barrier(8)
+  def compute():
+    calls.append(1)
+    return Right(42)
+  def worker():
+    barrier.wait()
+    assert memo.get_or_compute(('root', 'nviews'), compute).value == 42
+  threads = [threading.Thread(target=worker) for _ in range(8)]
+  for t in threads: t.start()
+  for t in threads: t.join()
+  assert len(calls) == 1
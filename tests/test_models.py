@@ -0,0 +1,79 @@
+import asyncio
+import datetime
+import json
+import pytest
+from gallipy import AsyncResource, Resource
+from gallipy.models import (Canvas, IssueEntry, Page, Pagination, parse_image_info, parse_issues,
+                            parse_manifest, parse_oairecord, parse_pagination)
+from gallipy.monadic import Left
+
+ARK = 'ark:/12148/bpt6k5738219s'
+PAGINATION = b'''<livre><structure><hasToc>true</hasToc><firstDisplayedPage>3</firstDisplayedPage>
+  <hasContent>false</hasContent><nbVueImages>2</nbVueImages></structure><pages>
+  <page><numero>[1]</numero><ordre>1</ordre><pagination_type>A</pagination_type>
+    <image_width>2400</image_width><image_height>3600</image_height></page>
+  <page><numero>2</numero><ordre>2</ordre><pagination_type>A</pagination_type></page>
+</pages></livre>'''
+OAIRECORD = b'''<results ResultsGenerated="1"><notice><record>
+  <header><identifier>oai:bnf.fr:gallica/ark:/12148/bpt6k5738219s</identifier>
+    <datestamp>2012-10-02</datestamp></header>
+  <metadata><oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/"
+      xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier>https://gallica.bnf.fr/ark:/12148/bpt6k5738219s</dc:identifier>
+    <dc:title>Atlas municipal</dc:title><dc:creator>Paris. Service du plan</dc:creator>
+    <dc:creator>Alphand, Adolphe</dc:creator><dc:date>1888</dc:date>
+    <dc:type xml:lang="fre">carte</dc:type>
+  </oai_dc:dc></metadata></record></notice>
+  <provenance>bnf.fr</provenance><typedoc>carte</typedoc></results>'''
+ISSUES = b'''<issues parentArk="cb32798952c/date" title="Le Temps" date="1936">
+  <issue ark="bpt6k1" dayOfYear="1">01 janvier 1936</issue>
+  <issue ark="bpt6k2" dayOfYear="60">29 f\xc3\xa9vrier 1936</issue></issues>'''
+INFO = {"@id": "https://gallica.bnf.fr/iiif/ark:/12148/bpt6k5738219s/f1", "width": 5000,
+        "height": 3000, "profile": ["http://iiif.io/api/image/2/level1.json"],
+        "tiles": [{"width": 1024, "scaleFactors": [1, 2, 4]}], "sizes": [{"width": 500, "height": 300}]}
+MANIFEST = {"@id": "m", "label": "Atlas", "sequences": [{"canvases": [
+  {"@id": "c1", "label": "NP", "width": 10, "height": 20, "images": [{"resource": {"@id": "i1"}}]},
+  {"@id": "c2", "label": "1"}]}]}
+
+
+def test_pagination():
+  pagination = parse_pagination(PAGINATION).value
+  assert pagination == Pagination(2, 3, True, False, (Page('[1]', 1, 'A', 2400, 3600),
+                                                      Page('2', 2, 'A', None, None)))
+  with pytest.raises(AttributeError):
+    pagination.nviews = 3
+  assert isinstance(parse_pagination(b"<livre>"), Left)
+
+def test_oairecord():
+  record = parse_oairecord(OAIRECORD).value
+  assert record.oai_identifier == "oai:bnf.fr:gallica/ark:/12148/bpt6k5738219s"
+  assert record.datestamp == datetime.date(2012, 10, 2)
+  assert record.creator == ("Paris. Service du plan", "Alphand, Adolphe")
+  assert (record.title, record.date, record.subject) == (("Atlas municipal",), ("1888",), ())
+  assert (record.typedoc, record.provenance) == ("carte", "bnf.fr")
+
+def test_issues():
+  issues = parse_issues(ISSUES).value
+  assert (issues.parent_ark, issues.title, issues.year, issues.years) == ("cb32798952c/date", "Le Temps", 1936, ())
+  assert issues.issues[1] == IssueEntry("bpt6k2", datetime.date(1936, 2, 29), "29 février 1936")
+  assert parse_issues(b"<issues><year>1936</year><year>1937</year></issues>").value.years == (1936, 1937)
+
+def test_iiif():
+  info = parse_image_info(json.dumps(INFO).encode()).value
+  assert (info.width, info.height, info.tile_width, info.tile_height) == (5000, 3000, 1024, 1024)
+  assert (info.scale_factors, info.sizes) == ((1, 2, 4), ((500, 300),))
+  assert info.profile == "http://iiif.io/api/image/2/level1.json"
+  manifest = parse_manifest(json.dumps(MANIFEST).encode()).value
+  assert manifest.canvases == (Canvas("c1", "NP", 10, 20, "i1"), Canvas("c2", "1", None, None, None))
+
+def test_typed_resource_methods(gallica):
+  gallica.routes["/services/Pagination?ark=bpt6k5738219s"] = (200, {}, PAGINATION)
+  gallica.routes["/iiif/ark:/12148/bpt6k5738219s/f1/info.json"] = (200, {}, json.dumps(INFO).encode())
+  gallica.routes["/iiif/ark:/12148/bpt6k5738219s/manifest.json"] = (200, {}, json.dumps(MANIFEST).encode())
+  resource = Resource(ARK)
+  assert resource.pagination_sync(typed=True).value.nviews == 2
+  assert resource.pagination_sync().value['livre']['structure']['nbVueImages'] == '2'
+  assert resource.pagination(typed=True).result(5).value.value.pages[0].width == 2400
+  assert resource.iiif_info_sync(1, typed=True).value.width == 5000
+  assert len(resource.iiif_info_sync('', typed=True).value.canvases) == 2
+  assert asyncio.run(AsyncResource(ARK).pagination(typed=True)).value.has_toc
@@ -0,0 +1,109 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from gallipy.monadic import Future, Left, Right
+
+
+@pytest.fixture
+def pool():
+  """A small shared executor, restored to the default afterwards."""
+  bounded = Future.configure(max_workers=2, max_pending=3)
+  yield bounded
+  Future.configure()
+
+def wait(future, timeout=5):
+  done = threading.Event()
+  results = []
+  future.subscribe(lambda value: (results.append(value), done.set()))
+  assert done.wait(timeout)
+  return results[0]
+
+def test_asyn_runs_on_bounded_pool(pool):
+  names = [wait(Future.asyn(lambda: threading.current_thread().name)).value for _ in range(5)]
+  assert all(name.startswith('gallipy') for name in names)
+
+def test_asyn_applies_backpressure(pool):
+  release = threading.Event()
+  futures = [Future.asyn(release.wait) for _ in range(3)]
+  started = time.monotonic()
+  timer = threading.Timer(0.2, release.set)
+  timer.start()
+  futures.append(Future.asyn(lambda: 1))  # Blocks until a slot is free
+  assert time.monotonic() - started >= 0.15
+  assert [wait(f).value for f in futures] == [True, True, True, 1]
+
+def test_user_supplied_executor():
+  with ThreadPoolExecutor(1, thread_name_prefix='mine') as executor:
+    Future.configure(executor=executor)
+    try:
+      assert wait(Future.asyn(lambda: threading.current_thread().name)).value.startswith('mine')
+    finally:
+      Future.configure()
+
+def test_callbacks_do_not_spawn_threads(pool):
+  future = Future.asyn(lambda: 42)
+  count = threading.active_count()
+  values = [wait(future.map(lambda x: x + i)) for i in range(50)]
+  assert [v.value for v in values] == [42 + i for i in range(50)]
+  assert threading.active_count() <= count + 2
+
+def test_exceptions_become_left(pool):
+  assert wait(Future.asyn(lambda: 1 / 0)).is_left
+
+def test_traverse_nested_asyn_does_not_deadlock(pool):
+  result = wait(Future.traverse(range(10))(lambda i: Future.asyn(lambda: i * 2)))
+  assert isinstance(result, Right)
+  assert result.value == [i * 2 for i in range(10)]
+
+def test_traverse_par_keeps_order_and_bounds_concurrency(pool):
+  lock = threading.Lock()
+  running, peak = [0], [0]
+  def work(i):
+    with lock:
+      running[0] += 1
+      peak[0] = max(peak[0], running[0])
+    time.sleep(0.02 * (5 - i % 5))
+    with lock:
+      running[0] -= 1
+    return i
+  result = Future.traverse_par(range(10), max_concurrency=2)(lambda i: Future.asyn(lambda: work(i))).result(5)
+  assert result.value == list(range(10))
+  assert peak[0] <= 2
+
+def test_traverse_par_is_concurrent(pool):
+  started = time.monotonic()
+  Future.traverse_par(range(2))(lambda i: Future.asyn(lambda: time.sleep(0.2))).result(5)
+  assert time.monotonic() - started < 0.35
+
+def test_traverse_par_fail_fast(pool):
+  calls = []
+  def f(i):
+    calls.append(i)
+    return Future.asyn(lambda: Left(ValueError(i)) if i == 1 else Right(i))
+  result = Future.traverse_par(range(10), max_concurrency=1)(f).result(5)
+  assert result.is_left and result.value.args == (1,)
+  assert calls == [0, 1]
+
+def test_traverse_par_collect(pool):
+  result = Future.traverse_par(range(4), fail_fast=False)(lambda i: Future.asyn(lambda: 1 / (i % 2))).result(5)
+  assert [r.is_left for r in result.value] == [True, False, True, False]
+
+def test_gather_and_as_completed(pool):
+  futures = [Future.asyn(lambda d=d: time.sleep(d) or d) for d in (0.2, 0.0, 0.1)]
+  assert [f.result().value for f in Future.as_completed(futures, timeout=5)] == [0.0, 0.1, 0.2]
+  assert Future.gather(futures).result(5).value == [0.2, 0.0, 0.1]
+  assert Future.gather([]).result(5).value == []
+
+def test_traverse_par_synchronous_futures_do_not_recurse():
+  result = Future.traverse_par(range(5000), max_concurrency=1)(Future.pure).result(5)
+  assert result.value == list(range(5000))
+
+def test_nested_results_beyond_max_workers_do_not_deadlock(pool):
+  def outer(depth):
+    if depth == 0:
+      return 1
+    inner = [Future.asyn(lambda: outer(depth - 1)) for _ in range(2)]
+    return sum(future.result(5).value for future in inner)
+  futures = [Future.asyn(lambda: outer(3)) for _ in range(3)]
+  assert [wait(future).value for future in futures] == [8, 8, 8]
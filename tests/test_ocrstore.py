@@ -0,0 +1,46 @@
+from gallipy.alto import parse_alto
+from gallipy.ocrstore import OcrStore
+
+ALTO = b'''<alto><Layout><Page WIDTH="100" HEIGHT="200">
+  <TextBlock ID="B"><TextLine ID="L1"><String CONTENT="%s" HPOS="1" VPOS="2" WIDTH="3" HEIGHT="4" WC="0.5"/>
+  <String CONTENT="deux" HPOS="5" VPOS="2" WIDTH="3" HEIGHT="4"/></TextLine>
+  <TextLine ID="L2"><String CONTENT="trois" HPOS="1" VPOS="9" WIDTH="3" HEIGHT="4"/></TextLine></TextBlock>
+</Page></Layout></alto>'''
+
+
+def page(first):
+  return parse_alto(ALTO % first.encode()).value
+
+
+def test_add_and_read_back(tmp_path):
+  with OcrStore(str(tmp_path)) as store:
+    assert store.add("ark:/12148/a", 1, page("un")) == 3
+    store.add("ark:/12148/a", 2, page("été"))
+    store.add("ark:/12148/b", 1, page("un"))
+    assert len(store) == 9 and store.views("ark:/12148/a") == {1, 2}
+    assert [p[:3] for p in store.pages()] == [("ark:/12148/a", 1, 0), ("ark:/12148/a", 2, 3), ("ark:/12148/b", 1, 6)]
+    read = store.page("ark:/12148/a", 2)
+    assert read.words == ["été", "deux", "trois"] and list(read.line) == [0, 0, 1]
+    assert read.box(1) == (5, 2, 3, 4) and (read.width, read.height) == (100, 200)
+    assert read.text() == "été deux\ntrois"
+    assert store.page("ark:/12148/a", 3) is None
+    assert list(store.column("hpos")) == [1, 5, 1] * 3
+
+def test_column_without_numpy(tmp_path, monkeypatch):
+  from gallipy import ocrstore
+  monkeypatch.setattr(ocrstore, "numpy", None)
+  with OcrStore(str(tmp_path)) as store:
+    store.add("ark:/12148/a", 1, page("un"))
+    assert list(store.column("line")) == [0, 0, 1]
+
+def test_uncommitted_rows_are_truncated(tmp_path):
+  with OcrStore(str(tmp_path)) as store:
+    store.add("ark:/12148/a", 1, page("un"))
+  # A crash after the columns of a page were written, before it was indexed
+  for name in ("hpos.bin", "words.txt"):
+    with open(str(tmp_path / name), "ab") as ostream:
+      ostream.write(b"garbage!")
+  with OcrStore(str(tmp_path)) as store:
+    store.add("ark:/12148/a", 2, page("deux"))
+    assert store.page("ark:/12148/a", 2).words == ["deux", "deux", "trois"]
+    assert list(store.column("hpos")) == [1, 5, 1] * 2
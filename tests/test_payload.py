@@ -0,0 +1,52 @@
+import hashlib
+import io
+import pytest
+from gallipy import Resource
+from gallipy.helpers import fetch_payload
+from gallipy.monadic import Left
+from gallipy.payload import Payload
+from gallipy.transport import Transport
+
+DATA = bytes(range(256)) * 1000
+
+
+def test_small_payloads_stay_in_memory():
+  with Payload.from_stream(io.BytesIO(DATA), spill_threshold=len(DATA)) as payload:
+    assert not payload.spilled
+    assert len(payload) == len(DATA) and payload.view[1000:1004] == DATA[1000:1004]
+    assert payload.view.readonly
+
+def test_large_payloads_are_memory_mapped():
+  payload = Payload.from_stream(io.BytesIO(DATA), spill_threshold=1000, chunk_size=300)
+  assert payload.spilled
+  assert payload.tobytes() == DATA
+  assert payload.digest() == hashlib.sha256(DATA).hexdigest()
+  payload.close()
+  with pytest.raises(ValueError):
+    payload.view
+
+def test_open_reads_and_seeks():
+  payload = Payload.from_bytes(DATA)
+  reader = payload.open()
+  assert reader.read(3) == DATA[:3]
+  reader.seek(-2, io.SEEK_END)
+  assert reader.read() == DATA[-2:]
+  reader.seek(10)
+  assert reader.read(5) == DATA[10:15]
+
+def test_fetch_payload(server):
+  server.routes["/big"] = (200, {}, DATA)
+  with Transport() as transport:
+    with fetch_payload(server.url + "/big", transport, spill_threshold=1024).value as payload:
+      assert payload.spilled and payload.view == DATA
+    assert isinstance(fetch_payload(server.url + "/missing", transport), Left)
+
+def test_resource_binary_methods_return_payloads(gallica):
+  gallica.routes["/ark:/12148/bpt6k5738219s/f1n2.pdf"] = (200, {}, b"%PDF")
+  gallica.routes["/ark:/12148/bpt6k5738219s/f3.thumbnail"] = (200, {}, b"jpeg")
+  gallica.routes["/RequestDigitalElement?O=bpt6k5738219s&E=ALTO&Deb=4"] = (200, {}, b"<alto/>")
+  resource = Resource('ark:/12148/bpt6k5738219s')
+  assert resource.content_sync(nviews=2, payload=True).value.view == b"%PDF"
+  assert resource.image_preview_sync(view=3, payload=True).value.tobytes() == b"jpeg"
+  assert resource.ocr_data(4, payload=True).result(5).value.value.view == b"<alto/>"
+  assert resource.content_sync(nviews=2).value == b"%PDF"
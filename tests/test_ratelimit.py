@@ -0,0 +1,69 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+import pytest
+from gallipy import ratelimit
+from gallipy.ratelimit import RateLimiter, service_of
+from gallipy.transport import Transport
+
+SERVICES = "https://gallica.bnf.fr/services/Pagination?ark=bpt6k5738219s"
+IIIF = "https://gallica.bnf.fr/iiif/ark:/12148/bpt6k5738219s/f1/info.json"
+CONTENT = "https://gallica.bnf.fr/ark:/12148/bpt6k5738219s/f1n10.pdf"
+
+
+def test_service_of():
+  assert [service_of(url) for url in (SERVICES, IIIF, CONTENT)] == ["services", "iiif", "content"]
+
+def test_burst_then_rate():
+  limiter = RateLimiter({"services": (10, 3)})
+  delays = [limiter.reserve(SERVICES) for _ in range(5)]
+  assert delays[:3] == [0, 0, 0]
+  assert 0.09 < delays[3] <= 0.1 and 0.19 < delays[4] <= 0.2
+
+def test_services_have_separate_budgets():
+  limiter = RateLimiter({"services": (1, 1), "iiif": (1, 1), "content": None})
+  assert limiter.reserve(SERVICES) == 0 and limiter.reserve(IIIF) == 0
+  assert limiter.reserve(SERVICES) > 0.9
+  assert all(limiter.reserve(CONTENT) == 0 for _ in range(100))
+
+def test_global_budget():
+  limiter = RateLimiter({"*": (1, 2)})
+  assert limiter.reserve(SERVICES) == 0 and limiter.reserve(IIIF) == 0
+  assert limiter.reserve(CONTENT) > 0.9
+
+@pytest.mark.skipif(ratelimit.fcntl is None, reason="requires fcntl")
+def test_shared_limiter_reserves_off_the_loop(tmp_path):
+  limiter = RateLimiter({"*": (100, 1)}, path=str(tmp_path / "gallica.rate"))
+  threads = []
+  reserve = limiter.reserve
+  def spy(url):
+    threads.append(threading.current_thread())
+    return reserve(url)
+  limiter.reserve = spy
+  asyncio.run(limiter.wait_async(SERVICES))
+  assert threads and threads[0] is not threading.main_thread()
+
+def _reserve(path, queue):
+  limiter = RateLimiter({"services": (1, 2)}, path=path)
+  queue.put([limiter.reserve(SERVICES) for _ in range(2)])
+
+@pytest.mark.skipif(ratelimit.fcntl is None, reason="requires fcntl")
+def test_buckets_are_shared_across_processes(tmp_path):
+  path = str(tmp_path / "gallica.rate")
+  queue = multiprocessing.Queue()
+  workers = [multiprocessing.Process(target=_reserve, args=(path, queue)) for _ in range(2)]
+  for worker in workers:
+    worker.start()
+  delays = sorted(queue.get(timeout=10) + queue.get(timeout=10))
+  for worker in workers:
+    worker.join()
+  assert delays[:2] == [0, 0] and delays[2] > 0.5 and delays[3] > 1.5
+
+def test_transport_waits_for_the_limiter(server):
+  server.routes["/services/Pagination"] = (200, {}, b"ok")
+  with Transport(rate_limiter=RateLimiter({"services": (20, 1)})) as transport:
+    began = time.monotonic()
+    for _ in range(5):
+      transport.get(server.url + "/services/Pagination")
+  assert time.monotonic() - began >= 0.19
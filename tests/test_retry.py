@@ -0,0 +1,87 @@
+import asyncio
+import email.message
+import email.utils
+import socket
+import time
+import urllib.error
+import pytest
+from gallipy.retry import RetryPolicy
+from gallipy.transport import AsyncTransport, Transport
+
+FAST = RetryPolicy(base_delay=0.01, max_delay=0.05)
+
+
+def http_error(code, retry_after=None):
+  headers = email.message.Message()
+  if retry_after is not None:
+    headers["Retry-After"] = retry_after
+  return urllib.error.HTTPError("http://x", code, "", headers, None)
+
+def flaky(statuses, body=b"ok"):
+  """A route answering each status of statuses in turn, then 200."""
+  statuses = list(statuses)
+  return lambda request: (statuses.pop(0), {}, b"busy") if statuses else (200, {}, body)
+
+
+def test_transient_and_permanent_errors():
+  policy = RetryPolicy()
+  for error in (http_error(503), http_error(429), http_error(500), socket.timeout(),
+                ConnectionResetError(), urllib.error.URLError(ConnectionRefusedError())):
+    assert policy.is_retryable(error)
+  for error in (http_error(404), http_error(400), ValueError("not XML"),
+                urllib.error.URLError("unknown url type")):
+    assert not policy.is_retryable(error)
+
+def test_delays_grow_exponentially_up_to_max_delay():
+  policy = RetryPolicy(max_attempts=10, base_delay=1, max_delay=5, jitter=False)
+  assert [policy.delay(n, http_error(503)) for n in range(1, 6)] == [1, 2, 4, 5, 5]
+  assert policy.delay(10, http_error(503)) is None
+  assert policy.delay(1, http_error(404)) is None
+  jittered = RetryPolicy(base_delay=1)
+  assert all(0 <= jittered.backoff(3) <= 4 for _ in range(100))
+
+def test_retry_after_overrides_backoff():
+  policy = RetryPolicy(jitter=False)
+  assert policy.delay(1, http_error(429, "7")) == 7
+  date = email.utils.formatdate(time.time() + 60, usegmt=True)
+  assert 55 < policy.delay(1, http_error(503, date)) <= 60
+
+def test_budget_bounds_the_call():
+  calls = []
+  def fail():
+    calls.append(1)
+    raise http_error(503, "10")
+  with pytest.raises(urllib.error.HTTPError):
+    RetryPolicy(budget=1).call(fail)
+  assert len(calls) == 1
+
+def test_transport_retries_transient_statuses(server):
+  server.routes["/a"] = flaky([503, 429])
+  with Transport(retry=FAST) as transport:
+    assert transport.get(server.url + "/a") == b"ok"
+    server.routes["/b"] = flaky([502])
+    with transport.open(server.url + "/b") as res:
+      assert res.read() == b"ok"
+  assert server.requests == ["/a"] * 3 + ["/b"] * 2
+
+def test_transport_does_not_retry_permanent_errors(server):
+  with Transport(retry=FAST) as transport:
+    with pytest.raises(urllib.error.HTTPError):
+      transport.get(server.url + "/missing")
+  assert server.requests == ["/missing"]
+
+def test_transport_gives_up_after_max_attempts(server):
+  server.routes["/a"] = flaky([503] * 10)
+  with Transport(retry=RetryPolicy(max_attempts=3, base_delay=0.01)) as transport:
+    with pytest.raises(urllib.error.HTTPError) as info:
+      transport.get(server.url + "/a")
+  assert info.value.code == 503
+  assert len(server.requests) == 3
+
+def test_async_transport_retries_transient_statuses(server):
+  server.routes["/a"] = flaky([503, 503])
+  async def main():
+    async with AsyncTransport(retry=FAST) as transport:
+      return await transport.get(server.url + "/a")
+  assert asyncio.run(main()) == b"ok"
+  assert len(server.requests) == 3
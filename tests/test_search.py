@@ -0,0 +1,69 @@
+import asyncio
+import time
+import pytest
+from gallipy import AsyncResource, Resource
+
+ARK = 'ark:/12148/bpt6k5738219s'
+SEARCH_PATH = "/services/ContentSearch?ark=bpt6k5738219s&query=paris&startResult={}"
+
+
+def serve_results(gallica, count, delay=0, counted=True):
+  """Result sets of 10 hits numbered from 1 to count, each served after delay seconds."""
+  def result_set(start):
+    def route(request):
+      time.sleep(delay)
+      items = "".join("<item><page>{0}</page><content>hit {0}</content></item>".format(i)
+                      for i in range(start, min(start + 10, count + 1)))
+      attrs = ' countResults="{}"'.format(count) if counted else ""
+      return 200, {}, '<results{}>{}</results>'.format(attrs, items).encode()
+    return route
+  for start in range(1, count + 11, 10):
+    gallica.routes[SEARCH_PATH.format(start)] = result_set(start)
+
+def searched(gallica):
+  return [path for path in gallica.requests if "ContentSearch" in path]
+
+
+def test_iterates_over_every_set(gallica):
+  serve_results(gallica, 25)
+  hits = list(Resource(ARK).fulltext_search_iter("paris"))
+  assert [hit["page"] for hit in hits] == [str(i) for i in range(1, 26)]
+  assert len(searched(gallica)) == 3
+
+def test_sets_are_prefetched(gallica):
+  serve_results(gallica, 50, delay=0.2)
+  started = time.perf_counter()
+  assert len(list(Resource(ARK).fulltext_search_iter("paris", prefetch=4))) == 50
+  assert time.perf_counter() - started < 0.7  # Instead of 5 x 0.2s one after the other
+
+def test_without_count_stops_at_the_first_empty_set(gallica):
+  serve_results(gallica, 12, counted=False)
+  hits = list(Resource(ARK).fulltext_search_iter("paris", prefetch=1))
+  assert len(hits) == 12 and len(searched(gallica)) == 3
+
+def test_stops_fetching_when_the_caller_stops(gallica):
+  serve_results(gallica, 200)
+  hits = Resource(ARK).fulltext_search_iter("paris", prefetch=2)
+  assert next(hits)["page"] == "1"
+  hits.close()
+  time.sleep(0.1)
+  assert len(searched(gallica)) == 3
+
+def test_failed_set_raises(gallica):
+  serve_results(gallica, 25)
+  del gallica.routes[SEARCH_PATH.format(21)]
+  with pytest.raises(Exception):
+    list(Resource(ARK).fulltext_search_iter("paris"))
+
+def test_async_iterator(gallica):
+  serve_results(gallica, 35, delay=0.1)
+  async def main():
+    hits = [hit async for hit in AsyncResource(ARK).fulltext_search_iter("paris")]
+    first = []
+    async for hit in AsyncResource(ARK).fulltext_search_iter("paris", prefetch=1):
+      first.append(hit)
+      break
+    return hits, first
+  hits, first = asyncio.run(main())
+  assert [hit["content"] for hit in hits][-1] == "hit 35" and len(hits) == 35
+  assert len(first) == 1
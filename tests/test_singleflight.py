@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+from gallipy import AsyncResource, Resource
+from gallipy.cache import Cache, SingleFlight, default_single_flight
+from gallipy.helpers import fetch
+from gallipy.monadic import Left, Right
+from gallipy.transport import default_transport
+
+PAGINATION_PATH = "/services/Pagination?ark=bpt6k5738219s"
+PAGINATION = b'<livre><structure><nbVueImages>3</nbVueImages></structure></livre>'
+
+
+def slow(response, delay=0.2):
+  def route(request):
+    time.sleep(delay)
+    return response
+  return route
+
+def in_threads(n, f):
+  results = [None] * n
+  def run(i):
+    results[i] = f()
+  threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return results
+
+
+def test_concurrent_calls_run_once():
+  flights, calls, release = SingleFlight(), [], threading.Event()
+  def compute():
+    calls.append(1)
+    release.wait(5)
+    return Right(len(calls))
+  threading.Timer(0.2, release.set).start()
+  results = in_threads(8, lambda: flights.do("key", compute))
+  assert len(calls) == 1 and flights.coalesced == 7
+  assert all(result is results[0] for result in results)
+  assert flights.do("key", compute).value == 2  # Nothing is cached
+
+def test_exceptions_become_left():
+  result = SingleFlight().do("key", lambda: 1 / 0)
+  assert isinstance(result, Left) and isinstance(result.value, ZeroDivisionError)
+
+def test_resources_share_in_flight_requests(gallica):
+  gallica.routes[PAGINATION_PATH] = slow((200, {}, PAGINATION))
+  before = default_single_flight().coalesced
+  results = in_threads(5, lambda: Resource('ark:/12148/bpt6k5738219s').pagination_sync())
+  assert gallica.requests == [PAGINATION_PATH]
+  assert default_single_flight().coalesced - before == 4
+  assert all(r.value['livre']['structure']['nbVueImages'] == '3' for r in results)
+
+def test_failures_are_shared(server):
+  server.routes["/busy"] = slow((404, {}, b"missing"))
+  results = in_threads(3, lambda: fetch(server.url + "/busy"))
+  assert all(isinstance(result, Left) for result in results)
+  assert server.requests == ["/busy"]
+
+def test_async_requests_are_coalesced(gallica):
+  gallica.routes[PAGINATION_PATH] = slow((200, {}, PAGINATION))
+  async def main():
+    resource = AsyncResource('ark:/12148/bpt6k5738219s')
+    return await asyncio.gather(*(resource.pagination() for _ in range(5)))
+  results = asyncio.run(main())
+  assert gallica.requests == [PAGINATION_PATH]
+  assert all(r.value['livre']['structure']['nbVueImages'] == '3' for r in results)
+
+def test_offline_cache_does_not_join_a_network_fetch(gallica, tmp_path):
+  gallica.routes[PAGINATION_PATH] = slow((200, {}, PAGINATION), delay=0.5)
+  online = threading.Thread(target=lambda: Resource('ark:/12148/bpt6k5738219s').pagination_sync())
+  online.start()
+  time.sleep(0.1)
+  before = default_single_flight().coalesced
+  with Cache(str(tmp_path / "cache.db"), offline=True) as cache:
+    result = Resource('ark:/12148/bpt6k5738219s', cache=cache).pagination_sync()
+  online.join()
+  assert isinstance(result, Left)
+  assert default_single_flight().coalesced == before
+
+def test_default_transport_given_or_not_is_coalesced(server):
+  server.routes["/shared"] = slow((200, {}, b"shared"))
+  transports = [None, default_transport()] * 2
+  results = in_threads(4, lambda: fetch(server.url + "/shared", transport=transports.pop()))
+  assert all(result.value == b"shared" for result in results)
+  assert server.requests == ["/shared"]
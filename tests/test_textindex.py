@@ -0,0 +1,61 @@
+import pytest
+from gallipy.alto import parse_alto
+from gallipy.monadic import Left
+from gallipy.ocrstore import OcrStore
+from gallipy.textindex import Hit, TextIndex, tokenize
+
+ALTO = '''<alto><Page><TextLine>
+  <String CONTENT="Le" HPOS="0" VPOS="0" WIDTH="10" HEIGHT="5"/>
+  <String CONTENT="Candidat" HPOS="20" VPOS="0" WIDTH="40" HEIGHT="5"/>
+  <String CONTENT="à" HPOS="70" VPOS="0" WIDTH="5" HEIGHT="5"/>
+  <String CONTENT="la" HPOS="80" VPOS="0" WIDTH="10" HEIGHT="5"/>
+  <String CONTENT="présidence," HPOS="100" VPOS="0" WIDTH="50" HEIGHT="5"/>
+</TextLine></Page></alto>'''.encode()
+
+
+@pytest.fixture
+def index(tmp_path):
+  with TextIndex(str(tmp_path / "index.sqlite")) as index:
+    yield index
+
+
+def test_tokenize():
+  assert tokenize("L'Élysée, 1848 : Présidence!") == ["l", "elysee", "1848", "presidence"]
+
+def test_phrase_with_boxes(index):
+  assert index.add_page("ark:/12148/a", 3, parse_alto(ALTO).value) == 5
+  hits = index.search('"candidat a la presidence"').value
+  assert hits == [Hit("ark:/12148/a", 3, 1, [(20, 0, 40, 5), (70, 0, 5, 5), (80, 0, 10, 5), (100, 0, 50, 5)])]
+  assert index.search('"la candidat"').value == []
+
+def test_words_and_phrases_in_texts(index):
+  index.add_text("ark:/12148/b", b"<html><body><p>Le candidat &agrave; la pr\xc3\xa9sidence.</p>"
+                 b"<p>La pr\xc3\xa9sidence du candidat</p></body></html>")
+  index.add_text("ark:/12148/c", "présidence", view=2)
+  hits = index.search('"à la présidence", candidat').value
+  assert [(hit.ark, hit.view, hit.position, hit.boxes) for hit in hits] == [
+    ("ark:/12148/b", None, 1, None), ("ark:/12148/b", None, 2, None), ("ark:/12148/b", None, 8, None)]
+  assert [hit.ark for hit in index.search("presidence").value] == ["ark:/12148/b"] * 2 + ["ark:/12148/c"]
+  assert [hit.ark for hit in index.search("presidence", ark="ark:/12148/c").value] == ["ark:/12148/c"]
+  assert len(index.search("presidence", limit=1).value) == 1
+  assert isinstance(index.search('" , "'), Left)
+
+def test_scripts_and_styles_are_not_indexed(index):
+  text = ('<html><head><style type="text/css">p { color: candidat }</style>'
+          '<SCRIPT>var candidat = "<b>x</b>";</SCRIPT><!-- candidat --></head>'
+          '<body><p>Le candidat</p><script src="a.js"></script></body></html>')
+  assert index.add_text("ark:/12148/b", text) == 2
+  assert [hit.position for hit in index.search("candidat").value] == [1]
+  assert index.search("var").value == [] and index.search("color").value == []
+
+def test_incremental_updates(index, tmp_path):
+  with OcrStore(str(tmp_path / "ocr")) as store:
+    store.add("ark:/12148/a", 1, parse_alto(ALTO).value)
+    store.add("ark:/12148/a", 2, parse_alto(ALTO.replace(b"Candidat", b"Maire")).value)
+    assert index.add_store(store) == 2
+    assert index.add_store(store) == 0
+  assert [hit.view for hit in index.search("candidat").value] == [1]
+  index.add_text("ark:/12148/a", "rien", view=1)
+  assert index.search("candidat").value == [] and index.views("ark:/12148/a") == {1, 2}
+  index.remove("ark:/12148/a")
+  assert index.search("maire").value == [] and index.views("ark:/12148/a") == set()
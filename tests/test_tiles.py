@@ -0,0 +1,84 @@
+import io
+import json
+import pytest
+from gallipy import Resource
+from gallipy.tiles import tile_grid
+
+numpy = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+ARK = 'ark:/12148/bpt6k5738219s'
+INFO_PATH = '/iiif/ark:/12148/bpt6k5738219s/f1/info.json'
+INFO = {"width": 250, "height": 120, "tiles": [{"width": 100, "scaleFactors": [1, 2, 4]}]}
+
+
+def png(image):
+  buffer = io.BytesIO()
+  image.save(buffer, "PNG")
+  return buffer.getvalue()
+
+def serve_tiles(gallica, source, scale_factor, fail_once=()):
+  """Routes the tiles of source, the tiles of fail_once answering 503 the first time."""
+  gallica.routes[INFO_PATH] = (200, {}, json.dumps(INFO).encode())
+  width, height, tiles = tile_grid(INFO, scale_factor)
+  for tile in tiles:
+    size = 'full' if scale_factor == 1 else '{},'.format(tile.out_width)
+    path = '/iiif/ark:/12148/bpt6k5738219s/f1/{},{},{},{}/{}/0/native.png'.format(
+      tile.x, tile.y, tile.width, tile.height, size)
+    crop = source.crop((tile.x, tile.y, tile.x + tile.width, tile.y + tile.height))
+    crop = crop.resize((tile.out_width, tile.out_height))
+    if (tile.x, tile.y) in fail_once:
+      failures = [1]
+      gallica.routes[path] = lambda request, body=png(crop), failures=failures: (
+        (503, {}, b"busy") if failures and failures.pop() else (200, {}, body))
+    else:
+      gallica.routes[path] = (200, {}, png(crop))
+  return tiles
+
+
+def test_tile_grid():
+  width, height, tiles = tile_grid(INFO)
+  assert (width, height, len(tiles)) == (250, 120, 6)
+  assert tiles[2][:4] == (200, 0, 50, 100) and tiles[5][:4] == (200, 100, 50, 20)
+  width, height, tiles = tile_grid(INFO, 2)
+  assert (width, height, len(tiles)) == (125, 60, 2)
+  assert tiles[1] == (200, 0, 50, 120, 25, 60)
+  with pytest.raises(ValueError):
+    tile_grid(INFO, 3)
+  assert len(tile_grid({"width": 3000, "height": 10})[2]) == 3
+
+def test_tiles_are_stitched_into_an_array(gallica, tmp_path):
+  source = Image.fromarray(numpy.random.RandomState(0).randint(0, 255, (120, 250, 3), numpy.uint8))
+  tiles = serve_tiles(gallica, source, 1, fail_once=[(100, 100)])
+  dest = str(tmp_path / "map.npy")
+  either = Resource(ARK).iiif_tiled_sync(dest, imformat='png')
+  assert either.value == dest
+  assert numpy.array_equal(numpy.load(dest, mmap_mode='r'), numpy.asarray(source))
+  assert len(gallica.requests) == 1 + len(tiles) + 1  # The failed tile only is retried
+  assert sorted(p.name for p in tmp_path.iterdir()) == ["map.npy"]
+
+def test_downscaled_tiles_are_saved_as_an_image(gallica, tmp_path):
+  source = Image.new("RGB", (250, 120), (10, 200, 30))
+  serve_tiles(gallica, source, 2)
+  dest = str(tmp_path / "map.png")
+  assert Resource(ARK).iiif_tiled(dest, scale_factor=2, imformat='png').result(10).value.value == dest
+  with Image.open(dest) as image:
+    assert image.size == (125, 60) and image.getpixel((120, 55)) == (10, 200, 30)
+
+def test_failed_tiles_are_reported(gallica, tmp_path):
+  gallica.routes[INFO_PATH] = (200, {}, json.dumps(INFO).encode())
+  either = Resource(ARK).iiif_tiled_sync(str(tmp_path / "map.npy"), scale_factor=4)
+  assert either.is_left and "1 of 1 tiles" in str(either.value)
+  assert list(tmp_path.iterdir()) == []
+
+@pytest.mark.parametrize("mode,strip_size", [("RGB", 1000), ("L", 2**20)])
+def test_tiles_are_copied_strip_by_strip_into_a_tiff(gallica, tmp_path, monkeypatch, mode, strip_size):
+  from gallipy import tiles
+  monkeypatch.setattr(tiles, "_STRIP_SIZE", strip_size)
+  source = Image.fromarray(numpy.random.RandomState(1).randint(0, 255, (120, 250, 3), numpy.uint8))
+  serve_tiles(gallica, source, 1)
+  dest = str(tmp_path / "map.tif")
+  assert tiles.fetch_tiled(Resource(ARK), dest, imformat='png', mode=mode).value == dest
+  with Image.open(dest) as image:
+    assert numpy.array_equal(numpy.asarray(image), numpy.asarray(source.convert(mode)))
+  assert sorted(p.name for p in tmp_path.iterdir()) == ["map.tif"]
@@ -0,0 +1,60 @@
+import socket
+import time
+import urllib.error
+import pytest
+from gallipy import Resource
+from gallipy.helpers import fetch, fetch_json
+from gallipy.monadic import Left
+from gallipy.retry import RetryPolicy
+from gallipy.transport import AsyncTransport, Transport
+
+
+def test_connections_are_reused(server):
+  """Sequential requests share one keep-alive connection."""
+  server.routes["/a"] = (200, {}, b"hello")
+  with Transport() as transport:
+    for _ in range(5):
+      assert transport.get(server.url + "/a") == b"hello"
+  assert server.connections == 1
+
+def test_error_status_raises(server):
+  with Transport() as transport:
+    with pytest.raises(urllib.error.HTTPError) as info:
+      transport.get(server.url + "/missing")
+  assert info.value.code == 404
+
+def test_redirects_are_followed(server):
+  server.routes["/old"] = (302, {"Location": "/new"}, b"")
+  server.routes["/new"] = (200, {}, b"moved")
+  with Transport() as transport:
+    assert transport.get(server.url + "/old") == b"moved"
+
+def test_pool_size_bounds_idle_connections(server):
+  server.routes["/a"] = (200, {}, b"hello")
+  with Transport(pool_size=1) as transport:
+    with transport.open(server.url + "/a") as first, transport.open(server.url + "/a") as second:
+      first.read()
+      second.read()
+    assert sum(len(idle) for idle in transport._pools.values()) == 1
+
+def test_fetch_uses_transport(server):
+  server.routes["/json"] = (200, {}, b'{"width": 10}')
+  with Transport() as transport:
+    assert fetch_json(server.url + "/json", transport).value == {"width": 10}
+    assert isinstance(fetch(server.url + "/missing", transport), Left)
+
+def test_resource_accepts_transport():
+  transport = Transport()
+  assert Resource("ark:/12148/bpt6k5619759j", transport=transport).transport is transport
+
+def test_timeout_is_opt_in(server):
+  def slow(request):
+    time.sleep(0.3)
+    return 200, {}, b"late"
+  server.routes["/slow"] = slow
+  assert Transport().timeout is None and AsyncTransport().timeout is None
+  with Transport() as transport:
+    assert transport.get(server.url + "/slow") == b"late"
+  with Transport(timeout=0.1, retry=RetryPolicy(max_attempts=1)) as transport:
+    with pytest.raises(socket.timeout):
+      transport.get(server.url + "/slow")